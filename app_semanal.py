@@ -7,9 +7,11 @@ Interfaz Streamlit para el optimizador de producción con soporte para múltiple
 
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import numpy as np
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from plotly.colors import qualitative
+from datetime import datetime, timedelta, time as dt_time
+from collections import Counter
 import json
 import io
 import base64
@@ -35,10 +37,20 @@ from utils.visualizacion_historico import (
 import modelos.database as database
 from modelos.database_models import EstadoProgramacion
 
+# Días de la semana (inmutable, se construye una sola vez al importar)
+_DIAS_SEMANA = ('Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo')
+# Abreviatura de 3 letras → índice del día (Lun -> 0, Mar -> 1, ...)
+_DIA_PREFIX_IDX = {dia[:3]: i for i, dia in enumerate(_DIAS_SEMANA)}
+# Campos de cada ejecución que usa la Comparativa Planificado vs Real
+_CAMPOS_COMPARATIVA = (
+    'tarea_nombre', 'dia_nombre', 'dia_semana', 'inicio_hora', 'fin_hora',
+    'inicio_real', 'fin_real', 'duracion_planificada', 'duracion_real',
+    'desviacion_duracion', 'tiempo_paradas', 'operador_ejecutor',
+)
+
 # Funciones auxiliares
 def minutos_a_hora_dia(minutos_acumulativos, minutos_por_dia_laboral=None):
     """Convierte minutos acumulativos a hora del día"""
-    from datetime import time as dt_time, datetime
     
     if minutos_acumulativos is not None:
         try:
@@ -112,7 +124,6 @@ def minutos_a_hora_dia(minutos_acumulativos, minutos_por_dia_laboral=None):
 # Función para procesar datos del resultado de optimización para PDF
 def obtener_datos_programacion_detallada(resultado):
     """Procesar datos del resultado de optimización para generar datos formateados para PDF"""
-    from datetime import time as dt_time
     
     if not resultado or not resultado.get('solucion') or not resultado['solucion'].get('programacion'):
         return []
@@ -242,7 +253,6 @@ def procesar_tareas_desde_bd(tareas_raw, configuracion=None):
                 dia_nombre = dia_nombre[:3]
             
             # Convertir de string HH:MM a time
-            from datetime import time as dt_time
             try:
                 h_inicio, m_inicio = map(int, inicio_hora_str.split(':'))
                 inicio_real = dt_time(h_inicio, m_inicio)
@@ -272,7 +282,6 @@ def procesar_tareas_desde_bd(tareas_raw, configuracion=None):
             
             # CASO ESPECIAL: Si fin_min es exactamente el inicio del día siguiente,
             # significa que la tarea termina al final del día actual (18:00)
-            from datetime import time as dt_time
             if fin_min > 0 and fin_min % minutos_por_dia == 0:
                 fin_real = dt_time(18, 0)  # 18:00 del día actual
             else:
@@ -482,6 +491,14 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+@st.cache_resource(show_spinner=False)
+def _calentar_kernels_kpi():
+    """Compilar una sola vez por servidor los kernels JIT de KPIs (no-op sin numba)"""
+    from utils.kpi_kernels import calentar_kernels
+    calentar_kernels()
+
+_calentar_kernels_kpi()
+
 # Inicialización BD
 # Inicializar base de datos al cargar la aplicación
 if 'bd_inicializada' not in st.session_state:
@@ -531,7 +548,19 @@ def convertir_trabajos_a_dataframe(trabajos):
             tarea_con_trabajo["trabajo"] = trabajo_nombre
             todas_las_tareas.append(tarea_con_trabajo)
     
-    return pd.DataFrame(todas_las_tareas)
+    df = pd.DataFrame(todas_las_tareas)
+    if not df.empty:
+        # Tipos compactos: las duraciones (minutos) caben en int32 y máquina/trabajo
+        # tienen pocos valores distintos, así los groupby trabajan sobre códigos.
+        # Solo se convierte si todas son enteras: con faltantes (NaN) o minutos
+        # fraccionarios se conserva la columna tal cual
+        duracion = df['duracion']
+        if (pd.api.types.is_numeric_dtype(duracion) and duracion.notna().all()
+                and (duracion % 1 == 0).all()):
+            df['duracion'] = duracion.astype('int32')
+        df['maquina'] = df['maquina'].astype('category')
+        df['trabajo'] = df['trabajo'].astype('category')
+    return df
 
 def crear_datos_ejemplo(num_maquinas=3):
     """Crear datos de ejemplo para compatibilidad con versión original"""
@@ -798,7 +827,7 @@ def mostrar_gantt_por_maquina(tareas_df, resultado, horas_efectivas=10):
         maquinas[maquina].append(row)
     
     # Colores por trabajo
-    colores_trabajo = px.colors.qualitative.Set3
+    colores_trabajo = qualitative.Set3
     trabajos_unicos = list(set([item['Trabajo'] for item in gantt_data]))
     color_map = {trabajo: colores_trabajo[i % len(colores_trabajo)] for i, trabajo in enumerate(trabajos_unicos)}
     
@@ -915,7 +944,7 @@ def mostrar_diagrama_gantt(tareas_df, resultado, key_suffix="", horas_efectivas=
     fig = go.Figure()
     
     # Colores por trabajo
-    colores_trabajo = px.colors.qualitative.Set3
+    colores_trabajo = qualitative.Set3
     trabajos_unicos = list(set([item['Trabajo'] for item in gantt_data]))
     color_map = {trabajo: colores_trabajo[i % len(colores_trabajo)] for i, trabajo in enumerate(trabajos_unicos)}
     
@@ -1099,6 +1128,474 @@ def cargar_configuracion_default():
         }
     }
 
+# Lecturas de BD del Dashboard cacheadas por prog_id: los reruns provocados por otros
+# widgets no vuelven a consultar la BD (las métricas de una semana completada no cambian)
+def _reshape_metricas(metricas_bd):
+    """Convertir métricas de BD al formato esperado para la UI"""
+    return {
+        'fecha_calculo': metricas_bd.get('fecha_calculo'),
+        'oee_global': metricas_bd.get('oee_global', 0.0),
+        'disponibilidad_oee': metricas_bd.get('disponibilidad_oee', 0.0),
+        'rendimiento_oee': metricas_bd.get('rendimiento_oee', 0.0),
+        'calidad_oee': metricas_bd.get('calidad_oee', 0.0),
+        'throughput_semanal': metricas_bd.get('throughput_semanal', 0),
+        'otif_porcentaje': metricas_bd.get('otif_porcentaje', 0.0),
+        'tareas_a_tiempo': metricas_bd.get('tareas_a_tiempo', 0),
+        'tareas_retrasadas': metricas_bd.get('tareas_retrasadas', 0),
+        'tareas_adelantadas': metricas_bd.get('tareas_adelantadas', 0),
+        'desviacion_promedio': metricas_bd.get('desviacion_promedio', 0.0),
+        'desviacion_maxima': metricas_bd.get('desviacion_maxima', 0.0),
+        'lead_time_promedio': metricas_bd.get('lead_time_promedio', 0.0),  # Utilización global promedio ponderada
+        'cuello_botella': metricas_bd.get('cuello_botella_identificado'),
+        # Reconstruir utilizacion_maquinas desde BD (num_tareas se completa con las ejecuciones)
+        'utilizacion_maquinas': {
+            maq: {
+                'utilizacion_total': metricas_bd.get(f'utilizacion_{sufijo}', 0.0),
+                'tiempo_productivo': metricas_bd.get(f'tiempo_productivo_{sufijo}', 0),
+                'tiempo_ocioso': metricas_bd.get(f'tiempo_ocioso_{sufijo}', 0),
+                'tiempo_setup': metricas_bd.get(f'tiempo_setup_{sufijo}', 0),
+            }
+            for maq, sufijo in (('M1', 'm1'), ('M2', 'm2'), ('M3', 'm3'))
+        }
+    }
+
+@st.cache_data(show_spinner=False, ttl=300)
+def _load_metricas(prog_id):
+    """Obtener métricas guardadas de una programación, ya en formato UI (cacheado)"""
+    metricas_bd = database.obtener_metricas(prog_id)
+    return _reshape_metricas(metricas_bd) if metricas_bd else metricas_bd
+
+@st.cache_data(show_spinner=False, ttl=300)
+def _load_prog_info(prog_id):
+    """Obtener programación como diccionario (cacheado)"""
+    return database.obtener_programacion(prog_id)
+
+def _pct(n, d):
+    """Porcentaje n/d*100, 0.0 si el total es 0"""
+    return 0.0 if not d else n / d * 100
+
+@st.cache_data(show_spinner=False)
+def _build_util_fig(valores):
+    """Gráfico de barras de utilización por máquina (cacheado por (máquina, utilización))"""
+    import plotly.express as px  # carga diferida: solo se necesita para este gráfico
+    
+    df_util = pd.DataFrame(list(valores), columns=['Máquina', 'Utilización Total'])
+    fig = px.bar(
+        df_util,
+        x='Máquina',
+        y='Utilización Total',
+        color='Máquina',
+        text_auto='.1f',
+        title='Utilización por Máquina',
+        color_discrete_map={'M1': '#1f77b4', 'M2': '#ff7f0e', 'M3': '#2ca02c'}
+    )
+    fig.update_layout(showlegend=False, height=400, yaxis_ticksuffix='%')
+    fig.update_traces(texttemplate='%{y:.1f}%', textposition='outside')
+    return fig
+
+def _plan_str(dia_nom, horas, plan_ts):
+    """Texto de hora planificada: "Día fecha completa" si hay datetime, si no "Día HH:MM" """
+    texto = dia_nom.str.cat(horas.fillna(''), sep=' ').str.strip()
+    con_fecha = plan_ts.notna()
+    texto[con_fecha] = dia_nom[con_fecha].str.cat(
+        plan_ts[con_fecha].dt.strftime('%Y-%m-%d %H:%M'), sep=' '
+    ).str.strip()
+    return texto
+
+@st.cache_data(show_spinner=False)
+def _build_comparativa(semana_prod, anio_prod, filas):
+    """Tabla Planificado vs Real (cacheada por semana, año y campos de las ejecuciones)"""
+    from utils.kpi_calculator import KPIExporter
+    from utils.kpi_kernels import calcular_duraciones_desviacion
+    
+    calc = KPIExporter()
+    df_ej = pd.DataFrame.from_records(filas, columns=_CAMPOS_COMPARATIVA)
+    
+    # Construir datetimes planificados desde hora, día, semana, año (para mostrar)
+    if semana_prod and anio_prod:
+        inicio_plan_ts = calc.build_planned_datetimes_vec(df_ej['inicio_hora'], df_ej['dia_semana'], semana_prod, anio_prod)
+        fin_plan_ts = calc.build_planned_datetimes_vec(df_ej['fin_hora'], df_ej['dia_semana'], semana_prod, anio_prod)
+    else:
+        inicio_plan_ts = fin_plan_ts = pd.Series(pd.NaT, index=df_ej.index, dtype='datetime64[ns]')
+    
+    # IMPORTANTE: Calcular duración planificada desde inicio_hora y fin_hora
+    # porque duracion_planificada de BD es la duración efectiva de trabajo (sin almuerzo)
+    # pero inicio_hora/fin_hora reflejan el tiempo transcurrido TOTAL (puede incluir almuerzo si cruza)
+    hora_ini = pd.to_datetime(df_ej['inicio_hora'], format='%H:%M', errors='coerce')
+    hora_fin = pd.to_datetime(df_ej['fin_hora'], format='%H:%M', errors='coerce')
+    min_ini = hora_ini.dt.hour * 60 + hora_ini.dt.minute
+    min_fin = hora_fin.dt.hour * 60 + hora_fin.dt.minute
+    
+    # Parsear horas reales una sola vez (se reutilizan para duración y para mostrar)
+    ini_real_ts = pd.to_datetime(df_ej['inicio_real'], errors='coerce', utc=True, cache=True)
+    fin_real_ts = pd.to_datetime(df_ej['fin_real'], errors='coerce', utc=True, cache=True)
+    
+    # Duración real desde datetimes reales; si faltan, duracion_real de BD
+    dur_real = np.trunc((fin_real_ts - ini_real_ts).dt.total_seconds() / 60)
+    dur_real = dur_real.fillna(pd.to_numeric(df_ej['duracion_real'], errors='coerce').fillna(0))
+    
+    # Duración planificada (ajuste si cruza medianoche; último recurso duracion_planificada de BD)
+    # y desviación: duración real sin paradas vs planificada (inicio/fin)
+    # NOTA: la desviación de BD compara contra duración original de tabla 'tareas';
+    # solo se usa cuando no hay duración real
+    tiempo_paradas = pd.to_numeric(df_ej['tiempo_paradas'], errors='coerce').fillna(0)
+    dur_plan, desv = calcular_duraciones_desviacion(
+        min_ini.to_numpy(dtype=float),
+        min_fin.to_numpy(dtype=float),
+        pd.to_numeric(df_ej['duracion_planificada'], errors='coerce').fillna(0).to_numpy(dtype=float),
+        dur_real.to_numpy(dtype=float),
+        tiempo_paradas.to_numpy(dtype=float),
+        pd.to_numeric(df_ej['desviacion_duracion'], errors='coerce').to_numpy(dtype=float),
+    )
+    
+    # Día de la tarea (prefijo de las horas planificadas)
+    dia_nom = df_ej['dia_nombre'].fillna('')
+    
+    return pd.DataFrame({
+        'Tarea': df_ej['tarea_nombre'].fillna('N/A'),
+        'Día': dia_nom,
+        'Inicio Plan.': _plan_str(dia_nom, df_ej['inicio_hora'], inicio_plan_ts),
+        'Fin Plan.': _plan_str(dia_nom, df_ej['fin_hora'], fin_plan_ts),
+        'Duración Plan. (min)': dur_plan,
+        'Inicio Real': ini_real_ts.dt.strftime('%Y-%m-%d %H:%M').fillna(''),
+        'Fin Real': fin_real_ts.dt.strftime('%Y-%m-%d %H:%M').fillna(''),
+        'Duración Real (min)': dur_real,
+        'Operador': df_ej['operador_ejecutor'].fillna('').replace('', 'N/A'),
+        'Tiempo Paradas (min)': tiempo_paradas,
+        'Desv. Duración (min)': np.round(desv, 1),
+    })
+
+@st.fragment
+def _comparativa_fragment(ejecuciones_data, prog_id, prog_seleccionada):
+    """Comparativa planificado vs real (diagnóstico); se re-ejecuta aislada del resto del Dashboard"""
+    with st.expander("🕒 Comparativa Planificado vs Real (diagnóstico)", expanded=False):
+        if ejecuciones_data:
+            # Obtener semana y año para construir datetimes planificados
+            prog_info = _load_prog_info(prog_id)
+            semana_prod = prog_info.get('semana_produccion') if prog_info else None
+            anio_prod = prog_seleccionada.get('Año') if prog_seleccionada else None
+            
+            # Solo los campos necesarios, como tuplas: clave estable para la caché de la tabla
+            filas = tuple(tuple(e.get(campo) for campo in _CAMPOS_COMPARATIVA) for e in ejecuciones_data)
+            df_comp = _build_comparativa(semana_prod, anio_prod, filas)
+            
+            if not df_comp.empty:
+                st.dataframe(df_comp, use_container_width=True, hide_index=True)
+                
+                # Mostrar resumen estadístico
+                st.caption("📊 **Resumen:**")
+                col_res1, col_res2, col_res3 = st.columns(3)
+                
+                # Desviaciones válidas (sin NaN) en un único array; la columna ya es numérica
+                desv_arr = df_comp['Desv. Duración (min)'].to_numpy(dtype=float)
+                desv_arr = desv_arr[~np.isnan(desv_arr)]
+                desv_abs = np.abs(desv_arr)
+                desv_max = float(desv_abs.max()) if desv_abs.size else None
+                
+                with col_res1:
+                    if desv_arr.size:
+                        st.metric("Desv. Promedio", f"{desv_arr.mean():.1f} min")
+                    else:
+                        st.metric("Desv. Promedio", "N/A")
+                
+                with col_res2:
+                    if desv_max is not None:
+                        st.metric("Desv. Máxima", f"{desv_max:.1f} min")
+                    else:
+                        st.metric("Desv. Máxima", "N/A")
+                
+                with col_res3:
+                    st.metric("Fuera Tolerancia (±5min)", int((desv_abs > 5).sum()))
+                
+                st.info("ℹ️ **Horas Planificadas:** Se usan las horas optimizadas (formato HH:MM) de la tabla TareaPlanificada, "
+                       "no minutos lineales. Las desviaciones se calculan usando la duración de la tabla 'Tareas' original.")
+            else:
+                st.info("No hay ejecuciones para comparar.")
+        else:
+            st.info("No hay datos de ejecuciones disponibles")
+
+@st.fragment
+def mostrar_tracking_produccion():
+    """Tab de tracking como fragmento: sus reruns no redibujan el resto de la página"""
+    st.subheader("🏭 Tracking de Producción")
+    st.caption("💡 Registra los tiempos reales de ejecución de tareas en producción")
+    
+    try:
+        # Obtener todas las programaciones activas (PLANIFICADA y EN_EJECUCION)
+        from modelos.database import obtener_programaciones_activas, obtener_tareas_sin_ejecucion_real, obtener_ejecuciones_reales_programacion, verificar_programacion_completa
+        
+        programaciones_activas = obtener_programaciones_activas()
+        
+        if programaciones_activas:
+            st.success(f"📋 **Programaciones Activas:** {len(programaciones_activas)}")
+            
+            # Con varias programaciones activas, solo se consulta/renderiza el detalle de la seleccionada
+            # (el contenido de un expander se ejecuta aunque esté cerrado)
+            prog_seleccionada_id = programaciones_activas[0]['id']
+            if len(programaciones_activas) > 1:
+                prog_seleccionada_id = st.radio(
+                    "Programación a gestionar:",
+                    [p['id'] for p in programaciones_activas],
+                    horizontal=True,
+                    key="tracking_prog_select"
+                )
+            
+            # Mostrar cada programación activa
+            for prog in programaciones_activas:
+                is_active_prog = prog['id'] == prog_seleccionada_id
+                with st.expander(f"📅 Semana {prog['semana_produccion']}/{prog['anio']} - {prog['estado'].value}", expanded=is_active_prog):
+                    st.info(f"**ID:** {prog['id']} | **Estado:** {prog['estado'].value}")
+                    
+                    if not is_active_prog:
+                        st.caption("💡 Selecciona esta programación arriba para ver su detalle")
+                        continue
+                    
+                    # Verificar estado de completitud
+                    esta_completa, total_tareas, tareas_registradas = verificar_programacion_completa(prog['id'])
+                    
+                    # Métricas de progreso
+                    col_prog1, col_prog2, col_prog3 = st.columns(3)
+                    with col_prog1:
+                        st.metric("Tareas Totales", total_tareas)
+                    with col_prog2:
+                        st.metric("Tareas Registradas", tareas_registradas)
+                    with col_prog3:
+                        porcentaje = (tareas_registradas / total_tareas * 100) if total_tareas > 0 else 0
+                        st.metric("Progreso", f"{porcentaje:.1f}%")
+                    
+                    # Barra de progreso
+                    if total_tareas > 0:
+                        st.progress(tareas_registradas / total_tareas)
+                    
+                    st.markdown("---")
+                    
+                    # Botón para iniciar ejecución (solo si está PLANIFICADA)
+                    if prog['estado'].value == 'planificada':
+                        if st.button(f"🚀 Iniciar Ejecución - Semana {prog['semana_produccion']}", 
+                                   key=f"iniciar_{prog['id']}", 
+                                   type="primary", 
+                                   use_container_width=True):
+                            from modelos.database import cambiar_estado_programacion
+                            from modelos.database_models import EstadoProgramacion
+                            exito, mensaje = cambiar_estado_programacion(prog['id'], EstadoProgramacion.EN_EJECUCION, "Usuario App")
+                            if exito:
+                                st.success(mensaje)
+                                st.rerun(scope="fragment")
+                            else:
+                                st.error(mensaje)
+                    
+                    # Sección de registro de tareas (solo si está EN_EJECUCION)
+                    if prog['estado'].value == 'en_ejecucion':
+                        st.subheader("📝 Registrar Ejecución Real")
+                        
+                        # Obtener tareas pendientes
+                        tareas_pendientes = obtener_tareas_sin_ejecucion_real(prog['id'])
+                        
+                        if tareas_pendientes:
+                            st.write(f"**Tareas pendientes de registro:** {len(tareas_pendientes)}")
+                            
+                            # Seleccionar tarea para registrar - Formato: ID_Tarea_Nombre
+                            tarea_options = {}
+                            for t in tareas_pendientes:
+                                # Formato: A2.P1 - Soldadura (P1) - M1
+                                tarea_key = f"{t['tarea_id']} - {t['tarea_nombre']} - M{t['maquina_planificada']}"
+                                tarea_options[tarea_key] = t
+                            
+                            tarea_seleccionada_str = st.selectbox(
+                                "Selecciona una tarea para registrar:",
+                                options=list(tarea_options.keys()),
+                                key=f"tarea_select_{prog['id']}"
+                            )
+                            
+                            if tarea_seleccionada_str:
+                                tarea = tarea_options[tarea_seleccionada_str]
+                                
+                                # Formulario para registrar tarea - usando un key más estable
+                                form_key = f"form_registrar_{prog['id']}"
+                                with st.form(form_key):
+                                    st.write("**Registrar ejecución real:**")
+                                    
+                                    col_t1, col_t2 = st.columns(2)
+                                    with col_t1:
+                                        st.write(f"**Tarea:** {tarea['tarea_nombre']}")
+                                        st.write(f"**Máquina Planificada:** {tarea['maquina_planificada']}")
+                                        st.write(f"**Duración Planificada:** {tarea['duracion_planificada']} min")
+                                    
+                                    with col_t2:
+                                        # Usar los datos ya calculados de la BD (formato HH:MM)
+                                        inicio_str = tarea.get('inicio_hora', 'N/A')
+                                        fin_str = tarea.get('fin_hora', 'N/A')
+                                        
+                                        st.write(f"**Inicio Planificado:** {inicio_str}")
+                                        st.write(f"**Fin Planificado:** {fin_str}")
+                                        if tarea.get('dia_nombre'):
+                                            st.write(f"**Día:** {tarea['dia_nombre']}")
+                                    
+                                    # Usar los tiempos planificados de la BD como valores por defecto
+                                    
+                                    # inicio_time/fin_time ya vienen parseados desde la BD (objetos time)
+                                    inicio_default = tarea.get('inicio_time') or dt_time(8, 0)  # Fallback por defecto
+                                    fin_default = tarea.get('fin_time') or dt_time(9, 0)  # Fallback por defecto
+                                    
+                                    # Campos de registro
+                                    dias_semana = _DIAS_SEMANA
+                                    dia_planificado = tarea.get('dia_nombre', 'Lun')
+                                    # Buscar el índice del día planificado (Lun -> Lunes, etc.)
+                                    dia_idx_default = _DIA_PREFIX_IDX.get(dia_planificado, 0)
+                                    
+                                    # Usar ID de tarea en los keys para que cada tarea tenga su propio formulario
+                                    tarea_id = tarea['tarea_planificada_id']
+                                    
+                                    col_r1, col_r2 = st.columns(2)
+                                    with col_r1:
+                                        # Día de la semana de inicio
+                                        dia_inicio_idx = st.selectbox(
+                                            "Día de inicio:",
+                                            range(len(dias_semana)),
+                                            format_func=lambda i: dias_semana[i],
+                                            index=dia_idx_default,
+                                            key=f"dia_inicio_{prog['id']}_{tarea_id}"
+                                        )
+                                        inicio_real = st.time_input("Hora de inicio real:", value=inicio_default, key=f"inicio_real_{prog['id']}_{tarea_id}")
+                                        maquina_usada = st.text_input("Máquina utilizada:", value=tarea['maquina_planificada'], key=f"maquina_usada_{prog['id']}_{tarea_id}")
+                                        operador = st.text_input("Operador:", value=tarea.get('operador_planificado', 'Operador 1'), key=f"operador_{prog['id']}_{tarea_id}")
+                                    
+                                    with col_r2:
+                                        # Día de la semana de fin
+                                        dia_fin_idx = st.selectbox(
+                                            "Día de fin:",
+                                            range(len(dias_semana)),
+                                            format_func=lambda i: dias_semana[i],
+                                            index=dia_idx_default,
+                                            key=f"dia_fin_{prog['id']}_{tarea_id}"
+                                        )
+                                        fin_real = st.time_input("Hora de fin real:", value=fin_default, key=f"fin_real_{prog['id']}_{tarea_id}")
+                                        problemas = st.text_area("Problemas encontrados:", key=f"problemas_{prog['id']}_{tarea_id}")
+                                        tiempo_paradas = st.number_input("Tiempo de paradas (min):", min_value=0, value=0, key=f"paradas_{prog['id']}_{tarea_id}")
+                                    
+                                    # Botón de registro
+                                    if st.form_submit_button("✅ Registrar Ejecución", type="primary"):
+                                        if inicio_real and fin_real:
+                                            # Calcular fecha real basada en semana y año de la programación
+                                            
+                                            # Calcular la fecha del lunes de esa semana usando isocalendar
+                                            anio_semana = prog['anio']
+                                            num_semana = prog['semana_produccion']
+                                            
+                                            # Crear una fecha cualquiera del año y ajustar a la semana
+                                            primer_dia = datetime(anio_semana, 1, 1)
+                                            # Ajustar al lunes de esa semana
+                                            dias_para_lunes = (7 - primer_dia.weekday()) % 7
+                                            primer_lunes = primer_dia + timedelta(days=dias_para_lunes)
+                                            
+                                            # Calcular el lunes de la semana solicitada
+                                            lunes_semana = primer_lunes + timedelta(weeks=num_semana-1)
+                                            
+                                            # Calcular fecha de inicio y fin
+                                            fecha_inicio = lunes_semana + timedelta(days=dia_inicio_idx)
+                                            fecha_fin = lunes_semana + timedelta(days=dia_fin_idx)
+                                            
+                                            # Crear datetime con fecha y hora
+                                            inicio_datetime = datetime.combine(fecha_inicio, inicio_real)
+                                            fin_datetime = datetime.combine(fecha_fin, fin_real)
+                                            
+                                            from modelos.database import registrar_ejecucion_real
+                                            try:
+                                                ejecucion_id = registrar_ejecucion_real(
+                                                    tarea_planificada_id=tarea['tarea_planificada_id'],
+                                                    inicio_real=inicio_datetime,
+                                                    fin_real=fin_datetime,
+                                                    maquina_usada=maquina_usada,
+                                                    operador_ejecutor=operador,
+                                                    problemas=problemas,
+                                                    tiempo_paradas=tiempo_paradas,
+                                                    registrado_por="Usuario App"
+                                                )
+                                                
+                                                # Limpiar los campos del formulario después del registro exitoso
+                                                # (todos sus keys terminan en _{prog_id}_{tarea_id})
+                                                sufijo_form = f"_{prog['id']}_{tarea_id}"
+                                                for key in [k for k in st.session_state if k.endswith(sufijo_form)]:
+                                                    del st.session_state[key]
+                                                
+                                                st.success(f"✅ Ejecución registrada exitosamente (ID: {ejecucion_id})")
+                                                st.rerun(scope="fragment")
+                                            except Exception as e:
+                                                st.error(f"Error al registrar: {str(e)}")
+                                        else:
+                                            st.error("Por favor completa todos los campos obligatorios")
+                        else:
+                            st.success("🎉 ¡Todas las tareas han sido registradas!")
+                        
+                        # Mostrar tareas ya registradas
+                        ejecuciones_registradas = obtener_ejecuciones_reales_programacion(prog['id'])
+                        if ejecuciones_registradas:
+                            st.subheader("📊 Tareas Registradas")
+                            
+                            # Una sola tabla (un payload Arrow) en lugar de un expander por ejecución
+                            df_ej = pd.DataFrame(ejecuciones_registradas)
+                            df_ej['Inicio Real'] = pd.to_datetime(df_ej['inicio_real']).dt.strftime('%H:%M').fillna('')
+                            df_ej['Fin Real'] = pd.to_datetime(df_ej['fin_real']).dt.strftime('%H:%M').fillna('')
+                            df_ej = df_ej.rename(columns={
+                                'tarea_nombre': 'Tarea',
+                                'maquina_usada': 'Máquina',
+                                'operador_ejecutor': 'Operador',
+                                'tiempo_paradas': 'Tiempo Paradas (min)',
+                                'problemas_encontrados': 'Problemas'
+                            })
+                            st.dataframe(
+                                df_ej[['Tarea', 'Máquina', 'Operador', 'Inicio Real', 'Fin Real',
+                                       'Tiempo Paradas (min)', 'Problemas']],
+                                hide_index=True,
+                                use_container_width=True
+                            )
+                        
+                        # Botón para marcar como completada (solo si está completa)
+                        if esta_completa:
+                            st.subheader("🏁 Finalizar Programación")
+                            
+                            # Checkbox de confirmación
+                            confirmar_key = f"confirmar_completar_tracking_{prog['id']}"
+                            if confirmar_key not in st.session_state:
+                                st.session_state[confirmar_key] = False
+                            
+                            confirmar_completar = st.checkbox(
+                                "Confirmar que se registraron todos los datos reales",
+                                key=confirmar_key,
+                                value=st.session_state[confirmar_key]
+                            )
+                            
+                            
+                            st.markdown("---")
+                            
+                            # Botón solo activo si está confirmado
+                            if st.button(f"✅ Marcar Semana {prog['semana_produccion']} como Completada", 
+                                       key=f"completar_{prog['id']}",
+                                       type="primary", 
+                                       use_container_width=True,
+                                       disabled=not confirmar_completar):
+                                from modelos.database import cambiar_estado_programacion
+                                from modelos.database_models import EstadoProgramacion
+                                
+                                exito, mensaje = cambiar_estado_programacion(
+                                    prog['id'], 
+                                    EstadoProgramacion.COMPLETADA, 
+                                    "Usuario App"
+                                )
+                                if exito:
+                                    st.success(f"{mensaje} 🎉")
+                                    st.rerun()
+                                else:
+                                    st.error(mensaje)
+        else:
+            st.info("📭 No hay programaciones activas para tracking")
+            st.caption("💡 Ve al tab 'Historial' para aprobar una programación o crear una nueva")
+    
+    except Exception as e:
+        st.error(f"Error en tracking: {e}")
+        import traceback
+        st.code(traceback.format_exc())
+
 # Inicialización de session state para múltiples trabajos
 if "trabajos" not in st.session_state:
     st.session_state.trabajos = crear_trabajos_ejemplo()
@@ -1992,7 +2489,7 @@ with col1:
         st.subheader("📊 Resumen de Trabajos")
         
         # Estadísticas por trabajo
-        trabajos_stats = tareas_df.groupby("trabajo").agg({
+        trabajos_stats = tareas_df.groupby("trabajo", observed=True).agg({
             "duracion": ["count", "sum", "mean"]
         }).round(1)
         trabajos_stats.columns = ["Número de Tareas", "Duración Total (min)", "Duración Promedio (min)"]
@@ -2020,7 +2517,6 @@ with col1:
                         optimizador.config["parametros_optimizacion"]["tiempo_maximo_resolucion"] = tiempo_maximo
 
                         # Calcular horas efectivas de trabajo
-                        from datetime import datetime, timedelta
                         hora_inicio_dt = datetime.combine(datetime.today(), hora_inicio)
                         hora_fin_dt = datetime.combine(datetime.today(), hora_fin)
                         almuerzo_inicio_dt = datetime.combine(datetime.today(), almuerzo_inicio)
@@ -2267,7 +2763,6 @@ if 'resultado_optimizacion' in st.session_state and st.session_state.resultado_o
                         
                         # CASO ESPECIAL: Si fin_parte es exactamente el inicio del día siguiente,
                         # significa que la tarea termina al final del día actual (18:00)
-                        from datetime import time as dt_time
                         print(f"DEBUG TABLE: {tarea_id}.P{parte_num} - fin_parte={fin_parte}, minutos_por_dia={minutos_por_dia}, modulo={fin_parte % minutos_por_dia}")
                         if fin_parte > 0 and fin_parte % minutos_por_dia == 0:
                             fin_real = dt_time(18, 0)  # 18:00 del día actual
@@ -2361,7 +2856,7 @@ if 'resultado_optimizacion' in st.session_state and st.session_state.resultado_o
     # Diagrama de Gantt INMEDIATAMENTE después de los resultados
     st.markdown("---")
     st.header("📅 Diagrama de Gantt Semanal")
-    horas_para_gantt = st.session_state.get('horas_efectivas', 10)  # Usar 10 horas (8:00-18:00 con almuerzo)
+    horas_para_gantt = st.session_state.get('horas_efectivas', 10.0)  # Usar 10 horas (8:00-18:00 con almuerzo)
     mostrar_diagrama_gantt(st.session_state.tareas_df, resultado, "_main", horas_para_gantt)
     
     # Gantt por máquina
@@ -2373,7 +2868,7 @@ if 'resultado_optimizacion' in st.session_state and st.session_state.resultado_o
     # Información adicional sobre la programación semanal
     with st.expander("ℹ️ Información sobre la Programación Semanal"):
         dias_info = st.session_state.get('dias_laborales', ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes'])
-        horas_info = st.session_state.get('horas_efectivas', 16)
+        horas_info = horas_para_gantt
         st.markdown(f"""
         **🎯 Cómo interpretar el diagrama:**
         - **Eje X (horizontal)**: Tiempo en horas a lo largo de TODA LA SEMANA (Lunes a Domingo)
@@ -2404,353 +2899,75 @@ with col2:
         # Estadísticas básicas de tareas - más compactas
         st.subheader("📋 Resumen General")
         
+        # Agregado por máquina calculado una sola vez (métricas, torta y tabla de detalle)
+        per_maquina = tareas_df.groupby('maquina', observed=True)['duracion'].agg(['sum', 'count', 'mean'])
+        
+        # Total y promedio con una sola reducción NumPy sobre la columna de duraciones
+        dur = tareas_df['duracion'].to_numpy()
+        total_min = int(dur.sum())
+        mean_min = float(dur.mean()) if dur.size else 0.0
+        
         # Métricas en columnas para ahorrar espacio vertical
         col_met1, col_met2 = st.columns(2)
         with col_met1:
             st.metric("Total de Trabajos", len(st.session_state.trabajos))
-            st.metric("Duración Total", f"{tareas_df['duracion'].sum()} min")
+            st.metric("Duración Total", f"{total_min} min")
         with col_met2:
             st.metric("Total de Tareas", len(tareas_df))
-            st.metric("Máquinas Únicas", tareas_df["maquina"].nunique())
+            st.metric("Máquinas Únicas", len(per_maquina))
         
         # Duración promedio en una línea separada
-        st.metric("Duración Promedio", f"{tareas_df['duracion'].mean():.1f} min")
+        st.metric("Duración Promedio", f"{mean_min:.1f} min")
         
         # Gráfico de duración por trabajo
         st.subheader("📊 Duración por Trabajo")
-        fig_trabajos = px.bar(
-            tareas_df.groupby("trabajo")["duracion"].sum().reset_index(),
-            x="trabajo",
-            y="duracion",
+        duracion_por_trabajo = tareas_df.groupby("trabajo", observed=True)["duracion"].sum()
+        # Traza construida directamente con graph_objects (sin la inferencia de Plotly Express)
+        fig_trabajos = go.Figure(go.Bar(
+            x=duracion_por_trabajo.index.to_numpy(),
+            y=duracion_por_trabajo.to_numpy()
+        ))
+        fig_trabajos.update_xaxes(tickangle=45)
+        fig_trabajos.update_layout(
             title="Duración Total por Trabajo",
-            labels={"duracion": "Duración (min)", "trabajo": "Trabajo"}
+            xaxis_title="Trabajo",
+            yaxis_title="Duración (min)",
+            height=250
         )
-        fig_trabajos.update_xaxes(tickangle=45)
-        fig_trabajos.update_layout(height=250)
         st.plotly_chart(fig_trabajos, use_container_width=True, key="chart_trabajos")
         
         # Gráfico de distribución por máquina (torta)
         st.subheader("⚙️ Distribución por Máquina")
         # Crear datos para el gráfico de torta - usar TIEMPO TOTAL
-        maquina_duracion = tareas_df.groupby('maquina')['duracion'].sum().reset_index(name='duracion_total')
+        maquina_duracion = per_maquina['sum'].reset_index(name='duracion_total')
         
         if not maquina_duracion.empty:
-            fig_maquina = px.pie(
-                maquina_duracion,
-                values='duracion_total',
-                names='maquina',
-                title="Distribución de Tiempo por Máquina"
-            )
             # Mostrar solo porcentajes en el gráfico
-            fig_maquina.update_traces(
+            fig_maquina = go.Figure(go.Pie(
+                labels=maquina_duracion['maquina'].to_numpy(),
+                values=maquina_duracion['duracion_total'].to_numpy(),
                 texttemplate='%{label}<br>%{percent}',
                 textposition='inside',
                 hovertemplate='<b>%{label}</b><br>Tiempo: %{value} min<br>Porcentaje: %{percent}<extra></extra>'
-            )
-            fig_maquina.update_layout(height=250)
+            ))
+            fig_maquina.update_layout(title="Distribución de Tiempo por Máquina", height=250)
             st.plotly_chart(fig_maquina, use_container_width=True, key="chart_maquinas")
             
             # Mostrar tabla con detalles en desplegable
             with st.expander("📋 Detalles por Máquina"):
-                # Agregar estadísticas completas
-                maquina_stats = tareas_df.groupby('maquina').agg({
-                    'duracion': ['sum', 'count', 'mean']
-                }).round(1)
-                maquina_stats.columns = ['Tiempo Total (min)', 'Número de Tareas', 'Tiempo Promedio (min)']
-                st.dataframe(maquina_stats, use_container_width=True)
+                # Estadísticas completas desde el agregado por máquina (columnas planas, sin índice)
+                maquina_stats = per_maquina.rename(columns={
+                    'sum': 'Tiempo Total (min)',
+                    'count': 'Número de Tareas',
+                    'mean': 'Tiempo Promedio (min)'
+                }).round(1).reset_index()
+                st.dataframe(maquina_stats, use_container_width=True, hide_index=True)
         else:
             st.info("ℹ️ No hay datos de máquinas para mostrar")
 
     # Tab Tracking
     with tab_tracking:
-        st.subheader("🏭 Tracking de Producción")
-        st.caption("💡 Registra los tiempos reales de ejecución de tareas en producción")
-        
-        try:
-            # Obtener todas las programaciones activas (PLANIFICADA y EN_EJECUCION)
-            from modelos.database import obtener_programaciones_activas, obtener_tareas_sin_ejecucion_real, obtener_ejecuciones_reales_programacion, verificar_programacion_completa
-            
-            programaciones_activas = obtener_programaciones_activas()
-            
-            if programaciones_activas:
-                st.success(f"📋 **Programaciones Activas:** {len(programaciones_activas)}")
-                
-                # Mostrar cada programación activa
-                for prog in programaciones_activas:
-                    with st.expander(f"📅 Semana {prog['semana_produccion']}/{prog['anio']} - {prog['estado'].value}", expanded=True):
-                        st.info(f"**ID:** {prog['id']} | **Estado:** {prog['estado'].value}")
-                        
-                        # Verificar estado de completitud
-                        esta_completa, total_tareas, tareas_registradas = verificar_programacion_completa(prog['id'])
-                        
-                        # Métricas de progreso
-                        col_prog1, col_prog2, col_prog3 = st.columns(3)
-                        with col_prog1:
-                            st.metric("Tareas Totales", total_tareas)
-                        with col_prog2:
-                            st.metric("Tareas Registradas", tareas_registradas)
-                        with col_prog3:
-                            porcentaje = (tareas_registradas / total_tareas * 100) if total_tareas > 0 else 0
-                            st.metric("Progreso", f"{porcentaje:.1f}%")
-                        
-                        # Barra de progreso
-                        if total_tareas > 0:
-                            st.progress(tareas_registradas / total_tareas)
-                        
-                        st.markdown("---")
-                        
-                        # Botón para iniciar ejecución (solo si está PLANIFICADA)
-                        if prog['estado'].value == 'planificada':
-                            if st.button(f"🚀 Iniciar Ejecución - Semana {prog['semana_produccion']}", 
-                                       key=f"iniciar_{prog['id']}", 
-                                       type="primary", 
-                                       use_container_width=True):
-                                from modelos.database import cambiar_estado_programacion
-                                from modelos.database_models import EstadoProgramacion
-                                exito, mensaje = cambiar_estado_programacion(prog['id'], EstadoProgramacion.EN_EJECUCION, "Usuario App")
-                                if exito:
-                                    st.success(mensaje)
-                                    st.rerun()
-                                else:
-                                    st.error(mensaje)
-                        
-                        # Sección de registro de tareas (solo si está EN_EJECUCION)
-                        if prog['estado'].value == 'en_ejecucion':
-                            st.subheader("📝 Registrar Ejecución Real")
-                            
-                            # Obtener tareas pendientes
-                            tareas_pendientes = obtener_tareas_sin_ejecucion_real(prog['id'])
-                            
-                            if tareas_pendientes:
-                                st.write(f"**Tareas pendientes de registro:** {len(tareas_pendientes)}")
-                                
-                                # Seleccionar tarea para registrar - Formato: ID_Tarea_Nombre
-                                tarea_options = {}
-                                for t in tareas_pendientes:
-                                    # Formato: A2.P1 - Soldadura (P1) - M1
-                                    tarea_key = f"{t['tarea_id']} - {t['tarea_nombre']} - M{t['maquina_planificada']}"
-                                    tarea_options[tarea_key] = t
-                                
-                                tarea_seleccionada_str = st.selectbox(
-                                    "Selecciona una tarea para registrar:",
-                                    options=list(tarea_options.keys()),
-                                    key=f"tarea_select_{prog['id']}"
-                                )
-                                
-                                if tarea_seleccionada_str:
-                                    tarea = tarea_options[tarea_seleccionada_str]
-                                    
-                                    # Formulario para registrar tarea - usando un key más estable
-                                    form_key = f"form_registrar_{prog['id']}"
-                                    with st.form(form_key):
-                                        st.write("**Registrar ejecución real:**")
-                                        
-                                        col_t1, col_t2 = st.columns(2)
-                                        with col_t1:
-                                            st.write(f"**Tarea:** {tarea['tarea_nombre']}")
-                                            st.write(f"**Máquina Planificada:** {tarea['maquina_planificada']}")
-                                            st.write(f"**Duración Planificada:** {tarea['duracion_planificada']} min")
-                                        
-                                        with col_t2:
-                                            # Usar los datos ya calculados de la BD (formato HH:MM)
-                                            inicio_str = tarea.get('inicio_hora', 'N/A')
-                                            fin_str = tarea.get('fin_hora', 'N/A')
-                                            
-                                            st.write(f"**Inicio Planificado:** {inicio_str}")
-                                            st.write(f"**Fin Planificado:** {fin_str}")
-                                            if tarea.get('dia_nombre'):
-                                                st.write(f"**Día:** {tarea['dia_nombre']}")
-                                        
-                                        # Usar los tiempos planificados de la BD como valores por defecto
-                                        from datetime import time as dt_time, datetime
-                                        
-                                        # Convertir inicio_hora y fin_hora (HH:MM) a objetos time
-                                        inicio_default = dt_time(8, 0)  # Fallback por defecto
-                                        fin_default = dt_time(9, 0)  # Fallback por defecto
-                                        
-                                        # Convertir inicio_hora de "HH:MM" a objeto time
-                                        if tarea.get('inicio_hora'):
-                                            try:
-                                                hora, minuto = map(int, tarea['inicio_hora'].split(':'))
-                                                inicio_default = dt_time(hora, minuto)
-                                            except:
-                                                pass
-                                        
-                                        # Convertir fin_hora de "HH:MM" a objeto time
-                                        if tarea.get('fin_hora'):
-                                            try:
-                                                hora, minuto = map(int, tarea['fin_hora'].split(':'))
-                                                fin_default = dt_time(hora, minuto)
-                                            except:
-                                                pass
-                                        
-                                        # Campos de registro
-                                        dias_semana = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-                                        dia_planificado = tarea.get('dia_nombre', 'Lun')
-                                        # Buscar el índice del día planificado (Lun -> Lunes, etc.)
-                                        dia_idx_default = 0
-                                        for i, dia in enumerate(dias_semana):
-                                            if dia_planificado in dia[:3]:
-                                                dia_idx_default = i
-                                                break
-                                        
-                                        # Usar ID de tarea en los keys para que cada tarea tenga su propio formulario
-                                        tarea_id = tarea['tarea_planificada_id']
-                                        
-                                        col_r1, col_r2 = st.columns(2)
-                                        with col_r1:
-                                            # Día de la semana de inicio
-                                            dia_inicio_idx = st.selectbox(
-                                                "Día de inicio:",
-                                                range(len(dias_semana)),
-                                                format_func=lambda i: dias_semana[i],
-                                                index=dia_idx_default,
-                                                key=f"dia_inicio_{prog['id']}_{tarea_id}"
-                                            )
-                                            inicio_real = st.time_input("Hora de inicio real:", value=inicio_default, key=f"inicio_real_{prog['id']}_{tarea_id}")
-                                            maquina_usada = st.text_input("Máquina utilizada:", value=tarea['maquina_planificada'], key=f"maquina_usada_{prog['id']}_{tarea_id}")
-                                            operador = st.text_input("Operador:", value=tarea.get('operador_planificado', 'Operador 1'), key=f"operador_{prog['id']}_{tarea_id}")
-                                        
-                                        with col_r2:
-                                            # Día de la semana de fin
-                                            dia_fin_idx = st.selectbox(
-                                                "Día de fin:",
-                                                range(len(dias_semana)),
-                                                format_func=lambda i: dias_semana[i],
-                                                index=dia_idx_default,
-                                                key=f"dia_fin_{prog['id']}_{tarea_id}"
-                                            )
-                                            fin_real = st.time_input("Hora de fin real:", value=fin_default, key=f"fin_real_{prog['id']}_{tarea_id}")
-                                            problemas = st.text_area("Problemas encontrados:", key=f"problemas_{prog['id']}_{tarea_id}")
-                                            tiempo_paradas = st.number_input("Tiempo de paradas (min):", min_value=0, value=0, key=f"paradas_{prog['id']}_{tarea_id}")
-                                        
-                                        # Botón de registro
-                                        if st.form_submit_button("✅ Registrar Ejecución", type="primary"):
-                                            if inicio_real and fin_real:
-                                                # Calcular fecha real basada en semana y año de la programación
-                                                from datetime import datetime, timedelta
-                                                
-                                                # Calcular la fecha del lunes de esa semana usando isocalendar
-                                                anio_semana = prog['anio']
-                                                num_semana = prog['semana_produccion']
-                                                
-                                                # Crear una fecha cualquiera del año y ajustar a la semana
-                                                primer_dia = datetime(anio_semana, 1, 1)
-                                                # Ajustar al lunes de esa semana
-                                                dias_para_lunes = (7 - primer_dia.weekday()) % 7
-                                                primer_lunes = primer_dia + timedelta(days=dias_para_lunes)
-                                                
-                                                # Calcular el lunes de la semana solicitada
-                                                lunes_semana = primer_lunes + timedelta(weeks=num_semana-1)
-                                                
-                                                # Calcular fecha de inicio y fin
-                                                fecha_inicio = lunes_semana + timedelta(days=dia_inicio_idx)
-                                                fecha_fin = lunes_semana + timedelta(days=dia_fin_idx)
-                                                
-                                                # Crear datetime con fecha y hora
-                                                inicio_datetime = datetime.combine(fecha_inicio, inicio_real)
-                                                fin_datetime = datetime.combine(fecha_fin, fin_real)
-                                                
-                                                from modelos.database import registrar_ejecucion_real
-                                                try:
-                                                    ejecucion_id = registrar_ejecucion_real(
-                                                        tarea_planificada_id=tarea['tarea_planificada_id'],
-                                                        inicio_real=inicio_datetime,
-                                                        fin_real=fin_datetime,
-                                                        maquina_usada=maquina_usada,
-                                                        operador_ejecutor=operador,
-                                                        problemas=problemas,
-                                                        tiempo_paradas=tiempo_paradas,
-                                                        registrado_por="Usuario App"
-                                                    )
-                                                    
-                                                    # Limpiar los campos del formulario después del registro exitoso
-                                                    keys_to_clear = [
-                                                        f"dia_inicio_{prog['id']}_{tarea_id}",
-                                                        f"inicio_real_{prog['id']}_{tarea_id}",
-                                                        f"maquina_usada_{prog['id']}_{tarea_id}",
-                                                        f"operador_{prog['id']}_{tarea_id}",
-                                                        f"dia_fin_{prog['id']}_{tarea_id}",
-                                                        f"fin_real_{prog['id']}_{tarea_id}",
-                                                        f"problemas_{prog['id']}_{tarea_id}",
-                                                        f"paradas_{prog['id']}_{tarea_id}"
-                                                    ]
-                                                    for key in keys_to_clear:
-                                                        if key in st.session_state:
-                                                            del st.session_state[key]
-                                                    
-                                                    st.success(f"✅ Ejecución registrada exitosamente (ID: {ejecucion_id})")
-                                                    st.rerun()
-                                                except Exception as e:
-                                                    st.error(f"Error al registrar: {str(e)}")
-                                            else:
-                                                st.error("Por favor completa todos los campos obligatorios")
-                            else:
-                                st.success("🎉 ¡Todas las tareas han sido registradas!")
-                            
-                            # Mostrar tareas ya registradas
-                            ejecuciones_registradas = obtener_ejecuciones_reales_programacion(prog['id'])
-                            if ejecuciones_registradas:
-                                st.subheader("📊 Tareas Registradas")
-                                
-                                for ejecucion in ejecuciones_registradas:
-                                    with st.expander(f"✅ {ejecucion['tarea_nombre']} - M{ejecucion['maquina_usada']}"):
-                                        col_e1, col_e2 = st.columns(2)
-                                        with col_e1:
-                                            st.write(f"**Operador:** {ejecucion['operador_ejecutor']}")
-                                            st.write(f"**Inicio Real:** {ejecucion['inicio_real'].strftime('%H:%M')}")
-                                            st.write(f"**Fin Real:** {ejecucion['fin_real'].strftime('%H:%M')}")
-                                        with col_e2:
-                                            st.write(f"**Máquina:** {ejecucion['maquina_usada']}")
-                                            st.write(f"**Tiempo Paradas:** {ejecucion['tiempo_paradas']} min")
-                                            if ejecucion['problemas_encontrados']:
-                                                st.write(f"**Problemas:** {ejecucion['problemas_encontrados']}")
-                            
-                            # Botón para marcar como completada (solo si está completa)
-                            if esta_completa:
-                                st.subheader("🏁 Finalizar Programación")
-                                
-                                # Checkbox de confirmación
-                                confirmar_key = f"confirmar_completar_tracking_{prog['id']}"
-                                if confirmar_key not in st.session_state:
-                                    st.session_state[confirmar_key] = False
-                                
-                                confirmar_completar = st.checkbox(
-                                    "Confirmar que se registraron todos los datos reales",
-                                    key=confirmar_key,
-                                    value=st.session_state[confirmar_key]
-                                )
-                                
-                                
-                                st.markdown("---")
-                                
-                                # Botón solo activo si está confirmado
-                                if st.button(f"✅ Marcar Semana {prog['semana_produccion']} como Completada", 
-                                           key=f"completar_{prog['id']}",
-                                           type="primary", 
-                                           use_container_width=True,
-                                           disabled=not confirmar_completar):
-                                    from modelos.database import cambiar_estado_programacion
-                                    from modelos.database_models import EstadoProgramacion
-                                    
-                                    exito, mensaje = cambiar_estado_programacion(
-                                        prog['id'], 
-                                        EstadoProgramacion.COMPLETADA, 
-                                        "Usuario App"
-                                    )
-                                    if exito:
-                                        st.success(f"{mensaje} 🎉")
-                                        st.rerun()
-                                    else:
-                                        st.error(mensaje)
-            else:
-                st.info("📭 No hay programaciones activas para tracking")
-                st.caption("💡 Ve al tab 'Historial' para aprobar una programación o crear una nueva")
-        
-        except Exception as e:
-            st.error(f"Error en tracking: {e}")
-            import traceback
-            st.code(traceback.format_exc())
+        mostrar_tracking_produccion()
     
     # ========================================================================
     # TAB: DASHBOARD KPIS
@@ -2793,7 +3010,7 @@ with col2:
                 prog_seleccionada = programaciones_completadas[prog_seleccionada_idx]
                 
                 # Obtener ejecuciones reales
-                from modelos.database import obtener_ejecuciones_reales_programacion, obtener_programacion
+                from modelos.database import obtener_ejecuciones_reales_programacion
                 prog_id = prog_seleccionada.get('ID', '')
                 
                 try:
@@ -2808,7 +3025,7 @@ with col2:
                     st.info("💡 Esta programación no tiene datos de tracking registrados. Mostrando métricas básicas de la planificación.")
                     
                     # Obtener datos planificados
-                    prog_detallada = obtener_programacion(prog_seleccionada.get('ID', ''))
+                    prog_detallada = _load_prog_info(prog_seleccionada.get('ID', ''))
                     
                     if prog_detallada:
                         col1, col2, col3, col4 = st.columns(4)
@@ -2829,20 +3046,22 @@ with col2:
                     else:
                         st.info("📭 No hay datos disponibles para esta programación")
                 
-                elif ejecuciones:
-                    prog_id = prog_seleccionada.get('ID', '')
-                    
-                    # Obtener métricas desde BD
-                    from modelos.database import obtener_metricas, calcular_y_guardar_metricas
-                    metricas_bd = obtener_metricas(prog_id)
+                else:
+                    # Obtener métricas desde BD (cacheadas por prog_id)
+                    from modelos.database import calcular_y_guardar_metricas
+                    metricas_bd = _load_metricas(prog_id)
                     
                     # Si no existen métricas, calcularlas y guardarlas
                     if not metricas_bd:
                         with st.spinner("🔄 Calculando KPIs y guardando en BD..."):
                             calcular_y_guardar_metricas(prog_id)
-                            metricas_bd = obtener_metricas(prog_id)
+                            # Invalidar la caché (tenía guardado el resultado vacío)
+                            _load_metricas.clear()
+                            metricas_bd = _load_metricas(prog_id)
                     
-                    if metricas_bd:
+                    if not metricas_bd:
+                        st.error("❌ No se pudieron cargar las métricas desde BD")
+                    else:
                         # Mostrar fecha de último cálculo
                         if metricas_bd.get('fecha_calculo'):
                             fecha_calc = metricas_bd['fecha_calculo']
@@ -2851,380 +3070,135 @@ with col2:
                             else:
                                 st.caption(f"📅 Último cálculo: {fecha_calc.strftime('%Y-%m-%d %H:%M:%S') if hasattr(fecha_calc, 'strftime') else fecha_calc}")
                         
-                        # Convertir métricas de BD al formato esperado para la UI
-                        metricas = {
-                            'oee_global': metricas_bd.get('oee_global', 0.0),
-                            'disponibilidad_oee': metricas_bd.get('disponibilidad_oee', 0.0),
-                            'rendimiento_oee': metricas_bd.get('rendimiento_oee', 0.0),
-                            'calidad_oee': metricas_bd.get('calidad_oee', 0.0),
-                            'throughput_semanal': metricas_bd.get('throughput_semanal', 0),
-                            'otif_porcentaje': metricas_bd.get('otif_porcentaje', 0.0),
-                            'tareas_a_tiempo': metricas_bd.get('tareas_a_tiempo', 0),
-                            'tareas_retrasadas': metricas_bd.get('tareas_retrasadas', 0),
-                            'tareas_adelantadas': metricas_bd.get('tareas_adelantadas', 0),
-                            'desviacion_promedio': metricas_bd.get('desviacion_promedio', 0.0),
-                            'desviacion_maxima': metricas_bd.get('desviacion_maxima', 0.0),
-                            'lead_time_promedio': metricas_bd.get('lead_time_promedio', 0.0),  # Utilización global promedio ponderada
-                            'cuello_botella': metricas_bd.get('cuello_botella_identificado'),
-                            'total_tareas': len(ejecuciones),
-                            # Incluir ejecuciones reales para las planillas desplegables
-                            'ejecuciones': ejecuciones,
-                            # Reconstruir utilizacion_maquinas desde BD
-                            'utilizacion_maquinas': {
-                                'M1': {
-                                    'utilizacion_total': metricas_bd.get('utilizacion_m1', 0.0),
-                                    'tiempo_productivo': metricas_bd.get('tiempo_productivo_m1', 0),
-                                    'tiempo_ocioso': metricas_bd.get('tiempo_ocioso_m1', 0),
-                                    'tiempo_setup': metricas_bd.get('tiempo_setup_m1', 0),
-                                    'num_tareas': sum(1 for e in ejecuciones if e.get('maquina_usada') == 'M1')
-                                },
-                                'M2': {
-                                    'utilizacion_total': metricas_bd.get('utilizacion_m2', 0.0),
-                                    'tiempo_productivo': metricas_bd.get('tiempo_productivo_m2', 0),
-                                    'tiempo_ocioso': metricas_bd.get('tiempo_ocioso_m2', 0),
-                                    'tiempo_setup': metricas_bd.get('tiempo_setup_m2', 0),
-                                    'num_tareas': sum(1 for e in ejecuciones if e.get('maquina_usada') == 'M2')
-                                },
-                                'M3': {
-                                    'utilizacion_total': metricas_bd.get('utilizacion_m3', 0.0),
-                                    'tiempo_productivo': metricas_bd.get('tiempo_productivo_m3', 0),
-                                    'tiempo_ocioso': metricas_bd.get('tiempo_ocioso_m3', 0),
-                                    'tiempo_setup': metricas_bd.get('tiempo_setup_m3', 0),
-                                    'num_tareas': sum(1 for e in ejecuciones if e.get('maquina_usada') == 'M3')
-                                }
-                            }
-                        }
-                    else:
-                        st.error("❌ No se pudieron cargar las métricas desde BD")
-                        # Inicializar metricas vacío pero con ejecuciones para que las planillas funcionen
-                        metricas = {
-                            'ejecuciones': ejecuciones,
-                            'total_tareas': len(ejecuciones),
-                            'oee_global': 0.0,
-                            'disponibilidad_oee': 0.0,
-                            'rendimiento_oee': 0.0,
-                            'calidad_oee': 0.0,
-                            'throughput_semanal': len(ejecuciones),
-                            'otif_porcentaje': 0.0,
-                            'tareas_a_tiempo': 0,
-                            'tareas_retrasadas': 0,
-                            'tareas_adelantadas': 0,
-                            'desviacion_promedio': 0.0,
-                            'desviacion_maxima': 0.0,
-                            'utilizacion_maquinas': {}
-                        }
-                    
-                    # Mostrar KPIs principales (7 KPIs en 2 filas: 4 + 3)
-                    # Primera fila: 4 KPIs principales
-                    col1, col2, col3, col4 = st.columns(4)
+                        # Tareas por máquina en una sola pasada sobre las ejecuciones
+                        tareas_por_maquina = Counter(e.get('maquina_usada') for e in ejecuciones)
+                        
+                        # Métricas ya en formato UI (se reconstruyen solo al recargar desde BD);
+                        # agregar las ejecuciones reales para las planillas desplegables
+                        metricas = dict(metricas_bd, total_tareas=len(ejecuciones), ejecuciones=ejecuciones)
+                        for maq, data in metricas['utilizacion_maquinas'].items():
+                            data['num_tareas'] = tareas_por_maquina.get(maq, 0)
+                        
+                        # Mostrar KPIs principales (7 KPIs en 2 filas: 4 + 3)
+                        # Primera fila: 4 KPIs principales
+                        col1, col2, col3, col4 = st.columns(4)
                     
-                    with col1:
-                        st.metric(
-                            "🎯 OEE Global",
-                            f"{metricas['oee_global']:.1f}%",
-                            help="Overall Equipment Effectiveness"
-                        )
+                        with col1:
+                            st.metric(
+                                "🎯 OEE Global",
+                                f"{metricas['oee_global']:.1f}%",
+                                help="Overall Equipment Effectiveness"
+                            )
                     
-                    with col2:
-                        st.metric(
-                            "✅ Cumplimiento (OTIF)",
-                            f"{metricas['otif_porcentaje']:.1f}%",
-                            delta=f"{metricas['tareas_a_tiempo']}/{metricas['total_tareas']} tareas"
-                        )
+                        with col2:
+                            st.metric(
+                                "✅ Cumplimiento (OTIF)",
+                                f"{metricas['otif_porcentaje']:.1f}%",
+                                delta=f"{metricas['tareas_a_tiempo']}/{metricas['total_tareas']} tareas"
+                            )
                     
-                    with col3:
-                        st.metric(
-                            "⏱️ Desviación Promedio",
-                            f"{metricas['desviacion_promedio']:.0f} min",
-                            delta=f"Max: {metricas['desviacion_maxima']:.0f} min"
-                        )
+                        with col3:
+                            st.metric(
+                                "⏱️ Desviación Promedio",
+                                f"{metricas['desviacion_promedio']:.0f} min",
+                                delta=f"Max: {metricas['desviacion_maxima']:.0f} min"
+                            )
                     
-                    with col4:
-                        # Utilización Global de Máquinas (promedio ponderado)
-                        utilizacion_global = metricas.get('lead_time_promedio', 0.0)  # Reutilizamos este campo
-                        st.metric(
-                            "⚙️ Utilización Global",
-                            f"{utilizacion_global:.1f}%",
-                            help="Promedio ponderado por tiempo productivo"
-                        )
+                        with col4:
+                            # Utilización Global de Máquinas (promedio ponderado)
+                            utilizacion_global = metricas.get('lead_time_promedio', 0.0)  # Reutilizamos este campo
+                            st.metric(
+                                "⚙️ Utilización Global",
+                                f"{utilizacion_global:.1f}%",
+                                help="Promedio ponderado por tiempo productivo"
+                            )
                     
-                    # Segunda fila: 3 Componentes del OEE
-                    col5, col6, col7 = st.columns(3)
+                        # Segunda fila: 3 Componentes del OEE
+                        col5, col6, col7 = st.columns(3)
                     
-                    with col5:
-                        disponibilidad = metricas.get('disponibilidad_oee', 0.0)
-                        st.metric(
-                            "📊 Disponibilidad",
-                            f"{disponibilidad:.1f}%",
-                            help="% de tiempo de operación vs tiempo planificado"
-                        )
+                        with col5:
+                            disponibilidad = metricas.get('disponibilidad_oee', 0.0)
+                            st.metric(
+                                "📊 Disponibilidad",
+                                f"{disponibilidad:.1f}%",
+                                help="% de tiempo de operación vs tiempo planificado"
+                            )
                     
-                    with col6:
-                        rendimiento = metricas.get('rendimiento_oee', 0.0)
-                        st.metric(
-                            "⚡ Rendimiento",
-                            f"{rendimiento:.1f}%",
-                            help="% de velocidad real vs planificada (tiempo total)"
-                        )
+                        with col6:
+                            rendimiento = metricas.get('rendimiento_oee', 0.0)
+                            st.metric(
+                                "⚡ Rendimiento",
+                                f"{rendimiento:.1f}%",
+                                help="% de velocidad real vs planificada (tiempo total)"
+                            )
                     
-                    with col7:
-                        calidad = metricas.get('calidad_oee', 0.0)
-                        st.metric(
-                            "✨ Calidad",
-                            f"{calidad:.1f}%",
-                            help="% de tareas sin problemas/rechazos"
-                        )
+                        with col7:
+                            calidad = metricas.get('calidad_oee', 0.0)
+                            st.metric(
+                                "✨ Calidad",
+                                f"{calidad:.1f}%",
+                                help="% de tareas sin problemas/rechazos"
+                            )
                     
-                    st.markdown("---")
+                        st.markdown("---")
                     
-                    # Utilización por máquina
-                    st.subheader("⚙️ Utilización de Máquinas")
+                        # Utilización por máquina
+                        st.subheader("⚙️ Utilización de Máquinas")
                     
-                    if metricas.get('utilizacion_maquinas'):
-                        maquinas_data = []
-                        for maq, data in metricas['utilizacion_maquinas'].items():
-                            maquinas_data.append({
-                                'Máquina': maq,
-                                'Utilización Total': f"{data['utilizacion_total']:.1f}%",
-                                'Tiempo Productivo': f"{data['tiempo_productivo']:.0f} min",
-                                'Tiempo Ocioso': f"{data['tiempo_ocioso']:.0f} min",
-                                'Tareas': data['num_tareas']
-                            })
+                        if metricas.get('utilizacion_maquinas'):
+                            maquinas_data = []
+                            for maq, data in metricas['utilizacion_maquinas'].items():
+                                maquinas_data.append({
+                                    'Máquina': maq,
+                                    'Utilización Total': data['utilizacion_total'],
+                                    'Tiempo Productivo': data['tiempo_productivo'],
+                                    'Tiempo Ocioso': data['tiempo_ocioso'],
+                                    'Tareas': data['num_tareas']
+                                })
                         
-                        df_utilizacion = pd.DataFrame(maquinas_data)
-                        st.dataframe(df_utilizacion, use_container_width=True, hide_index=True)
+                            # Valores numéricos: el formato lo aplica Streamlit (permite ordenar columnas)
+                            df_utilizacion = pd.DataFrame(maquinas_data)
+                            st.dataframe(
+                                df_utilizacion,
+                                use_container_width=True,
+                                hide_index=True,
+                                column_config={
+                                    'Utilización Total': st.column_config.NumberColumn(format='%.1f%%'),
+                                    'Tiempo Productivo': st.column_config.NumberColumn(format='%.0f min'),
+                                    'Tiempo Ocioso': st.column_config.NumberColumn(format='%.0f min'),
+                                }
+                            )
                         
-                        # Gráfico de barras
-                        fig_barras = px.bar(
-                            df_utilizacion,
-                            x='Máquina',
-                            y='Utilización Total',
-                            color='Máquina',
-                            text='Utilización Total',
-                            title='Utilización por Máquina',
-                            color_discrete_map={'M1': '#1f77b4', 'M2': '#ff7f0e', 'M3': '#2ca02c'}
-                        )
-                        fig_barras.update_layout(showlegend=False, height=400)
-                        fig_barras.update_traces(texttemplate='%{text}', textposition='outside')
-                        st.plotly_chart(fig_barras, use_container_width=True)
+                            # Gráfico de barras (no se reconstruye si la utilización no cambió)
+                            util_key = tuple((r['Máquina'], r['Utilización Total']) for r in maquinas_data)
+                            st.plotly_chart(_build_util_fig(util_key), use_container_width=True)
                         
-                        # Alerta de cuello de botella
-                        cuello = metricas.get('cuello_botella')
-                        if cuello:
-                            st.warning(f"⚠️ Cuello de botella identificado: **{cuello}** - Considera redistribuir carga")
-                    
-                    st.markdown("---")
+                            # Alerta de cuello de botella
+                            cuello = metricas.get('cuello_botella')
+                            if cuello:
+                                st.warning(f"⚠️ Cuello de botella identificado: **{cuello}** - Considera redistribuir carga")
                     
-                    # Análisis de cumplimiento
-                    st.subheader("🎯 Análisis de Cumplimiento")
+                        st.markdown("---")
                     
-                    col_a, col_b, col_c = st.columns(3)
+                        # Análisis de cumplimiento
+                        st.subheader("🎯 Análisis de Cumplimiento")
                     
-                    with col_a:
-                        st.metric("A Tiempo", metricas['tareas_a_tiempo'], 
-                                delta=f"{metricas['tareas_a_tiempo']/metricas['total_tareas']*100:.0f}%")
+                        col_a, col_b, col_c = st.columns(3)
                     
-                    with col_b:
-                        st.metric("Retrasadas", metricas['tareas_retrasadas'],
-                                delta=f"-{metricas['tareas_retrasadas']/metricas['total_tareas']*100:.0f}%")
+                        with col_a:
+                            st.metric("A Tiempo", metricas['tareas_a_tiempo'], 
+                                    delta=f"{_pct(metricas['tareas_a_tiempo'], metricas['total_tareas']):.0f}%")
                     
-                    with col_c:
-                        adelantadas = metricas.get('tareas_adelantadas', 0)
-                        st.metric("Adelantadas", adelantadas)
+                        with col_b:
+                            st.metric("Retrasadas", metricas['tareas_retrasadas'],
+                                    delta=f"-{_pct(metricas['tareas_retrasadas'], metricas['total_tareas']):.0f}%")
                     
-                    # Comparativa planificado vs real (diagnóstico)
-                    with st.expander("🕒 Comparativa Planificado vs Real (diagnóstico)", expanded=False):
-                        ejecuciones_data = metricas.get('ejecuciones', [])
-                        if ejecuciones_data:
-                            from datetime import datetime
-                            from utils.kpi_calculator import KPIExporter
-                            
-                            # Obtener semana y año para construir datetimes planificados
-                            prog_info = obtener_programacion(prog_id)
-                            semana_prod = prog_info.get('semana_produccion') if prog_info else None
-                            anio_prod = prog_seleccionada.get('Año') if prog_seleccionada else None
-                            
-                            calc = KPIExporter()
-                            
-                            filas = []
-                            for e in ejecuciones_data:
-                                tarea = e.get('tarea_nombre', 'N/A')
-                                
-                                # Usar horas planificadas (HH:MM) en lugar de minutos lineales
-                                inicio_hora = e.get('inicio_hora')  # String HH:MM
-                                fin_hora = e.get('fin_hora')  # String HH:MM
-                                dia_nombre = e.get('dia_nombre')  # Ej: "Lun"
-                                dia_semana = e.get('dia_semana')  # 0=Lunes, etc
-                                
-                                # Construir datetime planificado desde hora, día, semana, año
-                                inicio_plan_dt = None
-                                fin_plan_dt = None
-                                if inicio_hora and fin_hora and dia_semana is not None and semana_prod and anio_prod:
-                                    try:
-                                        inicio_plan_dt = calc._construir_datetime_planificado(
-                                            inicio_hora, dia_semana, semana_prod, anio_prod
-                                        )
-                                        fin_plan_dt = calc._construir_datetime_planificado(
-                                            fin_hora, dia_semana, semana_prod, anio_prod
-                                        )
-                                    except Exception:
-                                        pass
-                                
-                                # Calcular duración planificada REAL desde los datetimes
-                                dur_plan_calculada = None
-                                if inicio_plan_dt and fin_plan_dt:
-                                    dur_plan_calculada = int((fin_plan_dt - inicio_plan_dt).total_seconds() / 60)
-                                
-                                # Horas reales
-                                ini_real = e.get('inicio_real')
-                                fin_real = e.get('fin_real')
-                                
-                                # Calcular duración real desde datetimes si están disponibles
-                                dur_real_calculada = None
-                                if ini_real and fin_real:
-                                    try:
-                                        if isinstance(ini_real, str):
-                                            ini_real_dt = datetime.fromisoformat(ini_real.replace('Z', '+00:00'))
-                                        else:
-                                            ini_real_dt = ini_real
-                                        
-                                        if isinstance(fin_real, str):
-                                            fin_real_dt = datetime.fromisoformat(fin_real.replace('Z', '+00:00'))
-                                        else:
-                                            fin_real_dt = fin_real
-                                        
-                                        if isinstance(ini_real_dt, datetime) and isinstance(fin_real_dt, datetime):
-                                            dur_real_calculada = int((fin_real_dt - ini_real_dt).total_seconds() / 60)
-                                    except Exception:
-                                        pass
-                                
-                                # IMPORTANTE: Calcular duración planificada desde inicio_hora y fin_hora
-                                # porque duracion_planificada de BD es la duración efectiva de trabajo (sin almuerzo)
-                                # pero inicio_hora/fin_hora reflejan el tiempo transcurrido TOTAL (puede incluir almuerzo si cruza)
-                                
-                                # Prioridad 1: Calcular desde datetime (más preciso, considera fechas completas)
-                                if dur_plan_calculada is None and inicio_hora and fin_hora:
-                                    # Prioridad 2: Calcular directamente desde HH:MM (mismo día)
-                                    try:
-                                        h_ini, m_ini = map(int, inicio_hora.split(':'))
-                                        h_fin, m_fin = map(int, fin_hora.split(':'))
-                                        minutos_inicio = h_ini * 60 + m_ini
-                                        minutos_fin = h_fin * 60 + m_fin
-                                        # Si cruza medianoche, ajustar (aunque no debería pasar en mismo día)
-                                        if minutos_fin < minutos_inicio:
-                                            minutos_fin += 24 * 60
-                                        dur_plan_calculada = minutos_fin - minutos_inicio
-                                    except Exception:
-                                        pass
-                                
-                                # SIEMPRE usar cálculo desde horas cuando esté disponible
-                                # Esto garantiza que duración planificada = diferencia entre fin_hora e inicio_hora
-                                if dur_plan_calculada is not None:
-                                    dur_plan = dur_plan_calculada
-                                elif inicio_hora and fin_hora and ':' in inicio_hora and ':' in fin_hora:
-                                    # Calcular directamente desde horas (fallback si datetime no funcionó)
-                                    try:
-                                        h_ini, m_ini = map(int, inicio_hora.split(':'))
-                                        h_fin, m_fin = map(int, fin_hora.split(':'))
-                                        dur_plan = (h_fin * 60 + m_fin) - (h_ini * 60 + m_ini)
-                                        if dur_plan < 0:
-                                            dur_plan += 24 * 60  # Ajuste si cruza medianoche
-                                    except:
-                                        dur_plan = e.get('duracion_planificada', 0)
-                                else:
-                                    # Último recurso: usar duracion_planificada de BD
-                                    dur_plan = e.get('duracion_planificada', 0)
-                                dur_real = dur_real_calculada if dur_real_calculada is not None else e.get('duracion_real', 0)
-                                
-                                desv_bd = e.get('desviacion_duracion')
-                                tiempo_paradas = e.get('tiempo_paradas', 0) or 0
-                                
-                                # Calcular desviación desde duraciones calculadas
-                                # NOTA: La desviación se calcula comparando duración real vs planificada
-                                # PERO la desviación de BD compara contra duración original de tabla 'tareas'
-                                # Para esta tabla de diagnóstico, comparamos duraciones de inicio/fin
-                                desv_calculada = None
-                                if dur_real > 0 and dur_plan is not None:
-                                    dur_real_sin_paradas = max(0, dur_real - tiempo_paradas)
-                                    desv_calculada = dur_real_sin_paradas - dur_plan
-                                
-                                # Usar desviación calculada para esta tabla
-                                desv_final = desv_calculada if desv_calculada is not None else desv_bd
-                                
-                                # Formatear fechas/horas si existen
-                                def fmt(dt):
-                                    try:
-                                        if isinstance(dt, str):
-                                            dt = datetime.fromisoformat(dt.replace('Z', '+00:00'))
-                                        return dt.strftime('%Y-%m-%d %H:%M') if dt else ''
-                                    except Exception:
-                                        return str(dt) if dt else ''
-                                
-                                # Formatear hora planificada (mostrar día + fecha completa)
-                                def fmt_plan(dt, dia_nom):
-                                    if dt:
-                                        return f"{dia_nom if dia_nom else ''} {fmt(dt)}".strip()
-                                    elif inicio_hora and dia_nom:
-                                        return f"{dia_nom} {inicio_hora}"
-                                    return ''
-                                
-                                # Mostrar hora planificada usando inicio_hora y fin_hora (HH:MM)
-                                inicio_plan_str = fmt_plan(inicio_plan_dt, dia_nombre) if inicio_plan_dt else (f"{dia_nombre} {inicio_hora}" if inicio_hora and dia_nombre else '')
-                                fin_plan_str = fmt_plan(fin_plan_dt, dia_nombre) if fin_plan_dt else (f"{dia_nombre} {fin_hora}" if fin_hora and dia_nombre else '')
-                                
-                                # Obtener operador ejecutor
-                                operador_ejecutor = e.get('operador_ejecutor', 'N/A')
-                                
-                                filas.append({
-                                    'Tarea': tarea,
-                                    'Día': dia_nombre or '',
-                                    'Inicio Plan.': inicio_plan_str,
-                                    'Fin Plan.': fin_plan_str,
-                                    'Duración Plan. (min)': dur_plan if dur_plan is not None else '',
-                                    'Inicio Real': fmt(ini_real),
-                                    'Fin Real': fmt(fin_real),
-                                    'Duración Real (min)': dur_real if dur_real is not None else '',
-                                    'Operador': operador_ejecutor if operador_ejecutor else 'N/A',
-                                    'Tiempo Paradas (min)': tiempo_paradas,
-                                    'Desv. Duración (min)': round(desv_final, 1) if desv_final is not None else '',
-                                })
-                            
-                            if filas:
-                                df_comp = pd.DataFrame(filas)
-                                st.dataframe(df_comp, use_container_width=True, hide_index=True)
-                                
-                                # Mostrar resumen estadístico
-                                st.caption("📊 **Resumen:**")
-                                col_res1, col_res2, col_res3 = st.columns(3)
-                                
-                                with col_res1:
-                                    desv_mean = df_comp['Desv. Duración (min)'].dropna().mean() if 'Desv. Duración (min)' in df_comp else None
-                                    if desv_mean is not None and not df_comp['Desv. Duración (min)'].dropna().empty:
-                                        st.metric("Desv. Promedio", f"{desv_mean:.1f} min")
-                                    else:
-                                        st.metric("Desv. Promedio", "N/A")
-                                
-                                with col_res2:
-                                    desv_max = df_comp['Desv. Duración (min)'].dropna().abs().max() if 'Desv. Duración (min)' in df_comp else None
-                                    if desv_max is not None and not df_comp['Desv. Duración (min)'].dropna().empty:
-                                        st.metric("Desv. Máxima", f"{desv_max:.1f} min")
-                                    else:
-                                        st.metric("Desv. Máxima", "N/A")
-                                
-                                with col_res3:
-                                    fuera_tolerancia = (df_comp['Desv. Duración (min)'].dropna().abs() > 5).sum() if 'Desv. Duración (min)' in df_comp else 0
-                                    st.metric("Fuera Tolerancia (±5min)", fuera_tolerancia)
-                                
-                                st.info("ℹ️ **Horas Planificadas:** Se usan las horas optimizadas (formato HH:MM) de la tabla TareaPlanificada, "
-                                       "no minutos lineales. Las desviaciones se calculan usando la duración de la tabla 'Tareas' original.")
-                            else:
-                                st.info("No hay ejecuciones para comparar.")
-                        else:
-                            st.info("No hay datos de ejecuciones disponibles")
+                        with col_c:
+                            adelantadas = metricas.get('tareas_adelantadas', 0)
+                            st.metric("Adelantadas", adelantadas)
                     
-                else:
-                    st.info("📭 No hay datos de ejecución real para esta programación")
-                    st.caption("💡 Registra tiempos reales en el tab 'Tracking' para ver métricas")
+                        # Comparativa planificado vs real (diagnóstico)
+                        _comparativa_fragment(metricas.get('ejecuciones', []), prog_id, prog_seleccionada)
         
         except Exception as e:
             st.error(f"Error en dashboard: {e}")
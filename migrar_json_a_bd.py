@@ -18,12 +18,12 @@ if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
 from modelos.database import (
-    db_manager, crear_maquina, crear_operador,
+    db_manager, crear_maquinas_bulk, crear_operadores_bulk,
     inicializar_datos_default, obtener_estadisticas_generales
 )
 
 def migrar_configuracion_json():
-    """Migrar configuración desde JSON a BD"""
+    """Migrar configuración desde JSON a BD; devuelve el resumen por recurso (None si se usan los defaults)"""
     
     config_path = 'datos/configuracion.json'
     
@@ -31,54 +31,88 @@ def migrar_configuracion_json():
         print(f"⚠️ No se encontró {config_path}")
         print("   Usando configuración por defecto...")
         inicializar_datos_default()
-        return
+        return None
     
     print(f"📂 Leyendo configuración desde {config_path}...")
     
+    # El archivo es pequeño: una sola lectura y se conservan solo las secciones usadas
     with open(config_path, 'r', encoding='utf-8') as f:
         config = json.load(f)
+    recursos = config.get('recursos', {})
+    costos = config.get('costos', {})
+    del config
+    resumen = {}
     
-    # Migrar máquinas
-    if 'recursos' in config and 'maquinas' in config['recursos']:
+    # Migrar máquinas (un solo UPSERT: las existentes se actualizan con los datos del JSON)
+    if 'maquinas' in recursos:
         print("\n🔧 Migrando máquinas...")
-        for maq in config['recursos']['maquinas']:
-            try:
-                crear_maquina(
-                    id=maq['id'],
-                    nombre=maq['nombre'],
-                    capacidad=maq.get('capacidad', 1),
-                    tiempo_setup=maq.get('tiempo_setup', 0),
-                    costo_por_hora=config.get('costos', {}).get('costo_por_hora_maquina', {}).get(maq['id'], 50.0)
-                )
-                print(f"  ✅ {maq['id']}: {maq['nombre']}")
-            except Exception as e:
-                print(f"  ⚠️ {maq['id']} ya existe o error: {e}")
-    
-    # Migrar operadores
-    if 'recursos' in config and 'operadores' in config['recursos']:
+        costo_maquina = costos.get('costo_por_hora_maquina', {})
+        filas = [
+            {
+                'id': maq['id'],
+                'nombre': maq['nombre'],
+                'capacidad': maq.get('capacidad', 1),
+                'tiempo_setup_default': maq.get('tiempo_setup', 0),
+                'costo_por_hora': costo_maquina.get(maq['id'], 50.0)
+            }
+            for maq in recursos['maquinas']
+        ]
+        try:
+            insertadas, existentes = crear_maquinas_bulk(filas, actualizar_existentes=True)
+            resumen['maquinas'] = {'insertadas': insertadas, 'existentes': existentes}
+            for fila in filas:
+                print(f"  ✅ {fila['id']}: {fila['nombre']}")
+        except Exception as e:
+            print(f"  ⚠️ Error migrando máquinas: {e}")
+    
+    # Migrar operadores (un solo UPSERT: los existentes se actualizan con los datos del JSON)
+    if 'operadores' in recursos:
         print("\n👷 Migrando operadores...")
-        for op in config['recursos']['operadores']:
-            try:
-                crear_operador(
-                    id=op['id'],
-                    nombre=op['nombre'],
-                    habilidades=op.get('habilidades', []),
-                    costo_por_hora=config.get('costos', {}).get('costo_por_hora_operador', 25.0)
-                )
-                print(f"  ✅ {op['id']}: {op['nombre']}")
-            except Exception as e:
-                print(f"  ⚠️ {op['id']} ya existe o error: {e}")
+        costo_operador = costos.get('costo_por_hora_operador', 25.0)
+        filas = [
+            {
+                'id': op['id'],
+                'nombre': op['nombre'],
+                'habilidades': op.get('habilidades', []),
+                'costo_por_hora': costo_operador
+            }
+            for op in recursos['operadores']
+        ]
+        try:
+            insertados, existentes = crear_operadores_bulk(filas, actualizar_existentes=True)
+            resumen['operadores'] = {'insertadas': insertados, 'existentes': existentes}
+            for fila in filas:
+                print(f"  ✅ {fila['id']}: {fila['nombre']}")
+        except Exception as e:
+            print(f"  ⚠️ Error migrando operadores: {e}")
     
     print("\n✅ Migración de configuración completada")
+    return resumen
 
 
-def verificar_migracion():
-    """Verificar que la migración fue exitosa"""
+def verificar_migracion(resumen=None):
+    """Verificar que la migración fue exitosa (consulta la BD solo si no hay resumen de la migración)"""
     
     print("\n" + "="*60)
     print("📊 VERIFICACIÓN DE MIGRACIÓN")
     print("="*60)
     
+    if resumen is not None:
+        # Tras el UPSERT todas las filas del JSON están en la BD: no hace falta volver a contar
+        total_maquinas = sum(resumen.get('maquinas', {}).values())
+        total_operadores = sum(resumen.get('operadores', {}).values())
+        
+        print("\nResumen de la migración:")
+        for recurso, etiqueta in (('maquinas', 'Máquinas'), ('operadores', 'Operadores')):
+            conteo = resumen.get(recurso, {'insertadas': 0, 'existentes': 0})
+            print(f"  • {etiqueta}: {conteo['insertadas']} nuevas, {conteo['existentes']} actualizadas")
+        
+        if total_maquinas >= 3 and total_operadores >= 3:
+            print("\n✅ Migración exitosa - Base de datos lista para usar")
+            return True
+        print("\n⚠️ Advertencia: Faltan datos básicos")
+        return False
+    
     stats = obtener_estadisticas_generales()
     
     print("\nEstadísticas del sistema:")
@@ -110,11 +144,11 @@ def main():
     
     # 2. Migrar configuración
     print("\n2️⃣ Migrando configuración desde JSON...")
-    migrar_configuracion_json()
+    resumen = migrar_configuracion_json()
     
     # 3. Verificar
     print("\n3️⃣ Verificando migración...")
-    exito = verificar_migracion()
+    exito = verificar_migracion(resumen)
     
     if exito:
         print("\n" + "="*60)
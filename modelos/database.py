@@ -5,20 +5,30 @@ Capa de Persistencia - Optimizador de Producción v1.3
 Operaciones CRUD y funciones de acceso a datos
 """
 
-from sqlalchemy import create_engine, and_, or_, func
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy import literal, select, insert, update, delete, lambda_stmt, and_, or_, func, case, cast, type_coerce, Integer, String, DateTime
+from sqlalchemy.orm import sessionmaker, scoped_session, Session, joinedload, selectinload, contains_eager, defer
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import contextmanager
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from typing import List, Optional, Dict, Any, Iterator, Tuple
+from datetime import date, datetime, timedelta, time
+from functools import wraps
+from time import monotonic
 import json
 import logging
+import os
+import threading
 
 from modelos.database_models import (
     Base, Maquina, Operador, Trabajo, Tarea,
     Programacion, TareaPlanificada, EjecucionReal,
     MetricaCalculada, ConfiguracionSistema,
-    EstadoProgramacion, EstadoTarea
+    EstadoProgramacion, EstadoTarea, _make_engine,
+    crear_esquema, _parametros_kpi
 )
+from utils.kpi_calculator import KPIExporter
+from utils.kpi_kernels import utilizacion_ponderada, calentar_kernels
 
 logger = logging.getLogger(__name__)
 
@@ -37,14 +47,32 @@ class DatabaseManager:
         Args:
             database_url: URL de conexión (por defecto SQLite)
         """
-        self.engine = create_engine(database_url, echo=False)
-        self.SessionLocal = sessionmaker(bind=self.engine)
+        # Pool LIFO: se reutiliza primero la conexión más reciente (caché de SQLite caliente)
+        # (_make_engine fija echo, la caché de sentencias y, en SQLite, los PRAGMAs por conexión)
+        if database_url.startswith('sqlite'):
+            self.engine = _make_engine(
+                database_url,
+                connect_args={'timeout': 30},
+                pool_use_lifo=True
+            )
+        else:
+            self.engine = _make_engine(
+                database_url,
+                pool_size=5, max_overflow=10,
+                pool_pre_ping=True, pool_use_lifo=True, pool_recycle=3600
+            )
+        # Sin autoflush (las funciones que necesitan el INSERT antes de consultar hacen flush
+        # explícito) y sin expirar atributos al confirmar: los objetos devueltos tras el commit
+        # se leen sin volver a consultar la BD
+        self.SessionLocal = sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)
+        # Sesión reutilizada por hilo para lecturas (sin commit)
+        self.ScopedSession = scoped_session(self.SessionLocal)
         
     def crear_tablas(self):
         """Crear todas las tablas si no existen"""
-        Base.metadata.create_all(self.engine)
+        crear_esquema(self.engine)
         logger.info("✅ Tablas creadas/verificadas")
-        
+    
     def eliminar_tablas(self):
         """CUIDADO: Eliminar todas las tablas"""
         Base.metadata.drop_all(self.engine)
@@ -63,12 +91,68 @@ class DatabaseManager:
             raise
         finally:
             session.close()
+    
+    @contextmanager
+    def get_readonly_session(self) -> Session:
+        """Context manager de solo lectura: reutiliza la sesión del hilo y no hace commit"""
+        session = self.ScopedSession()
+        try:
+            yield session
+        finally:
+            # Cierra la transacción de lectura y libera la conexión; la sesión se reutiliza
+            session.close()
 
 
 # Instancia global
 db_manager = DatabaseManager()
 
 
+def _parsear_hora(hora_str: Optional[str]) -> Optional[time]:
+    """Convertir hora 'HH:MM' a objeto time (None si falta o es inválida)"""
+    if not hora_str:
+        return None
+    try:
+        return time.fromisoformat(hora_str)
+    except (ValueError, TypeError):
+        pass
+    # Horas sin cero a la izquierda ('8:00') que fromisoformat no acepta
+    try:
+        return datetime.strptime(hora_str, '%H:%M').time()
+    except (ValueError, TypeError):
+        return None
+
+
+# Caché en memoria con TTL corto para máquinas/operadores (cambian poco y se leen en cada rerun).
+# Se invalida en cada alta/modificación de recursos.
+_RECURSOS_TTL = 30  # segundos
+_recursos_cache: Dict[tuple, tuple] = {}
+_recursos_lock = threading.RLock()
+
+
+def _cache_recursos(funcion):
+    """Cachear el resultado de una lectura de recursos por (función, solo_disponibles)"""
+    @wraps(funcion)
+    def wrapper(solo_disponibles: bool = False) -> List[Dict]:
+        clave = (funcion.__name__, solo_disponibles)
+        with _recursos_lock:
+            entrada = _recursos_cache.get(clave)
+        if entrada and monotonic() - entrada[0] < _RECURSOS_TTL:
+            filas = entrada[1]
+        else:
+            filas = funcion(solo_disponibles)
+            with _recursos_lock:
+                _recursos_cache[clave] = (monotonic(), filas)
+        # Copias: los llamadores pueden modificar los dicts sin alterar la caché
+        return [dict(fila) for fila in filas]
+    return wrapper
+
+
+def _invalidar_cache_recursos():
+    """Vaciar la caché de máquinas/operadores"""
+    with _recursos_lock:
+        _recursos_cache.clear()
+
+
 # ============================================================================
 # CRUD - MÁQUINAS
 # ============================================================================
@@ -85,36 +169,88 @@ def crear_maquina(id: str, nombre: str, capacidad: int = 1,
             costo_por_hora=costo_por_hora
         )
         session.add(maquina)
-        session.commit()
-        logger.info(f"✅ Máquina creada: {id}")
-        return id
+    # get_session() hace commit al salir del bloque
+    _invalidar_cache_recursos()
+    logger.info(f"✅ Máquina creada: {id}")
+    return id
+
+
+# INSERT de cada dialecto con soporte de ON CONFLICT DO UPDATE (UPSERT)
+_INSERT_UPSERT = {
+    'sqlite': sqlite_insert,
+    'postgresql': postgresql_insert,
+}
+
+
+def _insertar_filas(session: Session, modelo, filas: List[Dict],
+                    actualizar_existentes: bool) -> Tuple[int, int]:
+    """INSERT masivo de filas; con actualizar_existentes hace UPSERT por id (ON CONFLICT DO UPDATE)"""
+    # Ids ya presentes (búsqueda por clave primaria) para poder informar insertadas/existentes
+    ids = [fila['id'] for fila in filas]
+    existentes = len(session.execute(select(modelo.id).where(modelo.id.in_(ids))).all())
+    if actualizar_existentes:
+        dialecto = session.get_bind().dialect.name
+        if dialecto not in _INSERT_UPSERT:
+            raise NotImplementedError(f"UPSERT no soportado para el dialecto '{dialecto}'")
+        stmt = _INSERT_UPSERT[dialecto](modelo)
+        columnas = {columna for fila in filas for columna in fila} - {'id'}
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['id'],
+            set_={columna: stmt.excluded[columna] for columna in columnas}
+        )
+    else:
+        stmt = insert(modelo)
+    # Statement compilado una sola vez y ejecutado con todas las filas (executemany)
+    session.execute(stmt, filas)
+    return len(filas) - existentes, existentes
+
+
+def crear_maquinas_bulk(maquinas: List[Dict], actualizar_existentes: bool = False) -> Tuple[int, int]:
+    """
+    Crear varias máquinas en una sola transacción
+    
+    Args:
+        maquinas: Lista de dicts con columnas de Maquina (id, nombre, capacidad,
+                  tiempo_setup_default, costo_por_hora)
+        actualizar_existentes: Si True, las máquinas que ya existen se actualizan (UPSERT)
+                               en lugar de fallar con IntegrityError (SQLite y PostgreSQL;
+                               en otros dialectos lanza NotImplementedError)
+    
+    Returns:
+        Tuple[int, int]: (máquinas insertadas, máquinas que ya existían)
+    """
+    with db_manager.get_session() as session:
+        insertadas, existentes = _insertar_filas(session, Maquina, maquinas, actualizar_existentes)
+    _invalidar_cache_recursos()
+    logger.info(f"✅ {insertadas} máquinas creadas, {existentes} ya existían")
+    return insertadas, existentes
 
 
 def obtener_maquina(id: str) -> Optional[Maquina]:
     """Obtener máquina por ID"""
-    with db_manager.get_session() as session:
-        return session.query(Maquina).filter(Maquina.id == id).first()
+    # lambda_stmt: la construcción y la clave de caché del SELECT se reutilizan entre llamadas
+    stmt = lambda_stmt(lambda: select(Maquina).where(Maquina.id == id))
+    with db_manager.get_readonly_session() as session:
+        return session.execute(stmt).scalars().first()
 
 
+@_cache_recursos
 def obtener_todas_maquinas(solo_disponibles: bool = False) -> List[Dict]:
     """Obtener todas las máquinas como diccionarios"""
-    with db_manager.get_session() as session:
-        query = session.query(Maquina)
-        if solo_disponibles:
-            query = query.filter(Maquina.disponible == True)
-        maquinas = query.all()
-        
-        return [
-            {
-                'id': m.id,
-                'nombre': m.nombre,
-                'capacidad': m.capacidad,
-                'tiempo_setup_default': m.tiempo_setup_default,
-                'disponible': m.disponible,
-                'costo_por_hora': m.costo_por_hora
-            }
-            for m in maquinas
-        ]
+    # SELECT de columnas (sin hidratar objetos ORM): cada fila se convierte directo a dict
+    stmt = select(
+        Maquina.id,
+        Maquina.nombre,
+        Maquina.capacidad,
+        Maquina.tiempo_setup_default,
+        Maquina.disponible,
+        Maquina.costo_por_hora
+    )
+    if solo_disponibles:
+        stmt = stmt.where(Maquina.disponible == True)
+    
+    with db_manager.get_readonly_session() as session:
+        return [dict(row) for row in session.execute(stmt).mappings()]
 
 
 def actualizar_maquina(id: str, **kwargs) -> bool:
@@ -126,6 +262,7 @@ def actualizar_maquina(id: str, **kwargs) -> bool:
                 if hasattr(maquina, key):
                     setattr(maquina, key, value)
             session.commit()
+            _invalidar_cache_recursos()
             logger.info(f"✅ Máquina actualizada: {id}")
             return True
         return False
@@ -142,38 +279,61 @@ def crear_operador(id: str, nombre: str, habilidades: List[str],
         operador = Operador(
             id=id,
             nombre=nombre,
-            habilidades=json.dumps(habilidades),
+            habilidades=habilidades,
             costo_por_hora=costo_por_hora
         )
         session.add(operador)
-        session.commit()
-        logger.info(f"✅ Operador creado: {id}")
-        return id
+    _invalidar_cache_recursos()
+    logger.info(f"✅ Operador creado: {id}")
+    return id
+
+
+def crear_operadores_bulk(operadores: List[Dict], actualizar_existentes: bool = False) -> Tuple[int, int]:
+    """
+    Crear varios operadores en una sola transacción
+    
+    Args:
+        operadores: Lista de dicts con columnas de Operador (id, nombre,
+                    habilidades como lista, costo_por_hora)
+        actualizar_existentes: Si True, los operadores que ya existen se actualizan (UPSERT)
+                               en lugar de fallar con IntegrityError (SQLite y PostgreSQL;
+                               en otros dialectos lanza NotImplementedError)
+    
+    Returns:
+        Tuple[int, int]: (operadores insertados, operadores que ya existían)
+    """
+    with db_manager.get_session() as session:
+        insertados, existentes = _insertar_filas(session, Operador, operadores, actualizar_existentes)
+    _invalidar_cache_recursos()
+    logger.info(f"✅ {insertados} operadores creados, {existentes} ya existían")
+    return insertados, existentes
 
 
 def obtener_operador(id: str) -> Optional[Operador]:
     """Obtener operador por ID"""
-    with db_manager.get_session() as session:
-        return session.query(Operador).filter(Operador.id == id).first()
+    stmt = lambda_stmt(lambda: select(Operador).where(Operador.id == id))
+    with db_manager.get_readonly_session() as session:
+        return session.execute(stmt).scalars().first()
 
 
+@_cache_recursos
 def obtener_todos_operadores(solo_disponibles: bool = False) -> List[Dict]:
     """Obtener todos los operadores como diccionarios"""
-    with db_manager.get_session() as session:
-        query = session.query(Operador)
-        if solo_disponibles:
-            query = query.filter(Operador.disponible == True)
-        operadores = query.all()
-        
+    # SELECT de columnas (sin hidratar objetos ORM); habilidades se deserializa por el tipo JSON
+    stmt = select(
+        Operador.id,
+        Operador.nombre,
+        Operador.habilidades,
+        Operador.disponible,
+        Operador.costo_por_hora
+    )
+    if solo_disponibles:
+        stmt = stmt.where(Operador.disponible == True)
+    
+    with db_manager.get_readonly_session() as session:
         return [
-            {
-                'id': op.id,
-                'nombre': op.nombre,
-                'habilidades': op.habilidades,
-                'disponible': op.disponible,
-                'costo_por_hora': op.costo_por_hora
-            }
-            for op in operadores
+            {**row, 'habilidades': row['habilidades'] or []}
+            for row in session.execute(stmt).mappings()
         ]
 
 
@@ -193,9 +353,8 @@ def crear_trabajo(id: str, nombre: str, descripcion: str = "",
             fecha_entrega_deseada=fecha_entrega
         )
         session.add(trabajo)
-        session.commit()
-        logger.info(f"✅ Trabajo creado: {id}")
-        return id
+    logger.info(f"✅ Trabajo creado: {id}")
+    return id
 
 
 def crear_tarea(id: str, trabajo_id: str, nombre: str, duracion: int,
@@ -212,26 +371,28 @@ def crear_tarea(id: str, trabajo_id: str, nombre: str, duracion: int,
             orden=orden
         )
         session.add(tarea)
-        session.commit()
-        logger.info(f"✅ Tarea creada: {id}")
-        return id
+    logger.info(f"✅ Tarea creada: {id}")
+    return id
 
 
 def obtener_trabajo(id: str) -> Optional[Trabajo]:
     """Obtener trabajo por ID con sus tareas"""
-    with db_manager.get_session() as session:
-        return session.query(Trabajo).filter(Trabajo.id == id).first()
+    with db_manager.get_readonly_session() as session:
+        # Tareas cargadas con un solo SELECT ... IN para que sigan accesibles fuera de la sesión
+        return session.query(Trabajo).options(
+            selectinload(Trabajo.tareas)
+        ).filter(Trabajo.id == id).first()
 
 
 def obtener_todos_trabajos() -> List[Trabajo]:
     """Obtener todos los trabajos"""
-    with db_manager.get_session() as session:
+    with db_manager.get_readonly_session() as session:
         return session.query(Trabajo).all()
 
 
 def obtener_tareas_trabajo(trabajo_id: str) -> List[Tarea]:
     """Obtener todas las tareas de un trabajo"""
-    with db_manager.get_session() as session:
+    with db_manager.get_readonly_session() as session:
         return session.query(Tarea).filter(
             Tarea.trabajo_id == trabajo_id
         ).order_by(Tarea.orden).all()
@@ -241,6 +402,11 @@ def obtener_tareas_trabajo(trabajo_id: str) -> List[Tarea]:
 # CRUD - PROGRAMACIONES
 # ============================================================================
 
+# Formato de ID de programación: PROG-2025-W42-001 (prefijo por semana + número secuencial)
+_PROG_ID_PREFIJO_FMT = "PROG-%d-W%02d-"
+_PROG_ID_FMT = _PROG_ID_PREFIJO_FMT + "%03d"
+
+
 def crear_programacion(semana: int, anio: int, objetivo: str,
                       num_trabajos: int, num_tareas: int,
                       makespan: int, tiempo_resolucion: float,
@@ -264,28 +430,23 @@ def crear_programacion(semana: int, anio: int, objetivo: str,
         str: ID de la programación creada
     """
     with db_manager.get_session() as session:
-        # Generar ID único buscando el máximo número usado
-        programaciones_existentes = session.query(Programacion).filter(
+        # Generar ID único: máximo número usado en la semana (calculado en SQL)
+        # Formato: PROG-2025-W42-001 → el número es lo que sigue al prefijo
+        prefijo = _PROG_ID_PREFIJO_FMT % (anio, semana)
+        max_numero = session.query(
+            func.max(cast(func.substr(Programacion.id, len(prefijo) + 1), Integer))
+        ).filter(
             and_(
                 Programacion.semana_produccion == semana,
-                Programacion.anio == anio
+                Programacion.anio == anio,
+                Programacion.id.like(f"{prefijo}%")
             )
-        ).all()
-        
-        # Extraer números de IDs existentes y encontrar el máximo
-        numeros_usados = []
-        for p in programaciones_existentes:
-            # Formato: PROG-2025-W42-001 → extraer el 001
-            try:
-                numero = int(p.id.split('-')[-1])
-                numeros_usados.append(numero)
-            except:
-                pass
+        ).scalar()
         
         # Siguiente número disponible
-        siguiente_numero = max(numeros_usados) + 1 if numeros_usados else 1
+        siguiente_numero = (max_numero or 0) + 1
         
-        prog_id = f"PROG-{anio}-W{semana:02d}-{siguiente_numero:03d}"
+        prog_id = _PROG_ID_FMT % (anio, semana, siguiente_numero)
         
         programacion = Programacion(
             id=prog_id,
@@ -298,13 +459,13 @@ def crear_programacion(semana: int, anio: int, objetivo: str,
             num_trabajos=num_trabajos,
             num_tareas=num_tareas,
             usuario_creador=usuario,
-            configuracion_json=json.dumps(configuracion) if configuracion else None
+            configuracion_json=json.dumps(configuracion) if configuracion else None,
+            **_parametros_kpi(configuracion or {})
         )
         
         session.add(programacion)
-        session.commit()
-        logger.info(f"✅ Programación creada: {prog_id}")
-        return prog_id  # Retornar solo el ID, no el objeto
+    logger.info(f"✅ Programación creada: {prog_id}")
+    return prog_id  # Retornar solo el ID, no el objeto
 
 
 def aprobar_programacion(prog_id: str, aprobada_por: str) -> bool:
@@ -319,18 +480,85 @@ def aprobar_programacion(prog_id: str, aprobada_por: str) -> bool:
         bool: True si se aprobó exitosamente
     """
     with db_manager.get_session() as session:
-        prog = session.query(Programacion).filter(Programacion.id == prog_id).first()
+        # UPDATE directo (sin cargar la fila); rowcount indica si existía
+        resultado = session.execute(
+            update(Programacion)
+            .where(Programacion.id == prog_id)
+            .values(
+                estado=EstadoProgramacion.PLANIFICADA,
+                aprobada_por=aprobada_por,
+                fecha_aprobacion=datetime.now()
+            )
+        )
         
-        if prog:
-            prog.estado = EstadoProgramacion.PLANIFICADA
-            prog.aprobada_por = aprobada_por
-            prog.fecha_aprobacion = datetime.now()
-            session.commit()
+        if resultado.rowcount:
             logger.info(f"✅ Programación aprobada: {prog_id} por {aprobada_por}")
             return True
         return False
 
 
+def aprobar_programaciones_bulk(prog_ids: List[str], aprobada_por: str) -> int:
+    """
+    Aprobar varias programaciones en una sola transacción
+    
+    Args:
+        prog_ids: IDs de las programaciones
+        aprobada_por: Usuario que aprueba
+        
+    Returns:
+        int: Número de programaciones aprobadas (las que no están en un estado que
+             admita la aprobación se omiten y se registran en el log)
+    """
+    if not prog_ids:
+        return 0
+    
+    # Solo se aprueban las programaciones cuyo estado admite pasar a PLANIFICADA
+    filtro = and_(
+        Programacion.id.in_(prog_ids),
+        Programacion.estado.in_(_ESTADOS_ORIGEN_APROBACION)
+    )
+    # Un único UPDATE con la misma fecha de aprobación para todas
+    stmt = update(Programacion).where(filtro).values(
+        estado=EstadoProgramacion.PLANIFICADA,
+        aprobada_por=aprobada_por,
+        fecha_aprobacion=datetime.now()
+    )
+    with db_manager.get_session() as session:
+        if session.get_bind().dialect.update_returning:
+            aprobadas = set(session.execute(stmt.returning(Programacion.id)).scalars())
+        else:
+            aprobadas = set(session.execute(select(Programacion.id).where(filtro)).scalars())
+            session.execute(stmt)
+    
+    omitidas = [prog_id for prog_id in prog_ids if prog_id not in aprobadas]
+    if omitidas:
+        logger.warning(f"⚠️ Programaciones no aprobadas (no existen o su estado no lo permite): {omitidas}")
+    logger.info(f"✅ {len(aprobadas)} programaciones aprobadas por {aprobada_por}")
+    return len(aprobadas)
+
+
+# Transiciones de estado válidas (estado actual → estados destino permitidos)
+_TRANSICIONES_VALIDAS: Dict[EstadoProgramacion, frozenset] = {
+    EstadoProgramacion.SIMULACION: frozenset({EstadoProgramacion.PLANIFICADA, EstadoProgramacion.CANCELADA}),
+    EstadoProgramacion.PLANIFICADA: frozenset({EstadoProgramacion.EN_EJECUCION, EstadoProgramacion.CANCELADA}),
+    EstadoProgramacion.EN_EJECUCION: frozenset({EstadoProgramacion.COMPLETADA}),
+    EstadoProgramacion.COMPLETADA: frozenset(),  # No se puede cambiar
+    EstadoProgramacion.CANCELADA: frozenset()    # No se puede cambiar
+}
+
+# Estados desde los que se puede aprobar (pasar a PLANIFICADA)
+_ESTADOS_ORIGEN_APROBACION = tuple(
+    actual for actual, destinos in _TRANSICIONES_VALIDAS.items()
+    if EstadoProgramacion.PLANIFICADA in destinos
+)
+
+# Texto de estados válidos por estado actual (para los mensajes de error), en orden de definición
+_ESTADOS_VALIDOS_STR: Dict[EstadoProgramacion, str] = {
+    actual: ", ".join(e.value for e in EstadoProgramacion if e in destinos)
+    for actual, destinos in _TRANSICIONES_VALIDAS.items()
+}
+
+
 def cambiar_estado_programacion(prog_id: str, nuevo_estado: EstadoProgramacion, 
                                usuario: str = None) -> tuple[bool, str]:
     """
@@ -352,36 +580,28 @@ def cambiar_estado_programacion(prog_id: str, nuevo_estado: EstadoProgramacion,
         tuple: (success: bool, mensaje: str)
     """
     with db_manager.get_session() as session:
-        prog = session.query(Programacion).filter(Programacion.id == prog_id).first()
+        # Solo se necesita el estado actual, no la fila completa
+        estado_actual = session.query(Programacion.estado).filter(Programacion.id == prog_id).scalar()
         
-        if not prog:
+        if estado_actual is None:
             return False, f"❌ Programación {prog_id} no encontrada"
         
-        estado_actual = prog.estado
-        
         # Validar transiciones de estado
-        transiciones_validas = {
-            EstadoProgramacion.SIMULACION: [EstadoProgramacion.PLANIFICADA, EstadoProgramacion.CANCELADA],
-            EstadoProgramacion.PLANIFICADA: [EstadoProgramacion.EN_EJECUCION, EstadoProgramacion.CANCELADA],
-            EstadoProgramacion.EN_EJECUCION: [EstadoProgramacion.COMPLETADA],
-            EstadoProgramacion.COMPLETADA: [],  # No se puede cambiar
-            EstadoProgramacion.CANCELADA: []    # No se puede cambiar
-        }
-        
-        if nuevo_estado not in transiciones_validas.get(estado_actual, []):
-            estados_validos = ", ".join([e.value for e in transiciones_validas.get(estado_actual, [])])
+        if nuevo_estado not in _TRANSICIONES_VALIDAS.get(estado_actual, frozenset()):
+            estados_validos = _ESTADOS_VALIDOS_STR.get(estado_actual, "")
             if not estados_validos:
                 return False, f"⛔ No se puede cambiar el estado de una programación '{estado_actual.value}'"
             return False, f"⚠️ Transición inválida: '{estado_actual.value}' → '{nuevo_estado.value}'. Estados válidos: {estados_validos}"
         
-        # Realizar el cambio
-        prog.estado = nuevo_estado
-        
-        # Actualizar campos adicionales según el nuevo estado
+        # Realizar el cambio (y campos adicionales según el nuevo estado) en un solo UPDATE
+        valores = {'estado': nuevo_estado}
         if nuevo_estado == EstadoProgramacion.PLANIFICADA and usuario:
-            prog.aprobada_por = usuario
-            prog.fecha_aprobacion = datetime.now()
+            valores['aprobada_por'] = usuario
+            valores['fecha_aprobacion'] = datetime.now()
         
+        session.execute(
+            update(Programacion).where(Programacion.id == prog_id).values(**valores)
+        )
         session.commit()
         
         # Si se marca como COMPLETADA, calcular y guardar KPIs automáticamente
@@ -431,8 +651,9 @@ def eliminar_programacion(prog_id: str, forzar: bool = False) -> tuple[bool, str
 
 def obtener_programacion(prog_id: str) -> Optional[Dict]:
     """Obtener programación por ID como diccionario"""
-    with db_manager.get_session() as session:
-        prog = session.query(Programacion).filter(Programacion.id == prog_id).first()
+    stmt = lambda_stmt(lambda: select(Programacion).where(Programacion.id == prog_id))
+    with db_manager.get_readonly_session() as session:
+        prog = session.execute(stmt).scalars().first()
         
         if not prog:
             return None
@@ -455,6 +676,48 @@ def obtener_programacion(prog_id: str) -> Optional[Dict]:
         }
 
 
+_COLUMNAS_PROGRAMACION = (
+    Programacion.id, Programacion.semana_produccion, Programacion.anio, Programacion.estado,
+    Programacion.objetivo_usado, Programacion.makespan_planificado, Programacion.num_trabajos,
+    Programacion.num_tareas, Programacion.fecha_creacion, Programacion.aprobada_por,
+    Programacion.usuario_creador, Programacion.tiempo_resolucion
+)
+
+
+def obtener_programaciones_iter(semana: int = None, anio: int = None,
+                                estado: EstadoProgramacion = None,
+                                limit: int = 50) -> Iterator[Dict]:
+    """
+    Iterar programaciones con filtros, leyendo de la BD en lotes de 100 filas
+    
+    Args:
+        semana: Filtrar por semana (opcional)
+        anio: Filtrar por año (opcional)
+        estado: Filtrar por estado (opcional)
+        limit: Número máximo de resultados
+        
+    Yields:
+        Dict: Programación como diccionario
+    """
+    # Cada combinación de filtros se cachea como un statement distinto
+    stmt = lambda_stmt(lambda: select(*_COLUMNAS_PROGRAMACION))
+    if semana:
+        stmt += lambda s: s.where(Programacion.semana_produccion == semana)
+    if anio:
+        stmt += lambda s: s.where(Programacion.anio == anio)
+    if estado:
+        stmt += lambda s: s.where(Programacion.estado == estado)
+    stmt += lambda s: s.order_by(Programacion.fecha_creacion.desc()).limit(limit)
+    
+    with db_manager.get_readonly_session() as session:
+        # Columnas sueltas (sin hidratar objetos ORM) y cursor en lotes
+        filas = session.execute(stmt, execution_options={'yield_per': 100}).mappings()
+        for fila in filas:
+            p = dict(fila)
+            p['estado'] = p['estado'].value if p['estado'] else None
+            yield p
+
+
 def obtener_programaciones(semana: int = None, anio: int = None,
                           estado: EstadoProgramacion = None,
                           limit: int = 50) -> List[Dict]:
@@ -470,41 +733,12 @@ def obtener_programaciones(semana: int = None, anio: int = None,
     Returns:
         List[Dict]: Lista de programaciones como diccionarios
     """
-    with db_manager.get_session() as session:
-        query = session.query(Programacion)
-        
-        if semana:
-            query = query.filter(Programacion.semana_produccion == semana)
-        if anio:
-            query = query.filter(Programacion.anio == anio)
-        if estado:
-            query = query.filter(Programacion.estado == estado)
-        
-        programaciones = query.order_by(Programacion.fecha_creacion.desc()).limit(limit).all()
-        
-        # Convertir a diccionarios dentro del contexto de sesión
-        return [
-            {
-                'id': p.id,
-                'semana_produccion': p.semana_produccion,
-                'anio': p.anio,
-                'estado': p.estado.value if p.estado else None,
-                'objetivo_usado': p.objetivo_usado,
-                'makespan_planificado': p.makespan_planificado,
-                'num_trabajos': p.num_trabajos,
-                'num_tareas': p.num_tareas,
-                'fecha_creacion': p.fecha_creacion,
-                'aprobada_por': p.aprobada_por,
-                'usuario_creador': p.usuario_creador,
-                'tiempo_resolucion': p.tiempo_resolucion
-            }
-            for p in programaciones
-        ]
+    return list(obtener_programaciones_iter(semana, anio, estado, limit))
 
 
 def obtener_programacion_activa() -> Optional[Dict]:
     """Obtener la programación actualmente en ejecución"""
-    with db_manager.get_session() as session:
+    with db_manager.get_readonly_session() as session:
         programacion = session.query(Programacion).filter(
             Programacion.estado == EstadoProgramacion.EN_EJECUCION
         ).first()
@@ -527,7 +761,7 @@ def obtener_programacion_activa() -> Optional[Dict]:
 
 def obtener_programaciones_activas() -> List[Dict]:
     """Obtener todas las programaciones activas (PLANIFICADA y EN_EJECUCION)"""
-    with db_manager.get_session() as session:
+    with db_manager.get_readonly_session() as session:
         programaciones = session.query(Programacion).filter(
             Programacion.estado.in_([EstadoProgramacion.PLANIFICADA, EstadoProgramacion.EN_EJECUCION])
         ).order_by(Programacion.semana_produccion.desc(), Programacion.anio.desc()).all()
@@ -549,7 +783,32 @@ def obtener_programaciones_activas() -> List[Dict]:
 # CRUD - TAREAS PLANIFICADAS
 # ============================================================================
 
-def crear_tarea_planificada(programacion_id: str, tarea_info: Dict) -> int:
+@contextmanager
+def _sesion(session: Optional[Session] = None):
+    """Reutilizar la sesión del llamador (él hace el commit) o abrir una propia con commit al salir"""
+    if session is not None:
+        yield session
+    else:
+        with db_manager.get_session() as propia:
+            yield propia
+
+
+def _tarea_id_base(tarea_id: str) -> str:
+    """ID de la tarea original a partir del de una parte (A2.P1 → A2)"""
+    # partition: un solo recorrido en C y sin lista intermedia (equivale a split('.')[0])
+    return tarea_id.partition('.')[0]
+
+
+def _duraciones_originales(session: Session, tareas_info: List[Dict]) -> Dict[str, int]:
+    """Duración de la tabla Tarea para cada ID base de las tareas (una sola consulta IN)"""
+    bases = {_tarea_id_base(info['tarea_id']) for info in tareas_info if info.get('tarea_id')}
+    if not bases:
+        return {}
+    return dict(session.execute(select(Tarea.id, Tarea.duracion).where(Tarea.id.in_(bases))).all())
+
+
+def crear_tarea_planificada(programacion_id: str, tarea_info: Dict,
+                            session: Optional[Session] = None) -> int:
     """
     Crear tarea planificada
     
@@ -560,51 +819,151 @@ def crear_tarea_planificada(programacion_id: str, tarea_info: Dict) -> int:
             - maquina_id, operador_id
             - inicio_planificado, fin_planificado
             - dia_semana, es_dividida, parte_numero, tiempo_setup
+        session: Sesión abierta del llamador para agrupar varias operaciones en una
+                 transacción (opcional; si se omite se abre y confirma una propia)
     
     Returns:
         int: ID de la tarea planificada creada
     """
-    with db_manager.get_session() as session:
+    with _sesion(session) as session:
+        # Duración original guardada al planificar: el registro de ejecuciones no vuelve a consultar Tarea
+        if 'duracion_original' not in tarea_info and tarea_info.get('tarea_id'):
+            duraciones = _duraciones_originales(session, [tarea_info])
+            tarea_info = dict(tarea_info, duracion_original=duraciones.get(_tarea_id_base(tarea_info['tarea_id'])))
         tarea = TareaPlanificada(
             programacion_id=programacion_id,
             **tarea_info
         )
         session.add(tarea)
-        session.commit()
-        session.refresh(tarea)
+        # El id queda asignado por el INSERT al hacer flush; leerlo antes del commit
+        # evita el SELECT de refresh (el commit expira los atributos)
+        session.flush()
         return tarea.id
 
 
-def obtener_tareas_planificadas(programacion_id: str) -> List[Dict]:
-    """Obtener todas las tareas de una programación como diccionarios"""
-    with db_manager.get_session() as session:
-        tareas = session.query(TareaPlanificada).filter(
-            TareaPlanificada.programacion_id == programacion_id
-        ).order_by(TareaPlanificada.inicio_planificado).all()
-        
-        return [
+# El scheduler lo ejecuta en cada guardado: la construcción y compilación del INSERT se reutilizan
+_INSERT_TAREA_PLANIFICADA = lambda_stmt(lambda: insert(TareaPlanificada))
+
+
+def crear_tareas_planificadas_bulk(programacion_id: str, tareas_info: List[Dict],
+                                   session: Optional[Session] = None) -> int:
+    """
+    Crear todas las tareas planificadas de una programación en una sola transacción
+    
+    Args:
+        programacion_id: ID de la programación
+        tareas_info: Lista de diccionarios con la misma forma que en crear_tarea_planificada
+        session: Sesión abierta del llamador (opcional)
+    
+    Returns:
+        int: Número de tareas planificadas creadas
+    """
+    if not tareas_info:
+        return 0
+    
+    with _sesion(session) as session:
+        # Duración original guardada al planificar: el registro de ejecuciones no vuelve a consultar Tarea
+        duraciones = _duraciones_originales(session, tareas_info)
+        filas = [
             {
-                'id': t.id,
-                'programacion_id': t.programacion_id,
-                'tarea_id': t.tarea_id,
-                'trabajo_id': t.trabajo_id,
-                'nombre': t.nombre,
-                'duracion_planificada': t.duracion_planificada,
-                'tiempo_setup': t.tiempo_setup,
-                'maquina_id': t.maquina_id,
-                'operador_id': t.operador_id,
-                'inicio_planificado': t.inicio_planificado,
-                'fin_planificado': t.fin_planificado,
-                'dia_semana': t.dia_semana,
-                'es_dividida': t.es_dividida,
-                'parte_numero': t.parte_numero,
-                # Campos procesados del UI
-                'inicio_hora': t.inicio_hora if hasattr(t, 'inicio_hora') else None,
-                'fin_hora': t.fin_hora if hasattr(t, 'fin_hora') else None,
-                'dia_nombre': t.dia_nombre if hasattr(t, 'dia_nombre') else None
+                'programacion_id': programacion_id,
+                'duracion_original': duraciones.get(_tarea_id_base(info['tarea_id'])) if info.get('tarea_id') else None,
+                **info
             }
-            for t in tareas
+            for info in tareas_info
         ]
+        # INSERT con SQL compilado cacheado (lambda_stmt) ejecutado con todas las filas: sin unit-of-work por objeto
+        session.execute(_INSERT_TAREA_PLANIFICADA, filas)
+    
+    logger.info(f"✅ {len(filas)} tareas planificadas creadas para {programacion_id}")
+    return len(filas)
+
+
+# Columnas de TareaPlanificada para listados (proyección Core: sin hidratar objetos ORM)
+_TP_COLS = (
+    TareaPlanificada.id, TareaPlanificada.programacion_id, TareaPlanificada.tarea_id,
+    TareaPlanificada.trabajo_id, TareaPlanificada.nombre, TareaPlanificada.duracion_planificada,
+    TareaPlanificada.tiempo_setup, TareaPlanificada.maquina_id, TareaPlanificada.operador_id,
+    TareaPlanificada.inicio_planificado, TareaPlanificada.fin_planificado, TareaPlanificada.dia_semana,
+    TareaPlanificada.es_dividida, TareaPlanificada.parte_numero,
+    # Campos procesados del UI
+    TareaPlanificada.inicio_hora, TareaPlanificada.fin_hora, TareaPlanificada.dia_nombre
+)
+_TP_KEYS = tuple(col.key for col in _TP_COLS)
+
+# Columnas de tareas pendientes etiquetadas con las claves del diccionario resultante
+_PENDIENTE_COLS = (
+    TareaPlanificada.id.label('tarea_planificada_id'), TareaPlanificada.tarea_id,
+    TareaPlanificada.maquina_id.label('maquina_planificada'),
+    TareaPlanificada.operador_id.label('operador_planificado'),
+    TareaPlanificada.inicio_planificado, TareaPlanificada.fin_planificado,
+    TareaPlanificada.inicio_hora, TareaPlanificada.fin_hora,  # Formato HH:MM ya calculado
+    TareaPlanificada.duracion_planificada, TareaPlanificada.dia_semana,
+    TareaPlanificada.dia_nombre,  # Ej: "Lun", "Mar"
+    TareaPlanificada.es_dividida, TareaPlanificada.parte_numero
+)
+_PENDIENTE_KEYS = tuple(col.key for col in _PENDIENTE_COLS)
+
+
+def obtener_tareas_planificadas(programacion_id: str) -> List[Dict]:
+    """Obtener todas las tareas de una programación como diccionarios"""
+    with db_manager.get_readonly_session() as session:
+        # yield_per: las filas llegan en lotes y la lista se construye incrementalmente
+        filas = session.execute(
+            select(*_TP_COLS)
+            .where(TareaPlanificada.programacion_id == programacion_id)
+            .order_by(TareaPlanificada.inicio_planificado),
+            execution_options={'yield_per': 1000}
+        )
+        
+        # Tuplas Core + claves precalculadas: sin objetos ORM ni claves literales por fila
+        return [dict(zip(_TP_KEYS, fila)) for fila in filas]
+
+
+# Enum de SQLAlchemy guarda el nombre del miembro: nombre → valor expuesto en los diccionarios
+_ESTADO_TAREA_VALOR = {estado.name: estado.value for estado in EstadoTarea}
+
+
+def _ejecucion_dict(ejec_real: EjecucionReal, tarea_plan: TareaPlanificada,
+                    tarea: Optional[Tarea], estado: Optional[str]) -> Dict:
+    """Diccionario de una ejecución real con la información de su tarea planificada"""
+    trabajo = tarea.trabajo if tarea else None
+    # Manejar casos donde Tarea o Trabajo pueden ser None
+    tarea_id = tarea.id if tarea else None
+    tarea_nombre = tarea.nombre if tarea else tarea_plan.tarea_id or 'N/A'
+    trabajo_id = trabajo.id if trabajo else None
+    trabajo_nombre = trabajo.nombre if trabajo else 'N/A'
+    
+    return {
+        'ejecucion_id': ejec_real.id,
+        'tarea_planificada_id': ejec_real.tarea_planificada_id,
+        'tarea_id': tarea_id,
+        'tarea_nombre': tarea_nombre,
+        'trabajo_id': trabajo_id,
+        'trabajo_nombre': trabajo_nombre,
+        'maquina_planificada': tarea_plan.maquina_id,
+        'maquina_usada': ejec_real.maquina_usada,
+        'operador_planificado': tarea_plan.operador_id,
+        'operador_ejecutor': ejec_real.operador_ejecutor,
+        'inicio_planificado': tarea_plan.inicio_planificado,  # Minutos lineales (legacy)
+        'fin_planificado': tarea_plan.fin_planificado,  # Minutos lineales (legacy)
+        'inicio_hora': tarea_plan.inicio_hora,  # Formato HH:MM ya calculado
+        'fin_hora': tarea_plan.fin_hora,  # Formato HH:MM ya calculado
+        'dia_nombre': tarea_plan.dia_nombre,  # Ej: "Lun", "Mar"
+        'dia_semana': tarea_plan.dia_semana,  # 0=Lunes, 1=Martes, etc
+        'inicio_real': ejec_real.inicio_real,
+        'fin_real': ejec_real.fin_real,
+        'duracion_planificada': tarea_plan.duracion_planificada,
+        'duracion_real': ejec_real.duracion_real,
+        'desviacion_inicio': ejec_real.desviacion_inicio,
+        'desviacion_fin': ejec_real.desviacion_fin,
+        'desviacion_duracion': ejec_real.desviacion_duracion,
+        'estado': estado,
+        'problemas_encontrados': ejec_real.problemas_encontrados,
+        'tiempo_paradas': ejec_real.tiempo_paradas,
+        'notas_operador': ejec_real.notas_operador,
+        'fecha_registro': ejec_real.fecha_registro
+    }
 
 
 def obtener_ejecuciones_reales_programacion(programacion_id: str) -> List[Dict]:
@@ -617,64 +976,33 @@ def obtener_ejecuciones_reales_programacion(programacion_id: str) -> List[Dict]:
     Returns:
         List[Dict]: Lista de ejecuciones reales con información de tareas
     """
-    with db_manager.get_session() as session:
+    with db_manager.get_readonly_session() as session:
         # Query con JOIN para obtener información completa
         # Nota: Usar outerjoin porque Tarea y Trabajo pueden no tener datos en la BD
+        # contains_eager: las filas del JOIN rellenan las relaciones (sin lazy loads posteriores)
+        # El estado se lee como texto crudo (sin conversión Enum por fila) y se difiere en la entidad
         query = session.query(
             EjecucionReal,
-            TareaPlanificada,
             Tarea,
-            Trabajo
+            type_coerce(EjecucionReal.estado, String)
         ).join(
-            TareaPlanificada, EjecucionReal.tarea_planificada_id == TareaPlanificada.id
+            EjecucionReal.tarea_planificada
         ).outerjoin(
             Tarea, TareaPlanificada.tarea_id == Tarea.id
         ).outerjoin(
-            Trabajo, Tarea.trabajo_id == Trabajo.id
+            Tarea.trabajo
+        ).options(
+            contains_eager(EjecucionReal.tarea_planificada),
+            contains_eager(Tarea.trabajo),
+            defer(EjecucionReal.estado)
         ).filter(
             TareaPlanificada.programacion_id == programacion_id
-        )
+        ).yield_per(1000)  # Filas en lotes (cursor en streaming) en lugar de bufferizar todo con .all()
         
-        ejecuciones = []
-        for ejec_real, tarea_plan, tarea, trabajo in query.all():
-            # Manejar casos donde Tarea o Trabajo pueden ser None
-            tarea_id = tarea.id if tarea else None
-            tarea_nombre = tarea.nombre if tarea else tarea_plan.tarea_id if hasattr(tarea_plan, 'tarea_id') else 'N/A'
-            trabajo_id = trabajo.id if trabajo else None
-            trabajo_nombre = trabajo.nombre if trabajo else 'N/A'
-            
-            ejecuciones.append({
-                'ejecucion_id': ejec_real.id,
-                'tarea_planificada_id': ejec_real.tarea_planificada_id,
-                'tarea_id': tarea_id,
-                'tarea_nombre': tarea_nombre,
-                'trabajo_id': trabajo_id,
-                'trabajo_nombre': trabajo_nombre,
-                'maquina_planificada': tarea_plan.maquina_id,
-                'maquina_usada': ejec_real.maquina_usada,
-                'operador_planificado': tarea_plan.operador_id,
-                'operador_ejecutor': ejec_real.operador_ejecutor,
-                'inicio_planificado': tarea_plan.inicio_planificado,  # Minutos lineales (legacy)
-                'fin_planificado': tarea_plan.fin_planificado,  # Minutos lineales (legacy)
-                'inicio_hora': tarea_plan.inicio_hora,  # Formato HH:MM ya calculado
-                'fin_hora': tarea_plan.fin_hora,  # Formato HH:MM ya calculado
-                'dia_nombre': tarea_plan.dia_nombre,  # Ej: "Lun", "Mar"
-                'dia_semana': tarea_plan.dia_semana,  # 0=Lunes, 1=Martes, etc
-                'inicio_real': ejec_real.inicio_real,
-                'fin_real': ejec_real.fin_real,
-                'duracion_planificada': tarea_plan.duracion_planificada,
-                'duracion_real': ejec_real.duracion_real,
-                'desviacion_inicio': ejec_real.desviacion_inicio,
-                'desviacion_fin': ejec_real.desviacion_fin,
-                'desviacion_duracion': ejec_real.desviacion_duracion,
-                'estado': ejec_real.estado.value if ejec_real.estado else None,
-                'problemas_encontrados': ejec_real.problemas_encontrados,
-                'tiempo_paradas': ejec_real.tiempo_paradas,
-                'notas_operador': ejec_real.notas_operador,
-                'fecha_registro': ejec_real.fecha_registro
-            })
-        
-        return ejecuciones
+        return [
+            _ejecucion_dict(ejec_real, ejec_real.tarea_planificada, tarea, _ESTADO_TAREA_VALOR.get(estado_bd))
+            for ejec_real, tarea, estado_bd in query
+        ]
 
 
 def obtener_tareas_sin_ejecucion_real(programacion_id: str) -> List[Dict]:
@@ -687,55 +1015,42 @@ def obtener_tareas_sin_ejecucion_real(programacion_id: str) -> List[Dict]:
     Returns:
         List[Dict]: Lista de tareas pendientes de registro
     """
-    with db_manager.get_session() as session:
-        # Subquery para tareas que SÍ tienen ejecución real
-        tareas_con_ejecucion = session.query(TareaPlanificada.id).join(
-            EjecucionReal, TareaPlanificada.id == EjecucionReal.tarea_planificada_id
-        ).filter(TareaPlanificada.programacion_id == programacion_id).subquery()
+    with db_manager.get_readonly_session() as session:
+        # Subconsulta correlacionada: la tarea tiene ejecución real (usa ix_ejec_tarea_planificada)
+        tiene_ejecucion = select(EjecucionReal.id).where(
+            EjecucionReal.tarea_planificada_id == TareaPlanificada.id
+        ).exists()
         
-        # Query principal para tareas SIN ejecución real
+        # Query principal para tareas SIN ejecución real (NOT EXISTS, sin materializar IDs)
         # Obtener TODAS las tareas planificadas de esta programación que NO tienen ejecución real
-        query = session.query(TareaPlanificada).filter(
-            TareaPlanificada.programacion_id == programacion_id,
-            ~TareaPlanificada.id.in_(tareas_con_ejecucion)
-        ).order_by(TareaPlanificada.inicio_planificado)
+        # Filas Core con solo las columnas usadas (acceso por atributo, sin objetos ORM)
+        # Tuplas Core con las columnas ya etiquetadas; el nombre planificado va aparte (solo fallback)
+        filas = session.execute(
+            select(TareaPlanificada.nombre, *_PENDIENTE_COLS)
+            .where(TareaPlanificada.programacion_id == programacion_id, ~tiene_ejecucion)
+            .order_by(TareaPlanificada.inicio_planificado)
+        ).all()
+        
+        # Nombres de la tabla Tarea (si existen) con una sola consulta IN en lugar de una por fila
+        bases = {_tarea_id_base(fila.tarea_id) for fila in filas}
+        nombres = dict(session.query(Tarea.id, Tarea.nombre).filter(Tarea.id.in_(bases)).all()) if bases else {}
         
         tareas_pendientes = []
-        for tarea_plan in query.all():
+        for nombre_plan, *valores in filas:
+            tarea = dict(zip(_PENDIENTE_KEYS, valores))  # tarea_id: ID completo (ej: "A2.P1")
+            
             # Extraer información de la tarea
-            tarea_id_full = tarea_plan.tarea_id
-            tarea_id_base = tarea_id_full.split('.')[0] if '.' in tarea_id_full else tarea_id_full
+            tarea_id_full = tarea['tarea_id']
+            tarea_id_base = _tarea_id_base(tarea_id_full)
             trabajo_id = tarea_id_base[0] if len(tarea_id_base) > 0 else 'N/A'
             
-            # Intentar obtener nombre de la tarea desde tabla Tarea si existe
-            tarea_obj = None
-            try:
-                tarea_obj = session.query(Tarea).filter(Tarea.id == tarea_id_base).first()
-            except:
-                pass
-            
-            tarea_nombre = tarea_plan.nombre if tarea_plan.nombre else tarea_id_full
-            if tarea_obj:
-                tarea_nombre = tarea_obj.nombre
-            
-            tareas_pendientes.append({
-                'tarea_planificada_id': tarea_plan.id,
-                'tarea_id': tarea_plan.tarea_id,  # Usar el ID completo (ej: "A2.P1")
-                'tarea_nombre': tarea_nombre,
-                'trabajo_id': trabajo_id,
-                'trabajo_nombre': f"Trabajo {trabajo_id}",
-                'maquina_planificada': tarea_plan.maquina_id,
-                'operador_planificado': tarea_plan.operador_id,
-                'inicio_planificado': tarea_plan.inicio_planificado,
-                'fin_planificado': tarea_plan.fin_planificado,
-                'inicio_hora': tarea_plan.inicio_hora,  # Formato HH:MM ya calculado
-                'fin_hora': tarea_plan.fin_hora,  # Formato HH:MM ya calculado
-                'duracion_planificada': tarea_plan.duracion_planificada,
-                'dia_semana': tarea_plan.dia_semana,
-                'dia_nombre': tarea_plan.dia_nombre,  # Ej: "Lun", "Mar"
-                'es_dividida': tarea_plan.es_dividida,
-                'parte_numero': tarea_plan.parte_numero
-            })
+            tarea['tarea_nombre'] = nombres.get(tarea_id_base) or nombre_plan or tarea_id_full
+            tarea['trabajo_id'] = trabajo_id
+            tarea['trabajo_nombre'] = f"Trabajo {trabajo_id}"
+            # Objetos time para formularios
+            tarea['inicio_time'] = _parsear_hora(tarea['inicio_hora'])
+            tarea['fin_time'] = _parsear_hora(tarea['fin_hora'])
+            tareas_pendientes.append(tarea)
         
         return tareas_pendientes
 
@@ -750,16 +1065,14 @@ def verificar_programacion_completa(programacion_id: str) -> tuple[bool, int, in
     Returns:
         tuple: (esta_completa: bool, tareas_totales: int, tareas_registradas: int)
     """
-    with db_manager.get_session() as session:
-        # Contar tareas planificadas totales
-        total_tareas = session.query(TareaPlanificada).filter(
-            TareaPlanificada.programacion_id == programacion_id
-        ).count()
-        
-        # Contar tareas con ejecución real
-        tareas_registradas = session.query(TareaPlanificada).join(
-            EjecucionReal, TareaPlanificada.id == EjecucionReal.tarea_planificada_id
-        ).filter(TareaPlanificada.programacion_id == programacion_id).count()
+    with db_manager.get_readonly_session() as session:
+        # Totales y registradas en una sola consulta: COUNT(ejecucion_real.id) ignora los NULL del LEFT JOIN
+        total_tareas, tareas_registradas = session.query(
+            func.count(TareaPlanificada.id),
+            func.count(EjecucionReal.id)
+        ).select_from(TareaPlanificada).outerjoin(
+            EjecucionReal, EjecucionReal.tarea_planificada_id == TareaPlanificada.id
+        ).filter(TareaPlanificada.programacion_id == programacion_id).one()
         
         esta_completa = (total_tareas > 0) and (tareas_registradas == total_tareas)
         
@@ -769,7 +1082,8 @@ def verificar_programacion_completa(programacion_id: str) -> tuple[bool, int, in
 def actualizar_ejecucion_real(ejecucion_id: int, inicio_real: datetime = None,
                             fin_real: datetime = None, maquina_usada: str = None,
                             operador_ejecutor: str = None, problemas: str = None,
-                            notas: str = None, tiempo_paradas: int = None) -> bool:
+                            notas: str = None, tiempo_paradas: int = None,
+                            session: Optional[Session] = None) -> bool:
     """
     Actualizar una ejecución real existente
     
@@ -777,14 +1091,33 @@ def actualizar_ejecucion_real(ejecucion_id: int, inicio_real: datetime = None,
         ejecucion_id: ID de la ejecución real
         inicio_real, fin_real, maquina_usada, operador_ejecutor: Datos a actualizar
         problemas, notas, tiempo_paradas: Información adicional
+        session: Sesión abierta del llamador (opcional)
         
     Returns:
         bool: True si se actualizó correctamente
     """
-    with db_manager.get_session() as session:
-        ejecucion = session.query(EjecucionReal).filter(
-            EjecucionReal.id == ejecucion_id
-        ).first()
+    campos = _campos_ejecucion_presentes(maquina_usada, operador_ejecutor, problemas, notas, tiempo_paradas)
+    
+    # Sin cambios de tiempos: UPDATE directo sin cargar la fila (no hay desviaciones que recalcular)
+    if inicio_real is None and fin_real is None and campos:
+        with _sesion(session) as session:
+            resultado = session.execute(
+                update(EjecucionReal).where(EjecucionReal.id == ejecucion_id).values(**campos)
+            )
+            actualizada = bool(resultado.rowcount)
+        if actualizada:
+            logger.debug("Ejecución real actualizada: %s", ejecucion_id)
+        return actualizada
+    
+    # Con tiempos nuevos en SQLite: un único UPDATE ... RETURNING que calcula duración y
+    # desviaciones en SQL (julianday); en otros dialectos, la ruta ORM
+    dialecto = db_manager.engine.dialect
+    if (inicio_real is not None or fin_real is not None) and dialecto.update_returning \
+            and dialecto.name == 'sqlite':
+        return _actualizar_tiempos_ejecucion_real(ejecucion_id, inicio_real, fin_real, campos, session)
+    
+    with _sesion(session) as session:
+        ejecucion = session.get(EjecucionReal, ejecucion_id)
         
         if not ejecucion:
             return False
@@ -794,27 +1127,21 @@ def actualizar_ejecucion_real(ejecucion_id: int, inicio_real: datetime = None,
             ejecucion.inicio_real = inicio_real
         if fin_real is not None:
             ejecucion.fin_real = fin_real
-        if maquina_usada is not None:
-            ejecucion.maquina_usada = maquina_usada
-        if operador_ejecutor is not None:
-            ejecucion.operador_ejecutor = operador_ejecutor
-        if problemas is not None:
-            ejecucion.problemas_encontrados = problemas
-        if notas is not None:
-            ejecucion.notas_operador = notas
-        if tiempo_paradas is not None:
-            ejecucion.tiempo_paradas = tiempo_paradas
+        for columna, valor in campos.items():
+            setattr(ejecucion, columna, valor)
         
         # Recalcular desviaciones si se actualizaron tiempos
         if inicio_real is not None or fin_real is not None:
-            tarea_plan = session.query(TareaPlanificada).filter(
-                TareaPlanificada.id == ejecucion.tarea_planificada_id
-            ).first()
+            tarea_plan = session.get(TareaPlanificada, ejecucion.tarea_planificada_id)
             
             if tarea_plan and ejecucion.inicio_real and ejecucion.fin_real:
-                # Calcular desviaciones en minutos
-                inicio_plan = tarea_plan.inicio_planificado
-                fin_plan = tarea_plan.fin_planificado
+                # Calcular desviaciones en minutos respecto del instante planificado
+                # (inicio/fin_planificado son minutos acumulados, no fechas)
+                prog = tarea_plan.programacion
+                inicio_plan = _datetime_planificado(tarea_plan.inicio_hora, tarea_plan.dia_semana,
+                                                    prog.semana_produccion, prog.anio)
+                fin_plan = _datetime_planificado(tarea_plan.fin_hora, tarea_plan.dia_semana,
+                                                 prog.semana_produccion, prog.anio)
                 
                 if inicio_plan:
                     ejecucion.desviacion_inicio = int(
@@ -831,43 +1158,171 @@ def actualizar_ejecucion_real(ejecucion_id: int, inicio_real: datetime = None,
                     (ejecucion.fin_real - ejecucion.inicio_real).total_seconds() / 60
                 )
                 
-                # Desviación: usar duracion ORIGINAL de tabla tareas (no minutos lineales)
-                from modelos.database_models import Tarea
-                tarea_id_base = tarea_plan.tarea_id.split('.')[0] if '.' in tarea_plan.tarea_id else tarea_plan.tarea_id
-                tarea_original = session.query(Tarea).filter(Tarea.id == tarea_id_base).first()
-                duracion_original = tarea_original.duracion if tarea_original else tarea_plan.duracion_planificada
+                # Desviación: usar duracion ORIGINAL de la tarea (guardada al planificar, no minutos lineales)
+                duracion_original = tarea_plan.duracion_original or tarea_plan.duracion_planificada
                 
                 tiempo_paradas = ejecucion.tiempo_paradas or 0
                 dur_real_sin_setup = max(0, ejecucion.duracion_real - tiempo_paradas)
                 ejecucion.desviacion_duracion = dur_real_sin_setup - duracion_original
 
-        session.commit()
-        logger.info(f"✅ Ejecución real actualizada: {ejecucion_id}")
+        logger.debug("Ejecución real actualizada: %s", ejecucion_id)
         return True
 
 
-def eliminar_ejecucion_real(ejecucion_id: int) -> bool:
+def _campos_ejecucion_presentes(maquina_usada: str, operador_ejecutor: str, problemas: str,
+                                notas: str, tiempo_paradas: int) -> Dict[str, Any]:
+    """Columnas de EjecucionReal a actualizar (solo los parámetros proporcionados)"""
+    candidatos = {
+        'maquina_usada': maquina_usada,
+        'operador_ejecutor': operador_ejecutor,
+        'problemas_encontrados': problemas,
+        'notas_operador': notas,
+        'tiempo_paradas': tiempo_paradas
+    }
+    return {columna: valor for columna, valor in candidatos.items() if valor is not None}
+
+
+def _minutos_entre_sqlite(inicio, fin):
+    """Minutos enteros entre dos DateTime de SQLite, truncados hacia cero como int() en Python"""
+    return _minutos_entre_julianday(func.julianday(inicio), func.julianday(fin))
+
+
+def _minutos_entre_julianday(jd_inicio, jd_fin):
+    """Minutos enteros entre dos valores julianday, truncados hacia cero como int() en Python"""
+    segundos = cast(func.round((jd_fin - jd_inicio) * 86400), Integer)
+    return segundos // 60
+
+
+def _julianday_planificado_sqlite(hora):
+    """
+    julianday del instante planificado de la tarea (columnas de TareaPlanificada y Programacion):
+    lunes ISO de la semana de producción + dia_semana + hora 'HH:MM' (NULL si falta la hora)
+    """
+    # Lunes de la semana ISO 1 = lunes de la semana que contiene el 4 de enero
+    enero_4 = func.printf('%04d-01-04', Programacion.anio)
+    lunes_semana_1 = func.julianday(enero_4) - (cast(func.strftime('%w', enero_4), Integer) + 6) % 7
+    separador = func.instr(hora, ':')
+    minutos = (cast(func.substr(hora, 1, separador - 1), Integer) * 60
+               + cast(func.substr(hora, separador + 1), Integer))
+    return case(
+        (separador > 0,
+         lunes_semana_1 + (Programacion.semana_produccion - 1) * 7 + TareaPlanificada.dia_semana
+         + minutos / 1440.0),
+        else_=None
+    )
+
+
+def _desviacion_planificada_sqlite(real, hora):
+    """Minutos entre el instante real y el planificado de la tarea de la ejecución (subconsulta correlacionada)"""
+    return (
+        select(_minutos_entre_julianday(_julianday_planificado_sqlite(hora), func.julianday(real)))
+        .select_from(TareaPlanificada)
+        .join(Programacion, Programacion.id == TareaPlanificada.programacion_id)
+        .where(TareaPlanificada.id == EjecucionReal.tarea_planificada_id)
+        .scalar_subquery()
+    )
+
+
+def _datetime_planificado(hora: Optional[str], dia_semana: Optional[int],
+                          semana: int, anio: int) -> Optional[datetime]:
+    """Instante planificado: lunes ISO de la semana de producción + dia_semana + hora 'HH:MM'"""
+    hora_t = _parsear_hora(hora)
+    if hora_t is None or dia_semana is None or not semana or not anio:
+        return None
+    try:
+        lunes = date.fromisocalendar(anio, semana, 1)
+    except ValueError:
+        return None
+    return datetime.combine(lunes + timedelta(days=dia_semana), hora_t)
+
+
+def _actualizar_tiempos_ejecucion_real(ejecucion_id: int, inicio_real: Optional[datetime],
+                                       fin_real: Optional[datetime], campos: Dict[str, Any],
+                                       session: Optional[Session] = None) -> bool:
+    """Actualizar tiempos, duración y desviaciones en un solo UPDATE ... RETURNING (sin SELECT previos, SQLite)"""
+    if inicio_real is not None and fin_real is not None:
+        duracion_real = int((fin_real - inicio_real).total_seconds() / 60)
+        inicio = literal(inicio_real, DateTime)
+        fin = literal(fin_real, DateTime)
+        tiempos_completos = None
+    else:
+        # Solo uno de los tiempos: el otro es el valor guardado en la fila (SET ve los valores previos)
+        inicio = literal(inicio_real, DateTime) if inicio_real is not None else EjecucionReal.inicio_real
+        fin = literal(fin_real, DateTime) if fin_real is not None else EjecucionReal.fin_real
+        tiempos_completos = and_(inicio.is_not(None), fin.is_not(None))
+        duracion_real = _minutos_entre_sqlite(inicio, fin)
+    
+    # Duración ORIGINAL de la tarea planificada (subconsulta correlacionada), como en la ruta Python
+    duracion_original = select(
+        func.coalesce(func.nullif(TareaPlanificada.duracion_original, 0), TareaPlanificada.duracion_planificada)
+    ).where(TareaPlanificada.id == EjecucionReal.tarea_planificada_id).scalar_subquery()
+    
+    paradas = campos.get('tiempo_paradas', func.coalesce(EjecucionReal.tiempo_paradas, 0))
+    dur_real_sin_setup = duracion_real - paradas
+    dur_real_sin_setup = case((dur_real_sin_setup > 0, dur_real_sin_setup), else_=0)
+    
+    desviacion_duracion = dur_real_sin_setup - duracion_original
+    
+    # Desviaciones de inicio/fin respecto del instante planificado; sin hora planificada se conservan
+    desviacion_inicio = func.coalesce(
+        _desviacion_planificada_sqlite(inicio, TareaPlanificada.inicio_hora), EjecucionReal.desviacion_inicio
+    )
+    desviacion_fin = func.coalesce(
+        _desviacion_planificada_sqlite(fin, TareaPlanificada.fin_hora), EjecucionReal.desviacion_fin
+    )
+    
+    if tiempos_completos is not None:
+        # Sin ambos tiempos no se recalcula nada (igual que la ruta Python)
+        duracion_real = case((tiempos_completos, duracion_real), else_=EjecucionReal.duracion_real)
+        desviacion_duracion = case((tiempos_completos, desviacion_duracion), else_=EjecucionReal.desviacion_duracion)
+        desviacion_inicio = case((tiempos_completos, desviacion_inicio), else_=EjecucionReal.desviacion_inicio)
+        desviacion_fin = case((tiempos_completos, desviacion_fin), else_=EjecucionReal.desviacion_fin)
+    
+    valores = {
+        'duracion_real': duracion_real,
+        'desviacion_duracion': desviacion_duracion,
+        'desviacion_inicio': desviacion_inicio,
+        'desviacion_fin': desviacion_fin,
+        **campos
+    }
+    if inicio_real is not None:
+        valores['inicio_real'] = inicio_real
+    if fin_real is not None:
+        valores['fin_real'] = fin_real
+    
+    with _sesion(session) as session:
+        actualizada = session.execute(
+            update(EjecucionReal)
+            .where(EjecucionReal.id == ejecucion_id)
+            .values(**valores)
+            .returning(EjecucionReal.id)
+        ).first()
+    
+    if actualizada is None:
+        return False
+    logger.debug("Ejecución real actualizada: %s", ejecucion_id)
+    return True
+
+
+def eliminar_ejecucion_real(ejecucion_id: int, session: Optional[Session] = None) -> bool:
     """
     Eliminar una ejecución real
     
     Args:
         ejecucion_id: ID de la ejecución real
+        session: Sesión abierta del llamador (opcional)
         
     Returns:
         bool: True si se eliminó correctamente
     """
-    with db_manager.get_session() as session:
-        ejecucion = session.query(EjecucionReal).filter(
-            EjecucionReal.id == ejecucion_id
-        ).first()
-        
-        if ejecucion:
-            session.delete(ejecucion)
-            session.commit()
-            logger.info(f"✅ Ejecución real eliminada: {ejecucion_id}")
-            return True
-        
-        return False
+    with _sesion(session) as session:
+        # DELETE directo: sin SELECT previo ni unit-of-work (EjecucionReal no tiene dependientes)
+        resultado = session.execute(delete(EjecucionReal).where(EjecucionReal.id == ejecucion_id))
+        eliminada = bool(resultado.rowcount)
+    
+    if eliminada:
+        logger.info(f"✅ Ejecución real eliminada: {ejecucion_id}")
+    return eliminada
 
 
 # ============================================================================
@@ -879,7 +1334,8 @@ def registrar_ejecucion_real(tarea_planificada_id: int, inicio_real: datetime,
                             operador_ejecutor: str = None,
                             problemas: str = "", notas: str = "",
                             tiempo_paradas: int = 0,
-                            registrado_por: str = "Operador") -> int:
+                            registrado_por: str = "Operador",
+                            session: Optional[Session] = None) -> int:
     """
     Registrar ejecución real de una tarea
     
@@ -893,12 +1349,11 @@ def registrar_ejecucion_real(tarea_planificada_id: int, inicio_real: datetime,
         notas: Notas del operador
         tiempo_paradas: Tiempo de paradas en minutos
         registrado_por: Quien registra
+        session: Sesión abierta del llamador (opcional)
     """
-    with db_manager.get_session() as session:
+    with _sesion(session) as session:
         # Obtener tarea planificada para calcular desviaciones
-        tarea_plan = session.query(TareaPlanificada).filter(
-            TareaPlanificada.id == tarea_planificada_id
-        ).first()
+        tarea_plan = session.get(TareaPlanificada, tarea_planificada_id)
         
         if not tarea_plan:
             raise ValueError(f"Tarea planificada {tarea_planificada_id} no encontrada")
@@ -906,11 +1361,8 @@ def registrar_ejecucion_real(tarea_planificada_id: int, inicio_real: datetime,
         # Calcular duración real
         duracion_real = int((fin_real - inicio_real).total_seconds() / 60)
         
-        # Calcular desviaciones: usar duracion ORIGINAL de tabla tareas (no minutos lineales)
-        from modelos.database_models import Tarea
-        tarea_id_base = tarea_plan.tarea_id.split('.')[0] if '.' in tarea_plan.tarea_id else tarea_plan.tarea_id
-        tarea_original = session.query(Tarea).filter(Tarea.id == tarea_id_base).first()
-        duracion_original = tarea_original.duracion if tarea_original else tarea_plan.duracion_planificada
+        # Calcular desviaciones: usar duracion ORIGINAL de la tarea (guardada al planificar, no minutos lineales)
+        duracion_original = tarea_plan.duracion_original or tarea_plan.duracion_planificada
         
         dur_real_sin_setup = max(0, duracion_real - (tiempo_paradas or 0))
         desviacion_duracion = dur_real_sin_setup - duracion_original
@@ -937,15 +1389,15 @@ def registrar_ejecucion_real(tarea_planificada_id: int, inicio_real: datetime,
         )
         
         session.add(ejecucion)
-        session.commit()
-        session.refresh(ejecucion)
-        logger.info(f"✅ Ejecución real registrada para tarea {tarea_planificada_id}")
+        # id disponible tras el flush (sin SELECT de refresh después del commit)
+        session.flush()
+        logger.debug("Ejecución real registrada para tarea %s", tarea_planificada_id)
         return ejecucion.id
 
 
 def obtener_ejecucion_real(tarea_planificada_id: int) -> Optional[EjecucionReal]:
     """Obtener ejecución real de una tarea planificada"""
-    with db_manager.get_session() as session:
+    with db_manager.get_readonly_session() as session:
         return session.query(EjecucionReal).filter(
             EjecucionReal.tarea_planificada_id == tarea_planificada_id
         ).first()
@@ -955,6 +1407,38 @@ def obtener_ejecucion_real(tarea_planificada_id: int) -> Optional[EjecucionReal]
 # CRUD - MÉTRICAS
 # ============================================================================
 
+# Columnas de ejecución + tarea planificada que usa KPIExporter, etiquetadas con las claves esperadas
+_EJECUCION_KPI_COLS = (
+    TareaPlanificada.nombre.label('tarea_nombre'),
+    TareaPlanificada.maquina_id.label('maquina_planificada'),
+    TareaPlanificada.inicio_hora, TareaPlanificada.fin_hora, TareaPlanificada.dia_semana,
+    TareaPlanificada.duracion_planificada,
+    EjecucionReal.maquina_usada, EjecucionReal.inicio_real, EjecucionReal.fin_real,
+    EjecucionReal.duracion_real, EjecucionReal.desviacion_duracion,
+    EjecucionReal.tiempo_paradas, EjecucionReal.problemas_encontrados
+)
+
+
+def _ejecuciones_kpi(session: Session, programacion_id: str) -> List[Dict]:
+    """Ejecuciones reales de una programación para el cálculo de KPIs (filas Core, sin objetos ORM)"""
+    filas = session.execute(
+        select(*_EJECUCION_KPI_COLS)
+        .join_from(EjecucionReal, TareaPlanificada, EjecucionReal.tarea_planificada_id == TareaPlanificada.id)
+        .where(TareaPlanificada.programacion_id == programacion_id)
+    ).mappings()
+    return [dict(fila) for fila in filas]
+
+
+# Máquinas con columnas propias en MetricaCalculada y campos que se guardan de cada una (con su default)
+_MAQUINAS_METRICAS = ('M1', 'M2', 'M3')
+_CAMPOS_MAQUINA = (
+    ('utilizacion_total', 0.0),
+    ('tiempo_productivo', 0),
+    ('tiempo_ocioso', 0),
+    ('tiempo_setup', 0)
+)
+
+
 def calcular_y_guardar_metricas(programacion_id: str, semana_produccion: int = None, 
                                  anio: int = None) -> Optional[int]:
     """
@@ -974,12 +1458,24 @@ def calcular_y_guardar_metricas(programacion_id: str, semana_produccion: int = N
     Returns:
         int: ID de la métrica creada/actualizada, o None si hay error
     """
-    from utils.kpi_calculator import KPIExporter
-    from modelos.database_models import EstadoProgramacion
+    # Camino habitual (métricas ya calculadas): se resuelve en una sesión de solo lectura,
+    # sin abrir la transacción de escritura
+    with db_manager.get_readonly_session() as session:
+        fila = session.execute(
+            select(Programacion.id, MetricaCalculada.id)
+            .outerjoin(MetricaCalculada, MetricaCalculada.programacion_id == Programacion.id)
+            .where(Programacion.id == programacion_id)
+        ).first()
+    if fila is None:
+        logger.error(f"Programación {programacion_id} no encontrada")
+        return None
+    if fila[1] is not None:
+        logger.info(f"Métricas ya existen para {programacion_id}")
+        return fila[1]
     
     with db_manager.get_session() as session:
-        # Verificar que la programación existe
-        prog = session.query(Programacion).filter(Programacion.id == programacion_id).first()
+        # Verificar que la programación existe; sus métricas llegan en la misma consulta (JOIN)
+        prog = session.get(Programacion, programacion_id, options=[joinedload(Programacion.metricas)])
         if not prog:
             logger.error(f"Programación {programacion_id} no encontrada")
             return None
@@ -991,69 +1487,28 @@ def calcular_y_guardar_metricas(programacion_id: str, semana_produccion: int = N
             anio = prog.anio
         
         # Verificar si ya existen métricas (no recalcular si ya existen)
-        metrica_existente = session.query(MetricaCalculada).filter(
-            MetricaCalculada.programacion_id == programacion_id
-        ).first()
-        
-        if metrica_existente:
+        if prog.metricas:
             logger.info(f"Métricas ya existen para {programacion_id}")
-            return metrica_existente.id
+            return prog.metricas.id
         
-        # Obtener ejecuciones reales
-        ejecuciones = obtener_ejecuciones_reales_programacion(programacion_id)
+        # Obtener ejecuciones reales (solo las columnas que usa el cálculo, en la misma sesión)
+        ejecuciones = _ejecuciones_kpi(session, programacion_id)
         
         if not ejecuciones:
             logger.warning(f"No hay ejecuciones reales para {programacion_id}")
             return None
         
-        # Extraer configuración de la programación
-        import json
-        from datetime import datetime as dt
-        
-        dias_laborales = 5  # Default
-        minutos_por_dia = 600  # Default (10 horas)
-        num_maquinas = 3  # Default
-        
-        if prog.configuracion_json:
-            try:
-                config = json.loads(prog.configuracion_json)
-                
-                # Obtener días laborales
-                horario = config.get('horario_trabajo', {})
-                dias_laborales = horario.get('dias_laborales', 5)
-                
-                # Calcular minutos por día: (hora_fin - hora_inicio - almuerzo) * 60
-                hora_inicio_str = horario.get('inicio', '08:00')
-                hora_fin_str = horario.get('fin', '18:00')
-                almuerzo_inicio_str = horario.get('descanso_almuerzo', {}).get('inicio', '13:00')
-                almuerzo_fin_str = horario.get('descanso_almuerzo', {}).get('fin', '14:00')
-                
-                # Parsear horas
-                try:
-                    h_ini, m_ini = map(int, hora_inicio_str.split(':'))
-                    h_fin, m_fin = map(int, hora_fin_str.split(':'))
-                    h_alm_ini, m_alm_ini = map(int, almuerzo_inicio_str.split(':'))
-                    h_alm_fin, m_alm_fin = map(int, almuerzo_fin_str.split(':'))
-                    
-                    # Calcular minutos totales del día
-                    minutos_totales = (h_fin * 60 + m_fin) - (h_ini * 60 + m_ini)
-                    
-                    # Restar almuerzo
-                    minutos_almuerzo = (h_alm_fin * 60 + m_alm_fin) - (h_alm_ini * 60 + m_alm_ini)
-                    
-                    # Minutos disponibles por día (efectivos, sin almuerzo)
-                    minutos_por_dia = minutos_totales - minutos_almuerzo
-                except Exception as e:
-                    logger.warning(f"Error calculando minutos por día desde configuración: {e}")
-                    # Mantener default
-                
-                # Obtener número de máquinas
-                recursos = config.get('recursos', {})
-                num_maquinas = recursos.get('num_maquinas', 3)
-                
-            except Exception as e:
-                logger.warning(f"Error parseando configuración JSON: {e}")
-                # Usar defaults
+        # Extraer configuración de la programación: parámetros persistidos al crear la programación; las filas anteriores a esas
+        # columnas (sin migrar) se resuelven parseando configuracion_json
+        if prog.minutos_por_dia is not None:
+            dias_laborales = prog.dias_laborales
+            minutos_por_dia = prog.minutos_por_dia
+            num_maquinas = prog.num_maquinas
+        else:
+            parametros = _parametros_kpi(prog.configuracion_json or {})
+            dias_laborales = parametros['dias_laborales']
+            minutos_por_dia = parametros['minutos_por_dia']
+            num_maquinas = parametros['num_maquinas']
         
         # Inicializar calculadora con configuración de la programación
         calc = KPIExporter(
@@ -1077,89 +1532,54 @@ def calcular_y_guardar_metricas(programacion_id: str, semana_produccion: int = N
         # Preparar datos para guardar en BD
         utilizacion_maquinas = metricas_dict.get('utilizacion_maquinas', {})
         
-        # Extraer utilización por máquina (M1, M2, M3)
-        utilizacion_m1 = utilizacion_maquinas.get('M1', {}).get('utilizacion_total', 0.0) if utilizacion_maquinas.get('M1') else 0.0
-        utilizacion_m2 = utilizacion_maquinas.get('M2', {}).get('utilizacion_total', 0.0) if utilizacion_maquinas.get('M2') else 0.0
-        utilizacion_m3 = utilizacion_maquinas.get('M3', {}).get('utilizacion_total', 0.0) if utilizacion_maquinas.get('M3') else 0.0
-        
-        # Tiempos por máquina
-        tiempo_productivo_m1 = utilizacion_maquinas.get('M1', {}).get('tiempo_productivo', 0) if utilizacion_maquinas.get('M1') else 0
-        tiempo_productivo_m2 = utilizacion_maquinas.get('M2', {}).get('tiempo_productivo', 0) if utilizacion_maquinas.get('M2') else 0
-        tiempo_productivo_m3 = utilizacion_maquinas.get('M3', {}).get('tiempo_productivo', 0) if utilizacion_maquinas.get('M3') else 0
+        # Extraer por máquina (M1, M2, M3) utilización y tiempos en un solo recorrido
+        valores_maquina = {}
+        for maq in _MAQUINAS_METRICAS:
+            datos_maq = utilizacion_maquinas.get(maq) or {}
+            valores_maquina[maq] = [datos_maq.get(campo, defecto) for campo, defecto in _CAMPOS_MAQUINA]
         
-        tiempo_ocioso_m1 = utilizacion_maquinas.get('M1', {}).get('tiempo_ocioso', 0) if utilizacion_maquinas.get('M1') else 0
-        tiempo_ocioso_m2 = utilizacion_maquinas.get('M2', {}).get('tiempo_ocioso', 0) if utilizacion_maquinas.get('M2') else 0
-        tiempo_ocioso_m3 = utilizacion_maquinas.get('M3', {}).get('tiempo_ocioso', 0) if utilizacion_maquinas.get('M3') else 0
-        
-        tiempo_setup_m1 = utilizacion_maquinas.get('M1', {}).get('tiempo_setup', 0) if utilizacion_maquinas.get('M1') else 0
-        tiempo_setup_m2 = utilizacion_maquinas.get('M2', {}).get('tiempo_setup', 0) if utilizacion_maquinas.get('M2') else 0
-        tiempo_setup_m3 = utilizacion_maquinas.get('M3', {}).get('tiempo_setup', 0) if utilizacion_maquinas.get('M3') else 0
+        utilizaciones = [valores[0] for valores in valores_maquina.values()]
+        tiempos_productivos = [valores[1] for valores in valores_maquina.values()]
         
         # Calcular utilización global promedio ponderada por tiempo productivo
-        total_tiempo_productivo = tiempo_productivo_m1 + tiempo_productivo_m2 + tiempo_productivo_m3
+        total_tiempo_productivo = sum(tiempos_productivos)
         if total_tiempo_productivo > 0:
             # Promedio ponderado: sum(utilizacion_i * tiempo_productivo_i) / sum(tiempo_productivo_i)
-            utilizacion_global_ponderada = (
-                utilizacion_m1 * tiempo_productivo_m1 +
-                utilizacion_m2 * tiempo_productivo_m2 +
-                utilizacion_m3 * tiempo_productivo_m3
-            ) / total_tiempo_productivo
+            utilizacion_global_ponderada = utilizacion_ponderada(utilizaciones, tiempos_productivos)
         else:
             # Si no hay tiempo productivo, usar promedio simple
-            maquinas_con_datos = [u for u in [utilizacion_m1, utilizacion_m2, utilizacion_m3] if u > 0]
+            maquinas_con_datos = [u for u in utilizaciones if u > 0]
             utilizacion_global_ponderada = sum(maquinas_con_datos) / len(maquinas_con_datos) if maquinas_con_datos else 0.0
         
         # Makespan real
         makespan_real = None
         if ejecuciones:
-            try:
-                tiempos_fin = [e.get('fin_real') for e in ejecuciones if e.get('fin_real')]
-                tiempos_inicio = [e.get('inicio_real') for e in ejecuciones if e.get('inicio_real')]
-                if tiempos_fin and tiempos_inicio:
-                    # Convertir a datetime si son strings
-                    from datetime import datetime
-                    fin_max = max([
-                        datetime.fromisoformat(str(t).replace('Z', '+00:00')) if isinstance(t, str) else t
-                        for t in tiempos_fin
-                        if t
-                    ])
-                    inicio_min = min([
-                        datetime.fromisoformat(str(t).replace('Z', '+00:00')) if isinstance(t, str) else t
-                        for t in tiempos_inicio
-                        if t
-                    ])
-                    makespan_real = int((fin_max - inicio_min).total_seconds() / 60)
-            except Exception as e:
-                logger.warning(f"Error calculando makespan_real: {e}")
-                makespan_real = None
+            # inicio_real/fin_real llegan como datetime desde la columna DateTime (sin parseo)
+            fin_max = max((e['fin_real'] for e in ejecuciones if e['fin_real']), default=None)
+            inicio_min = min((e['inicio_real'] for e in ejecuciones if e['inicio_real']), default=None)
+            if fin_max is not None and inicio_min is not None:
+                makespan_real = int((fin_max - inicio_min).total_seconds() / 60)
         
         diferencia_makespan = None
         if makespan_real and prog.makespan_planificado:
             diferencia_makespan = makespan_real - prog.makespan_planificado
         
+        metricas_get = metricas_dict.get
         datos_metricas = {
-            'oee_global': metricas_dict.get('oee_global', 0.0),
-            'disponibilidad_oee': metricas_dict.get('disponibilidad_oee', 0.0),
-            'rendimiento_oee': metricas_dict.get('rendimiento_oee', 0.0),
-            'calidad_oee': metricas_dict.get('calidad_oee', 0.0),
-            'throughput_semanal': metricas_dict.get('throughput_semanal', 0),
+            'oee_global': metricas_get('oee_global', 0.0),
+            'disponibilidad_oee': metricas_get('disponibilidad_oee', 0.0),
+            'rendimiento_oee': metricas_get('rendimiento_oee', 0.0),
+            'calidad_oee': metricas_get('calidad_oee', 0.0),
+            'throughput_semanal': metricas_get('throughput_semanal', 0),
             'lead_time_promedio': round(utilizacion_global_ponderada, 2),  # Usado para almacenar utilización global promedio ponderada
             
-            # Utilización por máquina
-            'utilizacion_m1': round(utilizacion_m1, 2),
-            'utilizacion_m2': round(utilizacion_m2, 2),
-            'utilizacion_m3': round(utilizacion_m3, 2),
+            # Utilización por máquina (utilizacion_m1..m3)
+            **{f'utilizacion_{maq.lower()}': round(valores[0], 2) for maq, valores in valores_maquina.items()},
             
-            # Tiempos por máquina
-            'tiempo_productivo_m1': tiempo_productivo_m1,
-            'tiempo_productivo_m2': tiempo_productivo_m2,
-            'tiempo_productivo_m3': tiempo_productivo_m3,
-            'tiempo_ocioso_m1': tiempo_ocioso_m1,
-            'tiempo_ocioso_m2': tiempo_ocioso_m2,
-            'tiempo_ocioso_m3': tiempo_ocioso_m3,
-            'tiempo_setup_m1': tiempo_setup_m1,
-            'tiempo_setup_m2': tiempo_setup_m2,
-            'tiempo_setup_m3': tiempo_setup_m3,
+            # Tiempos por máquina (tiempo_productivo_m1, tiempo_ocioso_m1, tiempo_setup_m1, ...)
+            **{f'{campo}_{maq.lower()}': valor
+               for maq, valores in valores_maquina.items()
+               for (campo, _), valor in zip(_CAMPOS_MAQUINA[1:], valores[1:])},
             
             # Cumplimiento
             'otif_porcentaje': round(cumplimiento.get('otif_porcentaje', 0.0), 2),
@@ -1168,8 +1588,8 @@ def calcular_y_guardar_metricas(programacion_id: str, semana_produccion: int = N
             'tareas_adelantadas': cumplimiento.get('tareas_adelantadas', 0),
             
             # Desviaciones
-            'desviacion_promedio': round(metricas_dict.get('desviacion_promedio', 0.0), 2),
-            'desviacion_maxima': round(metricas_dict.get('desviacion_maxima', 0.0), 2),
+            'desviacion_promedio': round(metricas_get('desviacion_promedio', 0.0), 2),
+            'desviacion_maxima': round(metricas_get('desviacion_maxima', 0.0), 2),
             
             # Costos (TODO: implementar si es necesario)
             'costo_real': None,
@@ -1179,25 +1599,85 @@ def calcular_y_guardar_metricas(programacion_id: str, semana_produccion: int = N
             'costo_setup': None,
             
             # Análisis
-            'cuello_botella_identificado': metricas_dict.get('cuello_botella'),
+            'cuello_botella_identificado': metricas_get('cuello_botella'),
             'makespan_real': makespan_real,
             'diferencia_makespan': diferencia_makespan
         }
         
-        # Crear nueva métrica (ya verificamos que no existe antes)
-        metrica = MetricaCalculada(
-            programacion_id=programacion_id,
-            **datos_metricas
-        )
-        session.add(metrica)
-        session.flush()
-        metrica_id = metrica.id
+        # Crear nueva métrica. Otro proceso puede haberla insertado mientras se calculaba:
+        # en SQLite, ON CONFLICT (programacion_id) DO NOTHING evita el IntegrityError al
+        # confirmar y, si no se insertó nada, se devuelve la métrica existente
+        if session.get_bind().dialect.name == 'sqlite':
+            metrica_id = session.execute(
+                sqlite_insert(MetricaCalculada)
+                .values(programacion_id=programacion_id, **datos_metricas)
+                .on_conflict_do_nothing(index_elements=['programacion_id'])
+                .returning(MetricaCalculada.id)
+            ).scalar()
+            if metrica_id is None:
+                logger.info(f"Métricas ya guardadas por otro proceso para {programacion_id}")
+                return session.execute(
+                    select(MetricaCalculada.id).where(MetricaCalculada.programacion_id == programacion_id)
+                ).scalar()
+        else:
+            metrica = MetricaCalculada(
+                programacion_id=programacion_id,
+                **datos_metricas
+            )
+            session.add(metrica)
+            # Un flush para obtener el id; get_session() hace commit al salir del bloque
+            session.flush()
+            metrica_id = metrica.id
         
-        session.commit()
         logger.info(f"✅ Métricas calculadas y guardadas para {programacion_id}")
         return metrica_id
 
 
+def _inicializar_proceso_metricas():
+    """Inicializador de cada proceso del pool de cálculo de métricas"""
+    # Las conexiones heredadas del proceso padre no se comparten: cada proceso abre las suyas
+    db_manager.engine.dispose(close=False)
+    # Cargar (o compilar) los kernels antes de la primera programación
+    calentar_kernels()
+
+
+def calcular_y_guardar_metricas_batch(programacion_ids: List[str] = None,
+                                      max_workers: int = None) -> Dict[str, Optional[int]]:
+    """
+    Calcular y guardar métricas de varias programaciones en paralelo (un proceso por núcleo)
+    
+    Args:
+        programacion_ids: IDs a procesar (None = todas las programaciones sin métricas)
+        max_workers: Número de procesos (por defecto, núcleos disponibles)
+    
+    Returns:
+        Dict[str, Optional[int]]: ID de programación → ID de la métrica creada (None si no se pudo calcular)
+    """
+    # Una sola consulta para las programaciones que aún no tienen métricas
+    stmt = (
+        select(Programacion.id)
+        .outerjoin(MetricaCalculada, MetricaCalculada.programacion_id == Programacion.id)
+        .where(MetricaCalculada.id.is_(None))
+    )
+    if programacion_ids is not None:
+        stmt = stmt.where(Programacion.id.in_(programacion_ids))
+    with db_manager.get_readonly_session() as session:
+        pendientes = list(session.execute(stmt).scalars())
+    
+    if not pendientes:
+        return {}
+    
+    # Cada proceso calcula y guarda una programación independiente; en SQLite las escrituras
+    # se serializan con el bloqueo de la BD (WAL + timeout de conexión)
+    max_workers = min(max_workers or os.cpu_count() or 1, len(pendientes))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_inicializar_proceso_metricas) as executor:
+        resultados = dict(zip(pendientes, executor.map(calcular_y_guardar_metricas, pendientes)))
+    
+    logger.info(f"✅ Métricas calculadas para {sum(1 for r in resultados.values() if r is not None)}"
+                f"/{len(pendientes)} programaciones")
+    return resultados
+
+
 def guardar_metricas(programacion_id: str, metricas: Dict) -> int:
     """
     Guardar métricas calculadas para una programación (DEPRECATED - usar calcular_y_guardar_metricas)
@@ -1216,11 +1696,27 @@ def guardar_metricas(programacion_id: str, metricas: Dict) -> int:
         )
         session.add(metrica)
         session.commit()
-        session.refresh(metrica)
         logger.info(f"✅ Métricas guardadas para {programacion_id}")
         return metrica.id
 
 
+# Columnas de MetricaCalculada devueltas por obtener_metricas (las de costos no se exponen)
+_METRICAS_COLS = tuple(
+    MetricaCalculada.__table__.c[nombre] for nombre in (
+        'id', 'programacion_id', 'fecha_calculo',
+        'oee_global', 'disponibilidad_oee', 'rendimiento_oee', 'calidad_oee',
+        'throughput_semanal', 'lead_time_promedio',
+        'utilizacion_m1', 'utilizacion_m2', 'utilizacion_m3',
+        'tiempo_productivo_m1', 'tiempo_productivo_m2', 'tiempo_productivo_m3',
+        'tiempo_ocioso_m1', 'tiempo_ocioso_m2', 'tiempo_ocioso_m3',
+        'tiempo_setup_m1', 'tiempo_setup_m2', 'tiempo_setup_m3',
+        'otif_porcentaje', 'tareas_a_tiempo', 'tareas_retrasadas', 'tareas_adelantadas',
+        'desviacion_promedio', 'desviacion_maxima',
+        'cuello_botella_identificado', 'makespan_real', 'diferencia_makespan',
+    )
+)
+
+
 def obtener_metricas(programacion_id: str) -> Optional[Dict]:
     """
     Obtener métricas de una programación como diccionario
@@ -1231,52 +1727,17 @@ def obtener_metricas(programacion_id: str) -> Optional[Dict]:
     Returns:
         Dict con todas las métricas o None si no existen
     """
-    with db_manager.get_session() as session:
-        metrica = session.query(MetricaCalculada).filter(
-            MetricaCalculada.programacion_id == programacion_id
-        ).first()
-        
-        if not metrica:
-            return None
-        
-        # Convertir a diccionario con todos los campos
-        return {
-            'id': metrica.id,
-            'programacion_id': metrica.programacion_id,
-            'fecha_calculo': metrica.fecha_calculo,
-            'oee_global': metrica.oee_global,
-            'disponibilidad_oee': getattr(metrica, 'disponibilidad_oee', None),
-            'rendimiento_oee': getattr(metrica, 'rendimiento_oee', None),
-            'calidad_oee': getattr(metrica, 'calidad_oee', None),
-            'throughput_semanal': metrica.throughput_semanal,
-            'lead_time_promedio': metrica.lead_time_promedio,
-            'utilizacion_m1': metrica.utilizacion_m1,
-            'utilizacion_m2': metrica.utilizacion_m2,
-            'utilizacion_m3': metrica.utilizacion_m3,
-            'tiempo_productivo_m1': metrica.tiempo_productivo_m1,
-            'tiempo_productivo_m2': metrica.tiempo_productivo_m2,
-            'tiempo_productivo_m3': metrica.tiempo_productivo_m3,
-            'tiempo_ocioso_m1': metrica.tiempo_ocioso_m1,
-            'tiempo_ocioso_m2': metrica.tiempo_ocioso_m2,
-            'tiempo_ocioso_m3': metrica.tiempo_ocioso_m3,
-            'tiempo_setup_m1': metrica.tiempo_setup_m1,
-            'tiempo_setup_m2': metrica.tiempo_setup_m2,
-            'tiempo_setup_m3': metrica.tiempo_setup_m3,
-            'otif_porcentaje': metrica.otif_porcentaje,
-            'tareas_a_tiempo': metrica.tareas_a_tiempo,
-            'tareas_retrasadas': metrica.tareas_retrasadas,
-            'tareas_adelantadas': getattr(metrica, 'tareas_adelantadas', 0),
-            'desviacion_promedio': metrica.desviacion_promedio,
-            'desviacion_maxima': metrica.desviacion_maxima,
-            'cuello_botella_identificado': metrica.cuello_botella_identificado,
-            'makespan_real': metrica.makespan_real,
-            'diferencia_makespan': metrica.diferencia_makespan
-        }
+    # SELECT Core de las columnas: la fila se devuelve como dict sin instanciar el objeto ORM
+    with db_manager.get_readonly_session() as session:
+        fila = session.execute(
+            select(*_METRICAS_COLS).where(MetricaCalculada.programacion_id == programacion_id)
+        ).mappings().first()
+        return dict(fila) if fila else None
 
 
 def obtener_metricas_historicas(ultimas_n_semanas: int = 4) -> List[MetricaCalculada]:
     """Obtener métricas históricas"""
-    with db_manager.get_session() as session:
+    with db_manager.get_readonly_session() as session:
         return session.query(MetricaCalculada).join(Programacion).filter(
             Programacion.estado == EstadoProgramacion.COMPLETADA
         ).order_by(Programacion.semana_produccion.desc()).limit(ultimas_n_semanas).all()
@@ -1289,47 +1750,56 @@ def obtener_metricas_historicas(ultimas_n_semanas: int = 4) -> List[MetricaCalcu
 def inicializar_datos_default():
     """Inicializar datos por defecto (máquinas y operadores)"""
     
-    # Crear máquinas por defecto
+    # Máquinas por defecto (filas con las columnas del modelo, listas para INSERT masivo)
     maquinas_default = [
-        {"id": "M1", "nombre": "Máquina de Corte", "costo_por_hora": 50.0, "tiempo_setup": 15},
-        {"id": "M2", "nombre": "Máquina de Soldadura", "costo_por_hora": 75.0, "tiempo_setup": 20},
-        {"id": "M3", "nombre": "Máquina de Pintura", "costo_por_hora": 60.0, "tiempo_setup": 10},
+        {"id": "M1", "nombre": "Máquina de Corte", "capacidad": 1, "costo_por_hora": 50.0, "tiempo_setup_default": 15},
+        {"id": "M2", "nombre": "Máquina de Soldadura", "capacidad": 1, "costo_por_hora": 75.0, "tiempo_setup_default": 20},
+        {"id": "M3", "nombre": "Máquina de Pintura", "capacidad": 1, "costo_por_hora": 60.0, "tiempo_setup_default": 10},
     ]
     
-    for maq in maquinas_default:
-        if not obtener_maquina(maq["id"]):
-            crear_maquina(**maq)
-    
-    # Crear operadores por defecto
+    # Operadores por defecto (habilidades como lista: la columna JSON la serializa)
     operadores_default = [
-        {"id": "OP1", "nombre": "Operador 1", "habilidades": ["M1", "M2"]},
-        {"id": "OP2", "nombre": "Operador 2", "habilidades": ["M2", "M3"]},
-        {"id": "OP3", "nombre": "Operador 3", "habilidades": ["M1", "M3"]},
+        {"id": "OP1", "nombre": "Operador 1", "habilidades": ["M1", "M2"], "costo_por_hora": 25.0},
+        {"id": "OP2", "nombre": "Operador 2", "habilidades": ["M2", "M3"], "costo_por_hora": 25.0},
+        {"id": "OP3", "nombre": "Operador 3", "habilidades": ["M1", "M3"], "costo_por_hora": 25.0},
     ]
     
-    for op in operadores_default:
-        if not obtener_operador(op["id"]):
-            crear_operador(**op)
+    # Un SELECT ... IN por tabla para los ids existentes y un INSERT masivo de los que faltan,
+    # todo en una sola transacción
+    insertadas = 0
+    with db_manager.get_session() as session:
+        for modelo, filas in ((Maquina, maquinas_default), (Operador, operadores_default)):
+            existentes = set(session.execute(
+                select(modelo.id).where(modelo.id.in_([fila["id"] for fila in filas]))
+            ).scalars())
+            faltantes = [fila for fila in filas if fila["id"] not in existentes]
+            if faltantes:
+                session.execute(insert(modelo), faltantes)
+                insertadas += len(faltantes)
     
+    if insertadas:
+        _invalidar_cache_recursos()
     logger.info("✅ Datos por defecto inicializados")
 
 
 def obtener_estadisticas_generales() -> Dict:
     """Obtener estadísticas generales del sistema"""
-    with db_manager.get_session() as session:
-        stats = {
-            'total_maquinas': session.query(Maquina).count(),
-            'total_operadores': session.query(Operador).count(),
-            'total_trabajos': session.query(Trabajo).count(),
-            'total_programaciones': session.query(Programacion).count(),
-            'programaciones_completadas': session.query(Programacion).filter(
-                Programacion.estado == EstadoProgramacion.COMPLETADA
-            ).count(),
-            'programaciones_activas': session.query(Programacion).filter(
-                Programacion.estado == EstadoProgramacion.EN_EJECUCION
-            ).count(),
-        }
-        return stats
+    # Una sola consulta: conteos de recursos como subconsultas escalares y los de programaciones
+    # como sumas condicionales en un único recorrido de la tabla
+    def _contar_estado(estado):
+        return func.coalesce(func.sum(case((Programacion.estado == estado, 1), else_=0)), 0)
+    
+    stmt = select(
+        select(func.count()).select_from(Maquina).scalar_subquery().label('total_maquinas'),
+        select(func.count()).select_from(Operador).scalar_subquery().label('total_operadores'),
+        select(func.count()).select_from(Trabajo).scalar_subquery().label('total_trabajos'),
+        func.count(Programacion.id).label('total_programaciones'),
+        _contar_estado(EstadoProgramacion.COMPLETADA).label('programaciones_completadas'),
+        _contar_estado(EstadoProgramacion.EN_EJECUCION).label('programaciones_activas'),
+    ).select_from(Programacion)
+    
+    with db_manager.get_readonly_session() as session:
+        return dict(session.execute(stmt).mappings().one())
 
 
 if __name__ == "__main__":
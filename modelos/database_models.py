@@ -5,10 +5,21 @@ Modelos de Base de Datos - Optimizador de Producción v1.3
 SQLAlchemy ORM Models para gestión de programaciones y tracking
 """
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Enum
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Enum, Index, JSON, text, event, create_engine, inspect
+from sqlalchemy.orm import declarative_base, relationship, reconstructor
 from datetime import datetime
+from typing import Any, Dict
 import enum
+import json
+import logging
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson es opcional: sin él se usa json de la librería estándar
+    _json_loads = json.loads
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
@@ -63,7 +74,7 @@ class Operador(Base):
     
     id = Column(String(10), primary_key=True)  # OP1, OP2, OP3
     nombre = Column(String(100), nullable=False)
-    habilidades = Column(Text)  # JSON string con lista de máquinas: ["M1", "M2"]
+    habilidades = Column(JSON)  # Lista de máquinas: ["M1", "M2"] (serializada por SQLAlchemy)
     disponible = Column(Boolean, default=True)
     costo_por_hora = Column(Float, default=25.0)
     
@@ -115,6 +126,10 @@ class Tarea(Base):
     # Relaciones
     trabajo = relationship("Trabajo", back_populates="tareas")
     
+    __table_args__ = (
+        Index('ix_tarea_trabajo_orden', 'trabajo_id', 'orden'),
+    )
+    
     def __repr__(self):
         return f"<Tarea(id={self.id}, nombre={self.nombre}, duracion={self.duracion})>"
 
@@ -132,10 +147,14 @@ class Programacion(Base):
     # Información temporal
     semana_produccion = Column(Integer, nullable=False)  # 41, 42, etc
     anio = Column(Integer, nullable=False)  # 2025
-    fecha_creacion = Column(DateTime, default=datetime.now)
+    # Default en SQL (hora local, como datetime.now) para inserciones Core/masivas; se mantiene
+    # el default Python porque las BD ya creadas no tienen DEFAULT en la columna
+    fecha_creacion = Column(DateTime, default=datetime.now, server_default=text("(datetime('now', 'localtime'))"))
     
     # Estado
-    estado = Column(Enum(EstadoProgramacion), default=EstadoProgramacion.SIMULACION)
+    # VARCHAR + CHECK (sin tipo ENUM nativo en PostgreSQL); guarda el nombre del miembro, como hasta ahora
+    estado = Column(Enum(EstadoProgramacion, native_enum=False, create_constraint=True, length=16),
+                    default=EstadoProgramacion.SIMULACION, nullable=False)
     
     # Parámetros de optimización usados
     objetivo_usado = Column(String(50))  # 'minimizar_tiempo', 'maximizar_utilizacion', etc
@@ -156,10 +175,36 @@ class Programacion(Base):
     notas = Column(Text)
     configuracion_json = Column(Text)  # JSON con toda la config usada
     
+    # Parámetros de cálculo de KPIs extraídos de la configuración al crear la programación
+    dias_laborales = Column(Integer)
+    minutos_por_dia = Column(Integer)  # minutos efectivos (sin almuerzo)
+    num_maquinas = Column(Integer)
+    
     # Relaciones
     tareas_planificadas = relationship("TareaPlanificada", back_populates="programacion", cascade="all, delete-orphan")
     metricas = relationship("MetricaCalculada", back_populates="programacion", uselist=False, cascade="all, delete-orphan")
     
+    __table_args__ = (
+        # Filtros por semana/año/estado y orden por fecha de creación
+        Index('ix_prog_week', 'semana_produccion', 'anio', 'estado'),
+        Index('ix_prog_fecha', 'fecha_creacion'),
+        # Históricos: filtro por estado y orden por semana (obtener_metricas_historicas) sin ordenación aparte
+        Index('ix_prog_estado_semana', 'estado', 'semana_produccion', 'anio'),
+        # Índice parcial (pequeño) para las programaciones activas; Enum guarda el nombre del miembro
+        Index('ix_prog_activas', 'estado', sqlite_where=text("estado IN ('PLANIFICADA', 'EN_EJECUCION')")),
+    )
+    
+    @reconstructor
+    def _init_on_load(self):
+        """Al cargar desde la BD la configuración aún no está parseada (se parsea bajo demanda)"""
+        self._config_cache = None
+    
+    def config(self) -> dict:
+        """Configuración usada (configuracion_json parseado una sola vez por instancia cargada)"""
+        if getattr(self, '_config_cache', None) is None:
+            self._config_cache = _json_loads(self.configuracion_json) if self.configuracion_json else {}
+        return self._config_cache
+    
     def __repr__(self):
         return f"<Programacion(id={self.id}, semana={self.semana_produccion}, estado={self.estado.value})>"
 
@@ -178,6 +223,7 @@ class TareaPlanificada(Base):
     # Información de la tarea
     nombre = Column(String(200), nullable=False)
     duracion_planificada = Column(Integer, nullable=False)  # minutos
+    duracion_original = Column(Integer)  # minutos, copiada de Tarea.duracion al planificar
     tiempo_setup = Column(Integer, default=0)
     
     # Asignación
@@ -204,6 +250,11 @@ class TareaPlanificada(Base):
     operador = relationship("Operador", back_populates="tareas_planificadas")
     ejecucion_real = relationship("EjecucionReal", back_populates="tarea_planificada", uselist=False, cascade="all, delete-orphan")
     
+    __table_args__ = (
+        # Listados por programación ordenados por inicio: recorrido del índice sin fase de ordenación
+        Index('ix_tp_prog_inicio', 'programacion_id', 'inicio_planificado'),
+    )
+    
     def __repr__(self):
         return f"<TareaPlanificada(id={self.id}, tarea={self.tarea_id}, maquina={self.maquina_id})>"
 
@@ -248,6 +299,11 @@ class EjecucionReal(Base):
     # Relaciones
     tarea_planificada = relationship("TareaPlanificada", back_populates="ejecucion_real")
     
+    __table_args__ = (
+        # Búsqueda de la ejecución de una tarea planificada (NOT EXISTS / JOIN por FK)
+        Index('ix_ejec_tarea_planificada', 'tarea_planificada_id'),
+    )
+    
     def __repr__(self):
         return f"<EjecucionReal(id={self.id}, estado={self.estado.value})>"
 
@@ -344,9 +400,162 @@ class ConfiguracionSistema(Base):
 # UTILIDADES
 # ============================================================================
 
+# PRAGMAs aplicados a cada conexión SQLite nueva: WAL permite lectores concurrentes
+# con un escritor y, con synchronous=NORMAL, evita un fsync por commit
+_SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",      # 64 MB de caché de páginas
+    "PRAGMA mmap_size=268435456",    # 256 MB mapeados en memoria
+)
+
+
+def _aplicar_pragmas_sqlite(dbapi_conn, connection_record):
+    """Configurar una conexión SQLite recién abierta"""
+    cursor = dbapi_conn.cursor()
+    for pragma in _SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def _make_engine(url: str, **kw):
+    """
+    Crear engine con caché de sentencias compiladas ampliada y sin echo; en SQLite registra
+    los PRAGMAs de rendimiento antes de abrir ninguna conexión
+    
+    Para ver el SQL emitido usar logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
+    en lugar de echo=True, que registra cada sentencia de forma síncrona.
+    """
+    kw.setdefault('echo', False)
+    kw.setdefault('query_cache_size', 1200)
+    engine = create_engine(url, **kw)
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _aplicar_pragmas_sqlite)
+    return engine
+
+
+def _a_entero(valor: Any, defecto: int) -> int:
+    """Cantidad entera de un parámetro de configuración: las listas (ej. días laborales) cuentan sus elementos"""
+    if isinstance(valor, (list, tuple)):
+        return len(valor)
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return defecto
+
+
+def _parametros_kpi(config: Any) -> Dict[str, int]:
+    """Días laborales, minutos efectivos por día y número de máquinas según la configuración (dict o JSON)"""
+    dias_laborales = 5  # Default
+    minutos_por_dia = 600  # Default (10 horas)
+    num_maquinas = 3  # Default
+    
+    try:
+        if isinstance(config, str):
+            config = _json_loads(config)
+        
+        # Obtener días laborales
+        horario = config.get('horario_trabajo', {})
+        dias_laborales = horario.get('dias_laborales', 5)
+        
+        # Calcular minutos por día: (hora_fin - hora_inicio - almuerzo) * 60
+        hora_inicio_str = horario.get('inicio', '08:00')
+        hora_fin_str = horario.get('fin', '18:00')
+        almuerzo_inicio_str = horario.get('descanso_almuerzo', {}).get('inicio', '13:00')
+        almuerzo_fin_str = horario.get('descanso_almuerzo', {}).get('fin', '14:00')
+        
+        # Parsear horas
+        try:
+            h_ini, m_ini = map(int, hora_inicio_str.split(':'))
+            h_fin, m_fin = map(int, hora_fin_str.split(':'))
+            h_alm_ini, m_alm_ini = map(int, almuerzo_inicio_str.split(':'))
+            h_alm_fin, m_alm_fin = map(int, almuerzo_fin_str.split(':'))
+            
+            # Calcular minutos totales del día
+            minutos_totales = (h_fin * 60 + m_fin) - (h_ini * 60 + m_ini)
+            
+            # Restar almuerzo
+            minutos_almuerzo = (h_alm_fin * 60 + m_alm_fin) - (h_alm_ini * 60 + m_alm_ini)
+            
+            # Minutos disponibles por día (efectivos, sin almuerzo)
+            minutos_por_dia = minutos_totales - minutos_almuerzo
+        except Exception as e:
+            logger.warning(f"Error calculando minutos por día desde configuración: {e}")
+            # Mantener default
+        
+        # Obtener número de máquinas
+        recursos = config.get('recursos', {})
+        num_maquinas = recursos.get('num_maquinas', 3)
+        
+    except Exception as e:
+        logger.warning(f"Error parseando configuración JSON: {e}")
+        # Usar defaults
+    
+    return {
+        'dias_laborales': _a_entero(dias_laborales, 5),
+        'minutos_por_dia': int(minutos_por_dia),
+        'num_maquinas': _a_entero(num_maquinas, 3),
+    }
+
+
+def crear_esquema(engine):
+    """Crear tablas, índices y columnas que falten (idempotente; sirve para BD nuevas y existentes)"""
+    Base.metadata.create_all(engine)
+    # create_all no agrega índices nuevos a tablas ya existentes
+    for tabla in Base.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            indice.create(engine, checkfirst=True)
+    _agregar_columnas_nuevas(engine)
+
+
+def _agregar_columnas_nuevas(engine):
+    """Agregar a BD ya existentes las columnas incorporadas después (create_all no lo hace)"""
+    inspector = inspect(engine)
+    columnas = {c['name'] for c in inspector.get_columns('tareas_planificadas')}
+    if 'duracion_original' not in columnas:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE tareas_planificadas ADD COLUMN duracion_original INTEGER"))
+            if engine.dialect.name == 'sqlite':
+                # Rellenar con la duración de la tarea base (ID antes del '.', ej: A2.P1 → A2)
+                conn.execute(text(
+                    "UPDATE tareas_planificadas SET duracion_original = ("
+                    "SELECT t.duracion FROM tareas t WHERE t.id = CASE "
+                    "WHEN instr(tareas_planificadas.tarea_id, '.') > 0 "
+                    "THEN substr(tareas_planificadas.tarea_id, 1, instr(tareas_planificadas.tarea_id, '.') - 1) "
+                    "ELSE tareas_planificadas.tarea_id END)"
+                ))
+        logger.info("✅ Columna tareas_planificadas.duracion_original agregada")
+    
+    columnas = {c['name'] for c in inspector.get_columns('programaciones')}
+    if 'minutos_por_dia' not in columnas:
+        with engine.begin() as conn:
+            for columna in ('dias_laborales', 'minutos_por_dia', 'num_maquinas'):
+                conn.execute(text(f"ALTER TABLE programaciones ADD COLUMN {columna} INTEGER"))
+            # Rellenar desde configuracion_json (una sola pasada; executemany del UPDATE)
+            filas = [
+                {'id': prog_id, **_parametros_kpi(config_json or {})}
+                for prog_id, config_json in conn.execute(text(
+                    "SELECT id, configuracion_json FROM programaciones"
+                ))
+            ]
+            if filas:
+                conn.execute(text(
+                    "UPDATE programaciones SET dias_laborales = :dias_laborales, "
+                    "minutos_por_dia = :minutos_por_dia, num_maquinas = :num_maquinas WHERE id = :id"
+                ), filas)
+        logger.info("✅ Columnas de parámetros KPI agregadas a programaciones")
+
+
 def crear_todas_las_tablas(engine):
     """Crear todas las tablas en la base de datos"""
-    Base.metadata.create_all(engine)
+    # Misma creación que DatabaseManager.crear_tablas: también agrega a una BD existente los
+    # índices y columnas incorporados después
+    crear_esquema(engine)
+    if engine.dialect.name == 'sqlite':
+        # Actualizar estadísticas del planificador con el esquema ya creado
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA optimize")
     print("✅ Todas las tablas creadas exitosamente")
 
 
@@ -358,10 +567,8 @@ def eliminar_todas_las_tablas(engine):
 
 if __name__ == "__main__":
     # Ejemplo de uso
-    from sqlalchemy import create_engine
-    
     # Crear engine SQLite
-    engine = create_engine('sqlite:///produccion.db', echo=True)
+    engine = _make_engine('sqlite:///produccion.db')
     
     # Crear todas las tablas
     crear_todas_las_tablas(engine)
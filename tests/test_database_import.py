@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prueba de humo: el módulo de persistencia se importa y crea el esquema sobre SQLite
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class TestImportDatabase(unittest.TestCase):
+    """Importar modelos.database y usar un DatabaseManager sobre una BD SQLite temporal"""
+
+    def test_importar_y_crear_tablas(self):
+        from modelos import database
+        from modelos.database_models import _SQLITE_PRAGMAS
+
+        self.assertIsNotNone(database.db_manager.engine)
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = database.DatabaseManager(f"sqlite:///{os.path.join(tmp, 'prueba.db')}")
+            manager.crear_tablas()
+            with manager.engine.connect() as conn:
+                modo = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+            manager.engine.dispose()
+        self.assertEqual(modo.lower(), 'wal')
+        self.assertIn("PRAGMA journal_mode=WAL", _SQLITE_PRAGMAS)
+
+    def test_modelos_no_importa_database(self):
+        # Intérprete aparte: en este proceso modelos.database puede estar ya importado
+        raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with tempfile.TemporaryDirectory() as tmp:
+            codigo = (
+                "import sys\n"
+                "from modelos.database_models import _make_engine, crear_todas_las_tablas\n"
+                f"engine = _make_engine({'sqlite:///' + os.path.join(tmp, 'prueba.db')!r})\n"
+                "crear_todas_las_tablas(engine)\n"
+                "engine.dispose()\n"
+                "assert 'modelos.database' not in sys.modules\n"
+            )
+            resultado = subprocess.run([sys.executable, "-c", codigo], cwd=raiz,
+                                       capture_output=True, text=True)
+        self.assertEqual(resultado.returncode, 0, resultado.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
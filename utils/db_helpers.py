@@ -13,7 +13,7 @@ import json
 from modelos.database import (
     db_manager,
     crear_trabajo, crear_tarea,
-    crear_programacion, crear_tarea_planificada,
+    crear_programacion, crear_tarea_planificada, crear_tareas_planificadas_bulk,
     aprobar_programacion, cambiar_estado_programacion,
     eliminar_programacion,
     obtener_programacion, obtener_programaciones,
@@ -37,6 +37,26 @@ def _calcular_dia_desde_minutos(minutos_acumulativos: int, minutos_por_dia_labor
 
 # Funciones para guardar programaciones
 
+def _guardar_tareas_planificadas(programacion_id: str, tareas_info: List[Dict]) -> int:
+    """
+    Insertar las tareas planificadas de una vez; si el INSERT masivo falla (alguna fila
+    inválida), se reintenta tarea por tarea omitiendo solo las que fallan
+    """
+    try:
+        return crear_tareas_planificadas_bulk(programacion_id, tareas_info)
+    except Exception as e:
+        print(f"ERROR en inserción masiva de tareas planificadas, se guardan una a una: {e}")
+    
+    guardadas = 0
+    for tarea_info in tareas_info:
+        try:
+            crear_tarea_planificada(programacion_id, tarea_info)
+            guardadas += 1
+        except Exception as e:
+            print(f"ERROR guardando tarea planificada {tarea_info.get('tarea_id')}: {e}")
+    return guardadas
+
+
 def dividir_tarea_en_partes(tarea_asignacion: Dict, minutos_por_dia_laboral: int = 600) -> List[Dict]:
     """Divide una tarea en partes si excede el día laboral"""
     inicio = tarea_asignacion.get('inicio', 0)
@@ -134,7 +154,8 @@ def guardar_programacion_desde_resultado(resultado: Dict, trabajos: Dict,
         print(f"DEBUG: Guardando tareas planificadas PROCESADAS para programación {prog_id}")
         print(f"DEBUG: Usando programacion_detallada con {len(programacion_detallada)} tareas")
         
-        # Guardar datos procesados directamente
+        # Guardar datos procesados directamente (se insertan todas juntas al final)
+        tareas_info = []
         for tarea_proc in programacion_detallada:
             # Verificar si tiene los campos necesarios
             if 'inicio_planificado' in tarea_proc and 'fin_planificado' in tarea_proc:
@@ -194,10 +215,12 @@ def guardar_programacion_desde_resultado(resultado: Dict, trabajos: Dict,
                         'dia_nombre': tarea_proc.get('dia', '')
                     }
                     
-                    crear_tarea_planificada(prog_id, tarea_info)
+                    tareas_info.append(tarea_info)
                 except Exception as e:
                     print(f"ERROR procesando tarea procesada: {e}")
                     continue
+        
+        _guardar_tareas_planificadas(prog_id, tareas_info)
     elif resultado.get('solucion') and resultado['solucion'].get('programacion'):
         print(f"DEBUG: Guardando tareas planificadas RAW para programación {prog_id}")
         print(f"DEBUG: Tipo de trabajos: {type(trabajos)}")
@@ -287,6 +310,7 @@ def guardar_programacion_desde_resultado(resultado: Dict, trabajos: Dict,
                     'trabajo': trabajo_id
                 }])], ignore_index=True)
         
+        tareas_info = []
         for asig in resultado['solucion']['programacion']:
             tarea_id = asig.get('tarea_id', '')
             tarea_indice = asig.get('tarea_indice', 0)
@@ -320,7 +344,9 @@ def guardar_programacion_desde_resultado(resultado: Dict, trabajos: Dict,
                     'parte_numero': parte['parte_numero']
             }
             
-            crear_tarea_planificada(prog_id, tarea_info)
+            tareas_info.append(tarea_info)
+        
+        crear_tareas_planificadas_bulk(prog_id, tareas_info)
     
     return prog_id
 
@@ -387,7 +413,7 @@ def cargar_operadores_desde_bd() -> List[Dict]:
         {
             'id': op['id'],
             'nombre': op['nombre'],
-            'habilidades': json.loads(op['habilidades']) if op['habilidades'] else [],
+            'habilidades': op['habilidades'],
             'costo_por_hora': op['costo_por_hora'],
             'disponible': op['disponible']
         }
@@ -530,6 +556,7 @@ def guardar_simulacion_con_tareas_divididas(resultado: Dict, trabajos: Dict,
     # Si se proporcionan datos procesados, usarlos
     if programacion_detallada:
         print(f"DEBUG: Guardando tareas PROCESADAS en guardar_simulacion")
+        tareas_info = []
         for tarea_proc in programacion_detallada:
             if 'inicio_planificado' in tarea_proc and 'fin_planificado' in tarea_proc:
                 inicio_hora = tarea_proc['inicio_planificado']
@@ -567,7 +594,7 @@ def guardar_simulacion_con_tareas_divididas(resultado: Dict, trabajos: Dict,
                     tarea_id = tarea_proc.get('tarea_id', 'N/A')
                     trabajo_id = tarea_proc.get('trabajo_id', 'N/A')
                     
-                    crear_tarea_planificada(programacion_id=programacion_id, tarea_info={
+                    tareas_info.append({
                         'tarea_id': tarea_id,
                         'trabajo_id': trabajo_id,
                         'nombre': tarea_proc.get('Tarea', 'N/A'),
@@ -587,9 +614,11 @@ def guardar_simulacion_con_tareas_divididas(resultado: Dict, trabajos: Dict,
                 except Exception as e:
                     print(f"ERROR procesando tarea procesada en simulacion: {e}")
                     continue
+        _guardar_tareas_planificadas(programacion_id, tareas_info)
         return programacion_id
     
     # Procesar cada asignación del resultado (lógica original para datos RAW)
+    tareas_info = []
     for asig in resultado['solucion']['programacion']:
         tarea_id = asig.get('tarea_id', '')
         tarea_indice = asig.get('tarea_indice', 0)
@@ -621,23 +650,21 @@ def guardar_simulacion_con_tareas_divididas(resultado: Dict, trabajos: Dict,
         for i, parte in enumerate(partes_tarea):
             parte_id = f"{tarea_id}.P{i+1}" if len(partes_tarea) > 1 else tarea_id
             
-            crear_tarea_planificada(
-                programacion_id=programacion_id,
-                tarea_info={
-                    'tarea_id': parte_id,
-                    'trabajo_id': trabajo_id,
-                    'nombre': f"{tarea_original['nombre']} (P{i+1})" if len(partes_tarea) > 1 else tarea_original['nombre'],
-                    'maquina_id': tarea_original['maquina'],
-                    'operador_id': asig.get('operador', 'Sin asignar'),
-                    'inicio_planificado': parte['inicio'],
-                    'fin_planificado': parte['fin'],
-                    'duracion_planificada': parte['duracion'],
-                    'tiempo_setup': tarea_original.get('tiempo_setup', 0),
-                    'es_dividida': len(partes_tarea) > 1,
-                    'parte_numero': i + 1 if len(partes_tarea) > 1 else None
-                }
-            )
+            tareas_info.append({
+                'tarea_id': parte_id,
+                'trabajo_id': trabajo_id,
+                'nombre': f"{tarea_original['nombre']} (P{i+1})" if len(partes_tarea) > 1 else tarea_original['nombre'],
+                'maquina_id': tarea_original['maquina'],
+                'operador_id': asig.get('operador', 'Sin asignar'),
+                'inicio_planificado': parte['inicio'],
+                'fin_planificado': parte['fin'],
+                'duracion_planificada': parte['duracion'],
+                'tiempo_setup': tarea_original.get('tiempo_setup', 0),
+                'es_dividida': len(partes_tarea) > 1,
+                'parte_numero': i + 1 if len(partes_tarea) > 1 else None
+            })
     
+    crear_tareas_planificadas_bulk(programacion_id, tareas_info)
     return programacion_id
 
 
@@ -701,7 +728,6 @@ def inicializar_bd_si_necesario():
         config_path = 'datos/configuracion.json'
         if os.path.exists(config_path):
             try:
-                import json
                 with open(config_path, 'r', encoding='utf-8') as f:
                     config = json.load(f)
                 
@@ -8,9 +8,20 @@ Calcula métricas de eficiencia, utilización, cumplimiento, etc.
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 import logging
+import sys
+
+import pandas as pd
 
 logger = logging.getLogger(__name__)
 
+# Python 3.11+ acepta el sufijo 'Z' en fromisoformat; antes hay que reemplazarlo
+if sys.version_info >= (3, 11):
+    _parse_iso = datetime.fromisoformat
+else:
+    def _parse_iso(valor: str) -> datetime:
+        """Parsear fecha ISO aceptando sufijo 'Z'"""
+        return datetime.fromisoformat(valor.replace('Z', '+00:00'))
+
 
 class KPIExporter:
     """Calculadora de KPIs industriales para producción"""
@@ -217,25 +228,8 @@ class KPIExporter:
             # Parsear hora
             h, m = map(int, inicio_hora.split(':'))
             
-            # Calcular lunes de la semana ISO
-            # ISO week: lunes de la semana es el día que contiene el 4 de enero de ese año
-            # Calcular el primer día del año
-            primer_dia = datetime(anio, 1, 1)
-            
-            # Día de la semana del 1 de enero (0=Lunes, 6=Domingo)
-            dia_1_enero = primer_dia.weekday()
-            
-            # Calcular el lunes de la semana 1
-            # Si el 1 de enero es lunes (0), el lunes de semana 1 es el 1 de enero
-            # Si el 1 de enero es martes (1), el lunes de semana 1 es el 31 de diciembre del año anterior
-            # ISO week: semana 1 contiene el 4 de enero
-            # Calcular lunes de la semana que contiene el 4 de enero
-            fecha_semana_1 = datetime(anio, 1, 4)
-            lunes_semana_1 = fecha_semana_1 - timedelta(days=fecha_semana_1.weekday())
-            
             # Calcular lunes de la semana de producción
-            semanas_desde_semana_1 = semana_produccion - 1
-            lunes_semana_produccion = lunes_semana_1 + timedelta(weeks=semanas_desde_semana_1)
+            lunes_semana_produccion = self._lunes_semana_iso(anio, semana_produccion)
             
             # Agregar días hasta el día de la semana deseado
             fecha_completa = lunes_semana_produccion + timedelta(days=dia_semana)
@@ -247,6 +241,43 @@ class KPIExporter:
             logger.warning(f"Error construyendo datetime planificado: {e}")
             return None
     
+    def _lunes_semana_iso(self, anio: int, semana_produccion: int) -> datetime:
+        """Calcular el lunes de la semana ISO de producción"""
+        # ISO week: semana 1 contiene el 4 de enero
+        # Calcular lunes de la semana que contiene el 4 de enero
+        fecha_semana_1 = datetime(anio, 1, 4)
+        lunes_semana_1 = fecha_semana_1 - timedelta(days=fecha_semana_1.weekday())
+        
+        # Calcular lunes de la semana de producción
+        return lunes_semana_1 + timedelta(weeks=semana_produccion - 1)
+    
+    def build_planned_datetimes_vec(self, horas: pd.Series, dias_semana: pd.Series,
+                                    semana_produccion: int, anio: int) -> pd.Series:
+        """
+        Versión vectorizada de _construir_datetime_planificado
+        
+        El lunes de la semana se calcula una sola vez; día y hora se suman por columnas.
+        
+        Args:
+            horas: Serie de horas en formato HH:MM
+            dias_semana: Serie de días de semana (0=Lunes, ..., 6=Domingo)
+            semana_produccion: Número de semana ISO (1-53)
+            anio: Año de producción
+        
+        Returns:
+            Serie de datetimes planificados (NaT donde falte la hora o el día)
+        """
+        try:
+            lunes = pd.Timestamp(self._lunes_semana_iso(int(anio), int(semana_produccion)))
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Error construyendo datetimes planificados: {e}")
+            return pd.Series(pd.NaT, index=horas.index, dtype='datetime64[ns]')
+        
+        hora = pd.to_datetime(horas, format='%H:%M', errors='coerce')
+        minutos = hora.dt.hour * 60 + hora.dt.minute
+        dias = pd.to_numeric(dias_semana, errors='coerce')
+        return lunes + pd.to_timedelta(dias, unit='D') + pd.to_timedelta(minutos, unit='m')
+    
     def calcular_cumplimiento_plazos(self, ejecuciones: List[Dict], tolerancia_minutos: int = 5,
                                      semana_produccion: int = None, anio: int = None) -> Dict:
         """
@@ -323,12 +354,12 @@ class KPIExporter:
                         elif inicio_real and fin_real:
                             # Convertir a datetime si son strings
                             if isinstance(inicio_real, str):
-                                inicio_real_dt = datetime.fromisoformat(inicio_real.replace('Z', '+00:00'))
+                                inicio_real_dt = _parse_iso(inicio_real)
                             else:
                                 inicio_real_dt = inicio_real
                             
                             if isinstance(fin_real, str):
-                                fin_real_dt = datetime.fromisoformat(fin_real.replace('Z', '+00:00'))
+                                fin_real_dt = _parse_iso(fin_real)
                             else:
                                 fin_real_dt = fin_real
                             
@@ -416,7 +447,7 @@ class KPIExporter:
             if inicio:
                 if isinstance(inicio, str):
                     try:
-                        inicio = datetime.fromisoformat(inicio.replace('Z', '+00:00'))
+                        inicio = _parse_iso(inicio)
                     except:
                         inicio = None
                 if isinstance(inicio, datetime):
@@ -425,7 +456,7 @@ class KPIExporter:
             if fin:
                 if isinstance(fin, str):
                     try:
-                        fin = datetime.fromisoformat(fin.replace('Z', '+00:00'))
+                        fin = _parse_iso(fin)
                     except:
                         fin = None
                 if isinstance(fin, datetime):
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Kernels numéricos para KPIs
+Cálculo de duraciones y desviaciones sobre arrays NumPy (compilado con Numba si está instalado)
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # Numba es opcional: sin él se usa la versión vectorizada con NumPy
+    njit = None
+
+MINUTOS_DIA = 24 * 60
+
+
+def _duraciones_desviacion_loop(min_ini, min_fin, dur_plan_bd, dur_real, paradas, desv_bd):
+    n = min_ini.size
+    dur_plan = np.empty(n, np.float64)
+    desv = np.empty(n, np.float64)
+    for i in range(n):
+        dp = min_fin[i] - min_ini[i]
+        if np.isnan(dp):
+            dp = dur_plan_bd[i]
+        elif dp < 0:
+            dp += MINUTOS_DIA
+        dur_plan[i] = dp
+
+        if dur_real[i] > 0:
+            dr = dur_real[i] - paradas[i]
+            if dr < 0:
+                dr = 0.0
+            desv[i] = dr - dp
+        else:
+            desv[i] = desv_bd[i]
+    return dur_plan, desv
+
+
+def _duraciones_desviacion_np(min_ini, min_fin, dur_plan_bd, dur_real, paradas, desv_bd):
+    dur_plan = min_fin - min_ini
+    dur_plan = np.where(dur_plan < 0, dur_plan + MINUTOS_DIA, dur_plan)
+    dur_plan = np.where(np.isnan(dur_plan), dur_plan_bd, dur_plan)
+    desv = np.maximum(dur_real - paradas, 0.0) - dur_plan
+    desv = np.where(dur_real > 0, desv, desv_bd)
+    return dur_plan, desv
+
+
+def _weighted_util_loop(util, tp):
+    suma = 0.0
+    peso = 0.0
+    for i in range(util.size):
+        suma += util[i] * tp[i]
+        peso += tp[i]
+    return suma / peso
+
+
+def _weighted_util_np(util, tp):
+    return float((util * tp).sum() / tp.sum())
+
+
+if njit is not None:
+    # Sin fastmath completo en este kernel: la bandera 'nnan' eliminaría el np.isnan de las horas faltantes
+    _duraciones_desviacion = njit(cache=True, boundscheck=False,
+                                  fastmath={'reassoc', 'contract', 'arcp'})(_duraciones_desviacion_loop)
+    _weighted_util = njit(cache=True, boundscheck=False, fastmath=True)(_weighted_util_loop)
+else:
+    _duraciones_desviacion = _duraciones_desviacion_np
+    _weighted_util = _weighted_util_np
+
+
+def calentar_kernels():
+    """Compilar (o cargar de la caché en disco) los kernels con entradas mínimas.
+
+    No se ejecuta al importar: la llaman la app al arrancar y cada proceso del pool de métricas
+    """
+    if njit is None:
+        return
+    uno = np.ones(1, np.float64)
+    _duraciones_desviacion(uno, uno, uno, uno, uno, uno)
+    _weighted_util(uno, uno)
+
+
+def calcular_duraciones_desviacion(min_ini, min_fin, dur_plan_bd, dur_real, paradas, desv_bd):
+    """
+    Calcular duración planificada y desviación de duración por tarea
+
+    Args:
+        min_ini: Minutos desde medianoche del inicio planificado (NaN si falta)
+        min_fin: Minutos desde medianoche del fin planificado (NaN si falta)
+        dur_plan_bd: Duración planificada de BD, usada si faltan las horas
+        dur_real: Duración real en minutos
+        paradas: Tiempo de paradas en minutos
+        desv_bd: Desviación de BD, usada si no hay duración real
+
+    Returns:
+        Tupla (dur_plan, desv) de arrays float64
+    """
+    arrays = [np.ascontiguousarray(a, dtype=np.float64)
+              for a in (min_ini, min_fin, dur_plan_bd, dur_real, paradas, desv_bd)]
+    return _duraciones_desviacion(*arrays)
+
+
+def utilizacion_ponderada(utilizaciones, tiempos_productivos) -> float:
+    """
+    Promedio de utilización ponderado por tiempo productivo: sum(u_i * tp_i) / sum(tp_i)
+
+    Args:
+        utilizaciones: Utilización (%) por máquina
+        tiempos_productivos: Tiempo productivo en minutos por máquina (suma > 0)
+
+    Returns:
+        Utilización ponderada
+    """
+    util = np.ascontiguousarray(utilizaciones, dtype=np.float64)
+    tp = np.ascontiguousarray(tiempos_productivos, dtype=np.float64)
+    return float(_weighted_util(util, tp))